@@ -0,0 +1,260 @@
+"""Admission control: per-endpoint concurrency limits, bounded queues, request deadlines and load shedding.
+
+`AdmissionMiddleware` runs before FastAPI parses the request, so an overloaded endpoint
+rejects new work (429 when its queue is full, 503 when a queued request waited too long,
+both with `Retry-After`) without ever buffering the upload. Admitted requests carry a
+deadline in a context variable; the hot paths wrap their waits in `within_deadline` so
+preprocessing, batched inference, retrieval and LLM calls all give up when it expires.
+"""
+import asyncio
+import contextvars
+import json
+import math
+import time
+from collections import deque
+
+from metrics import ADMISSIONS
+
+_deadline = contextvars.ContextVar("request_deadline", default=None)  # time.monotonic() value or None
+
+
+class DeadlineExceeded(TimeoutError):
+    """The request ran out of time; surfaced as 504."""
+
+
+def remaining():
+    """Seconds left before the current request's deadline, or None when it has none."""
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def set_deadline(seconds):
+    """Give the current context (and tasks it spawns) a deadline `seconds` from now; returns a reset token."""
+    return _deadline.set(time.monotonic() + seconds if seconds else None)
+
+
+def _discard(awaitable):
+    if asyncio.iscoroutine(awaitable):
+        awaitable.close()
+    elif asyncio.isfuture(awaitable):
+        awaitable.cancel()
+
+
+async def within_deadline(awaitable, timeout=None):
+    """Await `awaitable` for at most `timeout` seconds and the request's remaining time.
+
+    Running out of the request's time raises `DeadlineExceeded`; hitting `timeout` first raises
+    a plain `asyncio.TimeoutError`, as `asyncio.wait_for` would.
+    """
+    left = remaining()
+    if left is None or (timeout is not None and timeout < left):
+        return await (awaitable if timeout is None else asyncio.wait_for(awaitable, timeout))
+    if left <= 0:
+        _discard(awaitable)
+        raise DeadlineExceeded("Request deadline exceeded")
+    try:
+        return await asyncio.wait_for(awaitable, left)
+    except asyncio.TimeoutError:
+        raise DeadlineExceeded("Request deadline exceeded") from None
+
+
+class Rejected(Exception):
+    def __init__(self, status, detail, retry_after):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+class EndpointLimiter:
+    """At most `max_concurrent` requests in progress and `max_queue` waiting, first come first served.
+
+    `deadline` (seconds, 0 for none) is the default time budget per request; clients can
+    only shorten it with `X-Request-Timeout`. Time spent queued counts against it.
+    """
+
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout=5.0, deadline=0.0,
+                 max_body_bytes=0, cancel_on_disconnect=False):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent must be >= 1")
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.deadline = deadline
+        self.max_body_bytes = max_body_bytes
+        self.cancel_on_disconnect = cancel_on_disconnect
+        self.active = 0
+        self._waiters = deque()
+        self._service_seconds = 1.0  # EWMA of time a request holds a slot, for Retry-After
+
+    @property
+    def queued(self):
+        return len(self._waiters)
+
+    def retry_after(self):
+        """Rough seconds until a slot frees up for a request arriving now."""
+        waves = (self.queued + 1) / self.max_concurrent
+        return max(1, math.ceil(self._service_seconds * waves))
+
+    async def acquire(self):
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return
+        if self.queued >= self.max_queue:
+            raise Rejected(429, f"Too many {self.name} requests in progress, try again later", self.retry_after())
+
+        ADMISSIONS.inc(endpoint=self.name, outcome="queued")
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        left = remaining()
+        timeout = self.queue_timeout if left is None else max(0.0, min(self.queue_timeout, left))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():  # Handed a slot just as we gave up: pass it on
+                self.release()
+            else:
+                waiter.cancel()
+            raise Rejected(503, f"Server busy, {self.name} queue wait exceeded", self.retry_after()) from None
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def release(self, held_seconds=None):
+        if held_seconds is not None:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * held_seconds
+        # Hand the slot straight to the next live waiter so newcomers can't jump the queue
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def status(self):
+        return {"active": self.active, "queued": self.queued, "max_concurrent": self.max_concurrent,
+                "max_queue": self.max_queue, "deadline_seconds": self.deadline or None}
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers") or []:
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+async def _send_error(send, status, detail, retry_after=None):
+    headers = [(b"content-type", b"application/json")]
+    if retry_after is not None:
+        headers.append((b"retry-after", str(retry_after).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": json.dumps({"detail": detail}).encode()})
+
+
+class AdmissionMiddleware:
+    """ASGI middleware applying an `EndpointLimiter` to each of the given exact paths.
+
+    Register it inside CORSMiddleware so browsers can read the rejections.
+    """
+
+    def __init__(self, app, limiters):
+        self.app = app
+        self.limiters = limiters
+
+    async def __call__(self, scope, receive, send):
+        limiter = self.limiters.get(scope.get("path")) if scope["type"] == "http" else None
+        if limiter is None or scope.get("method") == "OPTIONS":
+            return await self.app(scope, receive, send)
+
+        length = _header(scope, b"content-length")
+        if limiter.max_body_bytes and length and length.isdigit() and int(length) > limiter.max_body_bytes:
+            ADMISSIONS.inc(endpoint=limiter.name, outcome="rejected")
+            return await _send_error(send, 413, f"Request body too large (limit {limiter.max_body_bytes} bytes)")
+
+        budget = limiter.deadline
+        requested = _header(scope, b"x-request-timeout")
+        try:
+            if requested and float(requested) > 0:
+                budget = min(budget, float(requested)) if budget else float(requested)
+        except ValueError:
+            pass
+        token = set_deadline(budget)
+        try:
+            try:
+                await limiter.acquire()
+            except Rejected as e:
+                ADMISSIONS.inc(endpoint=limiter.name, outcome="rejected")
+                return await _send_error(send, e.status, e.detail, e.retry_after)
+            ADMISSIONS.inc(endpoint=limiter.name, outcome="admitted")
+            start = time.monotonic()
+            try:
+                await self._run(limiter, scope, receive, send)
+            finally:
+                limiter.release(time.monotonic() - start)
+        finally:
+            _deadline.reset(token)
+
+    async def _run(self, limiter, scope, receive, send):
+        body_done = False
+        disconnected = asyncio.Event()
+        response = {"started": False, "complete": False}
+        watcher = None
+        app_task = None
+
+        async def watch():
+            # Once the body is read the only thing left to receive is the disconnect
+            while True:
+                message = await receive()
+                if message["type"] == "http.disconnect":
+                    disconnected.set()
+                    if limiter.cancel_on_disconnect and not response["complete"] and app_task is not None:
+                        ADMISSIONS.inc(endpoint=limiter.name, outcome="cancelled")
+                        app_task.cancel()
+                    return
+
+        async def receive_wrapper():
+            nonlocal body_done, watcher
+            if body_done:
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                disconnected.set()
+            elif not message.get("more_body", False):
+                body_done = True
+                watcher = asyncio.ensure_future(watch())
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                response["started"] = True
+            elif message["type"] == "http.response.body" and not message.get("more_body", False):
+                response["complete"] = True
+            await send(message)
+
+        app_task = asyncio.ensure_future(self.app(scope, receive_wrapper, send_wrapper))
+        try:
+            await asyncio.shield(app_task)
+        except asyncio.CancelledError:
+            if not app_task.done():  # We were cancelled ourselves (e.g. shutdown): take the app with us
+                app_task.cancel()
+                raise
+            if not disconnected.is_set():
+                raise
+            # Client went away and the work was dropped; nobody is left to answer
+        except DeadlineExceeded:
+            ADMISSIONS.inc(endpoint=limiter.name, outcome="deadline")
+            if not response["started"]:
+                await _send_error(send, 504, "Request deadline exceeded", limiter.retry_after())
+        finally:
+            if watcher is not None:
+                watcher.cancel()
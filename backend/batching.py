@@ -0,0 +1,161 @@
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BatchScheduler:
+    """Dynamic micro-batching in front of a blocking batch function.
+
+    Concurrent callers `await submit(item)`; a background worker collects queued items
+    until `max_batch_size` is reached or `max_wait_ms` has passed since the first one
+    arrived, then calls `batch_fn(items)` once in a worker thread. `batch_fn` must
+    return one result per item, in the same order. `submit_many(items)` keeps a group of
+    items together in one batch (a group larger than `max_batch_size` runs on its own).
+    """
+
+    def __init__(self, batch_fn, max_batch_size: int = 32, max_wait_ms: float = 5.0, name: str = "batcher"):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._pending = deque()  # (items, future, single) per caller
+        self._queued_items = 0
+        self._wakeup = None
+        self._worker = None
+        self._closing = False
+        self._draining = False
+        # A single thread keeps forward passes ordered and off the event loop
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=name)
+
+    @property
+    def running(self):
+        return self._worker is not None and not self._worker.done()
+
+    @property
+    def queue_depth(self):
+        return self._queued_items
+
+    def start(self):
+        """Start the worker task on the running event loop."""
+        if self.running:
+            return
+        self._closing = self._draining = False
+        self._wakeup = asyncio.Event()
+        self._worker = asyncio.get_running_loop().create_task(self._run(), name=self.name)
+
+    async def stop(self, timeout=None, drain=False):
+        """Let the batch already in `batch_fn` finish, then stop the worker and fail anything still queued.
+
+        With `drain=True` the queued items are run as well (new submissions are refused either way).
+        After `timeout` seconds the worker is cancelled instead and the in-flight batch's callers
+        get an error too (its forward pass still runs to completion in the worker thread).
+        """
+        if self._worker is not None:
+            self._closing = True
+            self._draining = drain
+            self._wakeup.set()
+            try:
+                await asyncio.wait_for(asyncio.shield(self._worker), timeout)
+            except asyncio.TimeoutError:
+                self._worker.cancel()
+                try:
+                    await self._worker
+                except asyncio.CancelledError:
+                    pass
+            self._worker = None
+        while self._pending:
+            _, fut, _ = self._pending.popleft()
+            if not fut.done():
+                fut.set_exception(RuntimeError(f"{self.name} stopped"))
+        self._queued_items = 0
+        self._executor.shutdown(wait=False)
+
+    async def _enqueue(self, items, single):
+        if not self.running or self._closing:
+            raise RuntimeError(f"{self.name} is not running")
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((items, fut, single))
+        self._queued_items += len(items)
+        self._wakeup.set()
+        return await fut
+
+    async def submit(self, item):
+        """Queue one item and wait for its result from the next batch."""
+        return await self._enqueue([item], True)
+
+    async def submit_many(self, items):
+        """Queue `items` to run in the same batch and wait for the list of their results."""
+        if not items:
+            return []
+        return await self._enqueue(list(items), False)
+
+    def _take_batch(self):
+        batch, size = [], 0
+        while self._pending:
+            items, fut, single = self._pending[0]
+            if batch and size + len(items) > self.max_batch_size:
+                break
+            self._pending.popleft()
+            self._queued_items -= len(items)
+            # Callers that gave up (timeout / disconnect) don't get a slot in the forward pass
+            if not fut.cancelled():
+                batch.append((items, fut, single))
+                size += len(items)
+        if self._pending:
+            self._wakeup.set()
+        else:
+            self._wakeup.clear()
+        return batch
+
+    def _fail(self, batch, error):
+        for _, fut, _ in batch:
+            if not fut.done():
+                fut.set_exception(error)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._closing or (self._draining and self._pending):
+            await self._wakeup.wait()
+            if self._closing and not (self._draining and self._pending):
+                return
+            if not self._pending:
+                self._wakeup.clear()
+                continue
+
+            # Give concurrent requests a short window to join the batch
+            deadline = loop.time() + self.max_wait
+            while self._queued_items < self.max_batch_size and not self._closing:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+            if self._closing and not self._draining:
+                return  # stop() fails whatever is still queued
+
+            batch = self._take_batch()
+            if not batch:
+                continue
+
+            items = [item for group, _, _ in batch for item in group]
+            try:
+                results = await loop.run_in_executor(self._executor, self.batch_fn, items)
+            except asyncio.CancelledError:
+                # Popped from the queue already: nobody else would ever resolve these
+                self._fail(batch, RuntimeError(f"{self.name} stopped"))
+                raise
+            except Exception as e:
+                self._fail(batch, e)
+                continue
+
+            start = 0
+            for group, fut, single in batch:
+                group_results = results[start:start + len(group)]
+                start += len(group)
+                if not fut.done():
+                    fut.set_result(group_results[0] if single else list(group_results))
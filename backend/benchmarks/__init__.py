@@ -0,0 +1,5 @@
+"""Offline benchmarks for the identify and remedy hot paths.
+
+Run from the backend directory, either one suite at a time (`python -m benchmarks.preprocess`)
+or all of them to a JSON file with `python -m benchmarks run --output results.json`.
+"""
@@ -0,0 +1,160 @@
+"""Run the benchmark suites to JSON, or compare two result files for regressions.
+
+    python -m benchmarks run --output results/$(git rev-parse --short HEAD).json
+    python -m benchmarks run --suites preprocess,inference --quick
+    python -m benchmarks compare results/base.json results/head.json --threshold 0.10
+
+`run` skips (and records why) any suite whose model, knowledge base or dependencies
+are missing. By default the load suites start the stub LLM and a local server.
+
+`compare` checks every latency (`*_ms` except min/max) and throughput (`*_per_sec`,
+`*_rps`) figure both files share, and exits with status 1 when one is worse than
+the baseline by more than the threshold.
+"""
+import argparse
+import json
+import sys
+
+from benchmarks import inference, load, preprocess, retrieval, segmentation
+from benchmarks import vector_index as vector_index_bench
+from benchmarks.common import environment
+
+SUITES = ("preprocess", "segmentation", "inference", "retrieval", "vector_index", "identify", "remedy")
+
+
+def run_suites(suites, quick=False, url=None, stub_delay_ms=0.0):
+    repeat = 3 if quick else 10
+    requests = 20 if quick else 200
+    concurrency = (1, 8) if quick else (1, 8, 32)
+    runners = {
+        "preprocess": lambda: preprocess.run(2016, 1512, repeat) if quick else preprocess.run(repeat=repeat),
+        "segmentation": lambda: segmentation.run(models=("u2net", "u2netp") if quick else segmentation.DEFAULT_MODELS,
+                                                 repeat=1 if quick else 3),
+        "inference": lambda: inference.run(batch_sizes=(1, 8, 32) if quick else inference.DEFAULT_BATCH_SIZES, repeat=repeat),
+        "retrieval": lambda: retrieval.run(repeat=repeat * 2),
+        "vector_index": lambda: vector_index_bench.run(repeat=repeat * 5),
+    }
+
+    results = {"environment": environment(), "suites": {}}
+    for name in suites:
+        if name in ("identify", "remedy"):
+            continue
+        print(f"🔄 Running {name} benchmark...", file=sys.stderr)
+        try:
+            results["suites"][name] = runners[name]()
+        except Exception as e:
+            print(f"⚠️ Skipping {name}: {e}", file=sys.stderr)
+            results["suites"][name] = {"skipped": str(e)}
+
+    load_suites = [name for name in suites if name in ("identify", "remedy")]
+    if load_suites:
+        def run_load(target):
+            for name in load_suites:
+                print(f"🔄 Running {name} load test...", file=sys.stderr)
+                try:
+                    results["suites"][name] = load.run(name, target, concurrency, requests)
+                except Exception as e:
+                    print(f"⚠️ Skipping {name}: {e}", file=sys.stderr)
+                    results["suites"][name] = {"skipped": str(e)}
+        try:
+            if url:
+                run_load(url)
+            else:
+                with load.local_server(stub_delay_ms) as local_url:
+                    run_load(local_url)
+        except Exception as e:
+            print(f"⚠️ Skipping load tests: {e}", file=sys.stderr)
+            for name in load_suites:
+                results["suites"].setdefault(name, {"skipped": str(e)})
+    return results
+
+
+def _flatten(tree, prefix=""):
+    flat = {}
+    for key, value in tree.items():
+        path = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def _direction(path):
+    """-1 when lower is better, +1 when higher is better, None when the figure isn't compared."""
+    leaf = path.rsplit(".", 1)[-1]
+    if leaf.endswith("_ms") and leaf not in ("min_ms", "max_ms"):
+        return -1
+    if leaf.endswith(("_per_sec", "_rps")):
+        return 1
+    return None
+
+
+def compare(baseline, current, threshold=0.10):
+    """Rows of (metric, baseline, current, relative change, regressed) for shared comparable figures."""
+    base = _flatten(baseline.get("suites", baseline))
+    head = _flatten(current.get("suites", current))
+    rows = []
+    for path in sorted(base.keys() & head.keys()):
+        direction = _direction(path)
+        if direction is None or not base[path]:
+            continue
+        change = (head[path] - base[path]) / base[path]
+        rows.append((path, base[path], head[path], change, change * direction < -threshold))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run benchmark suites and write JSON")
+    run_parser.add_argument("--suites", default=",".join(SUITES), help=f"Comma-separated subset of {','.join(SUITES)}")
+    run_parser.add_argument("--output", help="Write results here instead of stdout")
+    run_parser.add_argument("--quick", action="store_true", help="Fewer repeats and requests, for a smoke test")
+    run_parser.add_argument("--url", help="Run the load suites against this server instead of starting one")
+    run_parser.add_argument("--stub-delay-ms", type=float, default=0.0, help="Simulated LLM latency for the local server")
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative slowdown (0.10 = 10%%)")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        suites = [s.strip() for s in args.suites.split(",") if s.strip()]
+        unknown = set(suites) - set(SUITES)
+        if unknown:
+            parser.error(f"unknown suites: {', '.join(sorted(unknown))}")
+        results = run_suites(suites, args.quick, args.url, args.stub_delay_ms)
+        text = json.dumps(results, indent=2)
+        if args.output:
+            with open(args.output, "w") as f:
+                f.write(text + "\n")
+            print(f"✅ Results written to {args.output}", file=sys.stderr)
+        else:
+            print(text)
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare(baseline, current, args.threshold)
+    if not rows:
+        print("No comparable metrics in common.")
+        return
+    width = max(len(row[0]) for row in rows)
+    for path, old, new, change, regressed in rows:
+        print(f"{path:<{width}}  {old:>12.3f}  {new:>12.3f}  {change:>+8.1%}{'  ❌ REGRESSION' if regressed else ''}")
+    regressions = sum(row[4] for row in rows)
+    if regressions:
+        print(f"\n❌ {regressions} metric(s) regressed by more than {args.threshold:.0%}")
+        sys.exit(1)
+    print(f"\n✅ No regressions beyond {args.threshold:.0%} across {len(rows)} metrics")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""Model forward-pass latency and throughput across batch sizes.
+
+Inputs are random 224x224x3 tensors, so this measures the backend alone (no rembg).
+
+    python -m benchmarks.inference --model efficientnet_b0_final_nb.keras --batch-sizes 1,2,4,8,16,32,64
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+
+from benchmarks.common import summarize, time_calls
+
+DEFAULT_BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64)
+
+
+def run(model_path=None, backend=None, batch_sizes=DEFAULT_BATCH_SIZES, repeat=10):
+    from inference_backends import load_backend
+
+    model_path = model_path or os.getenv("PLANT_MODEL_PATH", "efficientnet_b0_final_nb.keras")
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"model not found: {model_path}")
+    model = load_backend(model_path, backend)
+    rng = np.random.default_rng(0)
+
+    results = {}
+    for size in batch_sizes:
+        batch = rng.uniform(0, 255, (size, 224, 224, 3)).astype(np.float32)
+        stats = summarize(time_calls(lambda: model.predict(batch), repeat, warmup=2))
+        stats["images_per_sec"] = size / (stats["mean_ms"] / 1000)
+        results[f"batch_{size}"] = stats
+    return {"model": os.path.basename(model_path), "backend": model.name, "batches": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", help="Model file (default: PLANT_MODEL_PATH or efficientnet_b0_final_nb.keras)")
+    parser.add_argument("--backend", choices=("keras", "tflite", "onnx"))
+    parser.add_argument("--batch-sizes", default=",".join(map(str, DEFAULT_BATCH_SIZES)))
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+    sizes = [int(v) for v in args.batch_sizes.split(",")]
+    print(json.dumps(run(args.model, args.backend, sizes, args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Closed-loop HTTP load test for /api/identify and /api/remedy.
+
+Each concurrency level runs `--requests` requests from that many concurrent clients
+and reports throughput plus p50/p95/p99 latency. Identify requests upload synthetic
+leaf JPEGs; remedy requests cycle through a fixed set of symptom queries.
+
+Against a running server:
+    python -m benchmarks.load --endpoint identify --url http://127.0.0.1:8000 --concurrency 1,8,32
+
+Fully offline: start the stub LLM and a server with caches disabled, then tear both down:
+    python -m benchmarks.load --endpoint remedy --start-server --stub-delay-ms 800
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from benchmarks.common import summarize
+from benchmarks.retrieval import QUERIES
+from benchmarks.synthetic import leaf_jpeg
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(url, process, timeout):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{url}/readyz", timeout=2).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+
+@contextmanager
+def local_server(stub_delay_ms=0.0, ready_timeout=300, extra_env=None):
+    """Start stub_llm.py and the backend on free ports; yields the backend URL.
+
+    Prediction and answer caches are off so every request does the full amount of work.
+    """
+    stub_port, port = _free_port(), _free_port()
+    env = {
+        **os.environ,
+        "PERPLEXITY_BASE_URL": f"http://127.0.0.1:{stub_port}",
+        "PERPLEXITY_API_KEY": "stub",
+        "PREDICTION_CACHE": "0",
+        "SEMANTIC_CACHE": "0",
+        **(extra_env or {}),
+    }
+    stub = subprocess.Popen([sys.executable, "stub_llm.py", "--port", str(stub_port), "--delay-ms", str(stub_delay_ms)],
+                            cwd=BACKEND_DIR, env=env)
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+                              cwd=BACKEND_DIR, env=env)
+    url = f"http://127.0.0.1:{port}"
+    try:
+        _wait_ready(url, server, ready_timeout)
+        yield url
+    finally:
+        for process in (server, stub):
+            process.terminate()
+        for process in (server, stub):
+            try:
+                process.wait(10)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def _request_factory(endpoint, images):
+    if endpoint == "identify":
+        bodies = [leaf_jpeg(*images["size"], seed=i) for i in range(images["count"])]
+        return lambda client, i: client.post("/api/identify", files={"file": (f"leaf{i}.jpg", bodies[i % len(bodies)], "image/jpeg")})
+    return lambda client, i: client.post("/api/remedy", json={"symptoms": f"{QUERIES[i % len(QUERIES)]} (case {i})"})
+
+
+async def _level(url, send, concurrency, total, timeout):
+    import httpx
+
+    latencies, statuses = [], Counter()
+    counter = iter(range(total))
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, timeout=timeout, limits=limits) as client:
+        async def worker():
+            for i in counter:
+                start = time.perf_counter()
+                try:
+                    response = await send(client, i)
+                    statuses[str(response.status_code)] += 1
+                    if response.status_code == 200:
+                        latencies.append(time.perf_counter() - start)
+                except httpx.HTTPError as e:
+                    statuses[type(e).__name__] += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    return {
+        **summarize(latencies),
+        "throughput_rps": len(latencies) / elapsed,
+        "errors": total - len(latencies),
+        "statuses": dict(statuses),
+    }
+
+
+def run(endpoint="identify", url=None, concurrency=(1, 8, 32), requests=200, image_size=(1024, 768),
+        image_count=32, timeout=120.0, start_server=False, stub_delay_ms=0.0):
+    send = _request_factory(endpoint, {"size": image_size, "count": image_count})
+
+    async def levels(target):
+        await _level(target, send, 1, 2, timeout)  # warm-up
+        return {f"c{c}": await _level(target, send, c, requests, timeout) for c in concurrency}
+
+    if start_server:
+        with local_server(stub_delay_ms) as local_url:
+            results = asyncio.run(levels(local_url))
+    else:
+        results = asyncio.run(levels(url or "http://127.0.0.1:8000"))
+    return {"endpoint": endpoint, "requests_per_level": requests, "levels": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--endpoint", choices=("identify", "remedy"), default="identify")
+    parser.add_argument("--url", help="Running server to test (default http://127.0.0.1:8000)")
+    parser.add_argument("--start-server", action="store_true", help="Start the stub LLM and a local server instead")
+    parser.add_argument("--stub-delay-ms", type=float, default=0.0, help="Simulated LLM latency with --start-server")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--image-size", default="1024x768", help="WIDTHxHEIGHT of the synthetic uploads")
+    parser.add_argument("--images", type=int, default=32, help="Distinct synthetic images to cycle through")
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.image_size.lower().split("x"))
+    result = run(args.endpoint, args.url, [int(c) for c in args.concurrency.split(",")], args.requests, size,
+                 args.images, start_server=args.start_server, stub_delay_ms=args.stub_delay_ms)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
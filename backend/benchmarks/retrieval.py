@@ -0,0 +1,49 @@
+"""Latency of `RAGService.retrieve` (query embedding + search + context assembly) at different k.
+
+Needs the chroma_db_nccn knowledge base; no LLM calls are made.
+
+    python -m benchmarks.retrieval --k 1,3,5,10,20 --repeat 20
+"""
+import argparse
+import itertools
+import json
+import os
+
+from benchmarks.common import summarize, time_calls
+
+DEFAULT_K = (1, 3, 5, 10, 20)
+QUERIES = (
+    "dry cough and sore throat for three days",
+    "acidity and burning sensation after meals",
+    "joint pain and stiffness in the morning",
+    "mild fever with body ache",
+    "itchy skin rash on the arms",
+    "trouble sleeping and feeling anxious",
+    "constipation and bloating",
+    "headache behind the eyes",
+)
+
+
+def run(k_values=DEFAULT_K, repeat=20):
+    if not os.path.isdir("./chroma_db_nccn"):
+        raise FileNotFoundError("chroma_db_nccn not found; run from the backend directory")
+    from rag_service import get_service
+    rag = get_service()
+
+    queries = itertools.cycle(QUERIES)
+    results = {"embedding": summarize(time_calls(lambda: rag.embed_query(next(queries)), repeat, warmup=2))}
+    for k in k_values:
+        results[f"k_{k}"] = summarize(time_calls(lambda: rag.retrieve(next(queries), k=k), repeat, warmup=1))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", default=",".join(map(str, DEFAULT_K)), help="Comma-separated k values")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+    print(json.dumps(run([int(v) for v in args.k.split(",")], args.repeat), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""Latency and accuracy of the segmentation settings against the original full-resolution rembg pipeline.
+
+The reference is `rembg.remove` on the full upload with u2net, then crop/letterbox
+(SEGMENTATION=full). Every other setting is compared with it on the same photos:
+per-image latency, mean/max absolute difference of the 224x224 tensors, and, with
+`--model`, how often the plant model's top-1 class agrees with the reference.
+
+    python -m benchmarks.segmentation --images ~/leaf_photos --model efficientnet_b0_final_nb.keras
+    python -m benchmarks.segmentation --models u2netp,silueta --repeat 5
+
+Without `--images`, synthetic 4032x3024 leaf photos on plain and textured backgrounds are used.
+Needs rembg (and its model downloads): pip install rembg onnxruntime
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+import preprocessing
+from benchmarks.common import summarize
+from benchmarks.synthetic import leaf_jpeg
+
+DEFAULT_MODELS = ("u2net", "u2netp", "silueta")
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+
+def load_samples(folder=None, limit=50):
+    """(name, bytes) pairs: the photos in `folder`, or synthetic leaves on plain and textured backgrounds."""
+    if folder is None:
+        return [(f"synthetic_{kind}_{seed}", leaf_jpeg(seed=seed, textured=kind == "textured"))
+                for kind in ("plain", "textured") for seed in (0, 1)]
+    names = sorted(n for n in os.listdir(folder) if n.lower().endswith(IMAGE_EXTENSIONS))[:limit]
+    if not names:
+        raise FileNotFoundError(f"no images in {folder}")
+    samples = []
+    for name in names:
+        with open(os.path.join(folder, name), "rb") as f:
+            samples.append((name, f.read()))
+    return samples
+
+
+def _reference(data, timings):
+    # Same stages as preprocess_fast reports (decode, segmentation, crop_resize), so speedups compare like with like
+    rgba = preprocessing.remove_background(data, timings, model_name="u2net")
+    start = time.perf_counter()
+    result = preprocessing.crop_and_letterbox(rgba)
+    timings["crop_resize"] = time.perf_counter() - start
+    return result
+
+
+def settings(models):
+    """Name -> preprocess callable(data, timings) for each setting compared against the reference."""
+    configs = {}
+    for model in models:
+        configs[f"fast_{model}"] = lambda data, timings, m=model: preprocessing.preprocess_fast(
+            data, timings=timings, model_name=m, plain_background_skip=False)
+    first = models[0]
+    configs[f"fast_{first}_plain_skip"] = lambda data, timings: preprocessing.preprocess_fast(
+        data, timings=timings, model_name=first, plain_background_skip=True)
+    return configs
+
+
+def _run_setting(fn, samples, repeat):
+    outputs, durations, skipped = [], [], 0
+    for _, data in samples:
+        fn(data, {})  # Warm-up (first call also loads the rembg session)
+        for _ in range(repeat):
+            timings = {}
+            result = fn(data, timings)
+            durations.append(sum(timings.values()))
+        skipped += "plain_background" in timings
+        outputs.append(result.copy())
+    return np.stack(outputs), durations, skipped
+
+
+def run(images=None, models=DEFAULT_MODELS, repeat=3, model_path=None, limit=50):
+    import rembg  # noqa: F401  Fail early (and get the suite skipped) without it
+
+    samples = load_samples(images, limit)
+    classifier = None
+    if model_path:
+        from inference_backends import load_backend
+        classifier = load_backend(model_path)
+
+    reference, durations, _ = _run_setting(_reference, samples, repeat)
+    reference_top1 = classifier.predict(reference).argmax(axis=1) if classifier else None
+    results = {"images": len(samples), "reference": {"setting": "full_u2net", **summarize(durations)}}
+
+    for name, fn in settings(list(models)).items():
+        outputs, durations, skipped = _run_setting(fn, samples, repeat)
+        diff = np.abs(outputs - reference)
+        stats = summarize(durations)
+        stats.update({
+            "speedup": results["reference"]["mean_ms"] / stats["mean_ms"],
+            "mean_abs_diff": float(diff.mean()),
+            "max_abs_diff": float(diff.max()),
+            "rembg_skipped": skipped,
+        })
+        if classifier is not None:
+            stats["top1_agreement"] = float((classifier.predict(outputs).argmax(axis=1) == reference_top1).mean())
+        results[name] = stats
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--images", help="Folder of sample leaf photos (default: synthetic photos)")
+    parser.add_argument("--limit", type=int, default=50, help="Use at most this many photos from --images")
+    parser.add_argument("--models", default=",".join(DEFAULT_MODELS), help="rembg models to try in fast mode")
+    parser.add_argument("--model", help="Plant model, to report top-1 agreement with the reference")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    try:
+        results = run(args.images, args.models.split(","), args.repeat, args.model, args.limit)
+    except ImportError:
+        print("❌ rembg is not installed. Install with: pip install rembg onnxruntime")
+        raise SystemExit(1)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+
+def leaf_rgba(width=4032, height=3024, seed=0):
+    """A background-removed "leaf": textured green ellipse with a soft alpha edge, as rembg would return it."""
+    rng = np.random.default_rng(seed)
+    rgb = np.empty((height, width, 3), dtype=np.uint8)
+    rgb[..., 0] = rng.integers(20, 90, (height, width), dtype=np.uint8)
+    rgb[..., 1] = rng.integers(90, 200, (height, width), dtype=np.uint8)
+    rgb[..., 2] = rng.integers(10, 70, (height, width), dtype=np.uint8)
+    mask = Image.new("L", (width, height), 0)
+    box = (width * 0.2, height * 0.15, width * 0.75, height * 0.8)
+    ImageDraw.Draw(mask).ellipse(box, fill=255)
+    alpha = np.asarray(mask.filter(ImageFilter.GaussianBlur(max(1, width // 400))))
+    return np.dstack([rgb, alpha])
+
+
+def leaf_photo(width=4032, height=3024, seed=0, background=(205, 200, 190), textured=False):
+    """The same leaf composited onto a plain background, as a phone photo would show it.
+
+    With `textured`, the background is blotchy soil-like noise around that colour instead.
+    """
+    rgba = leaf_rgba(width, height, seed).astype(np.float32)
+    alpha = rgba[..., 3:4] / 255.0
+    backdrop = np.array(background, dtype=np.float32)
+    if textured:
+        rng = np.random.default_rng(seed + 1)
+        noise = Image.fromarray(rng.integers(0, 256, (height // 16, width // 16, 3), dtype=np.uint8))
+        noise = np.asarray(noise.resize((width, height), Image.BILINEAR), dtype=np.float32)
+        backdrop = backdrop * 0.4 + noise * 0.6
+    rgb = rgba[..., :3] * alpha + backdrop * (1 - alpha)
+    return rgb.astype(np.uint8)
+
+
+def leaf_jpeg(width=4032, height=3024, seed=0, quality=90, textured=False):
+    buffer = io.BytesIO()
+    Image.fromarray(leaf_photo(width, height, seed, textured=textured)).save(buffer, format="JPEG", quality=quality)
+    return buffer.getvalue()
@@ -0,0 +1,111 @@
+"""Chroma `similarity_search_with_score` vs the in-memory VectorIndex.
+
+Search is timed on precomputed query vectors so both sides do the same work, and
+results are checked for identical ordering. Query embedding is timed one at a time
+(`embed_query`) and batched (`embed_documents`), which is what concurrent
+/api/remedy calls get from BatchedRetriever.
+
+    python -m benchmarks.vector_index --k 3,10 --repeat 50
+    python -m benchmarks.vector_index --synthetic 20000     # no knowledge base needed (needs chromadb)
+"""
+import argparse
+import json
+import os
+import tempfile
+
+import numpy as np
+
+from benchmarks.common import summarize, time_calls
+from benchmarks.retrieval import QUERIES
+from vector_index import VectorIndex
+
+
+def _synthetic_collection(count, dim=384, seed=0):
+    import chromadb
+
+    # Clustered like real sentence embeddings; uniform random vectors are a worst case for HNSW recall
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, count // 60), dim))
+    vectors = (centers[rng.integers(0, len(centers), count)] + 0.3 * rng.normal(size=(count, dim))).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    client = chromadb.EphemeralClient()
+    collection = client.create_collection(f"bench-{count}")
+    for start in range(0, count, 5000):
+        ids = [str(i) for i in range(start, min(count, start + 5000))]
+        collection.add(ids=ids, embeddings=vectors[start:start + 5000].tolist(), documents=[f"chunk {i}" for i in ids])
+    queries = (centers[rng.integers(0, len(centers), len(QUERIES) * 4)] + 0.3 * rng.normal(size=(len(QUERIES) * 4, dim))).astype(np.float32)
+    return collection, queries / np.linalg.norm(queries, axis=1, keepdims=True), None
+
+
+def _knowledge_base_collection():
+    from rag_service import get_service
+    rag = get_service()
+    queries = np.asarray(rag.embeddings.embed_documents(list(QUERIES)), dtype=np.float32)
+    return rag.kb.vector_db._collection, queries, rag.embeddings
+
+
+def _chroma_search(collection, vector, k):
+    result = collection.query(query_embeddings=[vector.tolist()], n_results=k, include=["documents", "distances"])
+    return result["documents"][0], result["distances"][0]
+
+
+def run(k_values=(3, 10), repeat=50, synthetic=None):
+    if synthetic:
+        collection, queries, embedder = _synthetic_collection(synthetic)
+    else:
+        if not os.path.isdir("./chroma_db_nccn"):
+            raise FileNotFoundError("chroma_db_nccn not found; run from the backend directory or use --synthetic")
+        collection, queries, embedder = _knowledge_base_collection()
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        from vector_index import export_collection
+        export_collection(collection, cache_dir, "benchmark")
+        index = VectorIndex.load(cache_dir)
+
+        results = {"chunks": len(index), "dim": int(index.embeddings.shape[1]), "space": index.space}
+        for k in k_values:
+            cycle = iter(np.resize(np.arange(len(queries)), repeat + 1))
+            chroma = summarize(time_calls(lambda: _chroma_search(collection, queries[next(cycle)], k), repeat))
+            cycle = iter(np.resize(np.arange(len(queries)), repeat + 1))
+            exact = summarize(time_calls(lambda: index.search(queries[next(cycle)], k), repeat))
+            batched = summarize(time_calls(lambda: index.search_batch(queries, k), max(1, repeat // 5)))
+
+            same_order, max_diff = 0, 0.0
+            for vector in queries:
+                documents, distances = _chroma_search(collection, vector, k)
+                hits = index.search(vector, k)
+                same_order += [hit.page_content for hit in hits] == documents
+                max_diff = max(max_diff, max(abs(hit.distance - d) for hit, d in zip(hits, distances)))
+            results[f"k_{k}"] = {
+                "chroma": chroma,
+                "vector_index": exact,
+                f"vector_index_batch_{len(queries)}": {**batched, "per_query_ms": batched["mean_ms"] / len(queries)},
+                "speedup": chroma["mean_ms"] / exact["mean_ms"],
+                "same_order_fraction": same_order / len(queries),
+                "max_abs_distance_diff": max_diff,
+            }
+
+    if embedder is not None:
+        texts = list(QUERIES)
+        single = summarize(time_calls(lambda: [embedder.embed_query(t) for t in texts], max(1, repeat // 5)))
+        batch = summarize(time_calls(lambda: embedder.embed_documents(texts), max(1, repeat // 5)))
+        results["embedding"] = {
+            "queries": len(texts),
+            "one_at_a_time_ms": single["mean_ms"],
+            "batched_ms": batch["mean_ms"],
+            "speedup": single["mean_ms"] / batch["mean_ms"],
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--k", default="3,10", help="Comma-separated k values")
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--synthetic", type=int, help="Benchmark a random collection of this many 384-d vectors")
+    args = parser.parse_args()
+    print(json.dumps(run([int(v) for v in args.k.split(",")], args.repeat, args.synthetic), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+
+from metrics import CONTEXT_CHUNKS, PROMPT_TOKENS
+
+# Squared L2 between normalized MiniLM vectors is 2 - 2*cosine, so 1.5 keeps cosine >= 0.25
+CONTEXT_MAX_DISTANCE = float(os.getenv("CONTEXT_MAX_DISTANCE", "1.5"))
+CONTEXT_DEDUP_THRESHOLD = float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.92"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+
+Context = namedtuple("Context", "text chunks tokens dropped")
+
+_encoding = None
+_encoding_loaded = False
+
+
+def count_tokens(text):
+    """Token count with tiktoken's cl100k_base when installed, else a ~4 characters per token estimate."""
+    global _encoding, _encoding_loaded
+    if not _encoding_loaded:
+        _encoding_loaded = True
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception:
+            _encoding = None
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(len(text) // 4, len(text.split()))
+
+
+def _truncate(text, budget):
+    if _encoding is not None:
+        return _encoding.decode(_encoding.encode(text, disallowed_special=())[:budget])
+    return text[:budget * 4]
+
+
+def _shingles(text, size=5):
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def assemble_context(results, vectors=None, max_distance=CONTEXT_MAX_DISTANCE,
+                     dedup_threshold=CONTEXT_DEDUP_THRESHOLD, token_budget=CONTEXT_TOKEN_BUDGET):
+    """Turn ranked (document, distance) pairs into the context string sent to the LLM.
+
+    Chunks further than `max_distance` are dropped, then near-duplicates of a better
+    ranked chunk: cosine similarity of their embeddings above `dedup_threshold` when
+    `vectors` (one per result) are given, otherwise 5-word shingle overlap above the
+    same threshold. What's left is packed in rank order into `token_budget` tokens;
+    a first chunk that is too long on its own is truncated rather than dropped.
+    """
+    dropped = {"below_threshold": 0, "duplicate": 0, "over_budget": 0}
+    candidates = []
+    for i, (doc, distance) in enumerate(results):
+        if max_distance is not None and distance is not None and distance > max_distance:
+            dropped["below_threshold"] += 1
+        elif doc.page_content.strip():
+            candidates.append(i)
+
+    kept = []
+    if vectors is not None and candidates:
+        unit = _unit([vectors[i] for i in candidates])
+        kept_rows = []
+        for row, i in enumerate(candidates):
+            if kept_rows and float((unit[kept_rows] @ unit[row]).max()) >= dedup_threshold:
+                dropped["duplicate"] += 1
+            else:
+                kept_rows.append(row)
+                kept.append(i)
+    else:
+        seen = []
+        for i in candidates:
+            shingles = _shingles(results[i][0].page_content)
+            if any(len(shingles & other) / min(len(shingles), len(other)) >= dedup_threshold for other in seen):
+                dropped["duplicate"] += 1
+            else:
+                seen.append(shingles)
+                kept.append(i)
+
+    parts, used = [], 0
+    for i in kept:
+        text = results[i][0].page_content
+        tokens = count_tokens(text) + 1  # + the joining newline
+        if used + tokens > token_budget:
+            if not parts:
+                text = _truncate(text, token_budget)
+                parts.append(text)
+                used = count_tokens(text)
+            else:
+                dropped["over_budget"] += 1
+            continue
+        parts.append(text)
+        used += tokens
+
+    CONTEXT_CHUNKS.inc(len(parts), outcome="kept")
+    for outcome, count in dropped.items():
+        if count:
+            CONTEXT_CHUNKS.inc(count, outcome=outcome)
+    return Context("\n".join(parts), len(parts), used, dropped)
+
+
+def record_prompt(messages):
+    """Observe the estimated token count of a chat prompt in swasth_prompt_tokens and return it."""
+    tokens = sum(count_tokens(m["content"]) + 4 for m in messages)  # ~4 tokens of per-message framing
+    PROMPT_TOKENS.observe(tokens)
+    return tokens
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Export the EfficientNet plant classifier to TFLite or ONNX, optionally quantized,
+and check the export agrees with the Keras baseline.
+
+Usage:
+  python convert_model.py <model.keras> --format tflite [--quantize none|float16|int8] [options]
+  python convert_model.py <model.keras> --format onnx   [--quantize none|float16|int8] [options]
+
+Examples:
+  python convert_model.py efficientnet_b0_final_nb.keras --format tflite --quantize float16
+  python convert_model.py efficientnet_b0_final_nb.keras --format onnx --quantize int8 \\
+      --calibration-dir samples/ --check-dir samples/
+
+int8 needs --calibration-dir: a folder of leaf photos that are run through the same
+preprocessing as /api/identify to calibrate activation ranges. Serve the result with
+PLANT_MODEL_PATH=<output> (the backend is picked from the file extension).
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import preprocessing
+from inference_backends import KerasBackend, load_backend
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+
+def load_samples(image_dir, limit, remove_bg=True):
+    """Preprocess up to `limit` images from `image_dir` into a float32 (N, 224, 224, 3) array."""
+    paths = sorted(
+        os.path.join(root, name)
+        for root, _, files in os.walk(image_dir)
+        for name in files if name.lower().endswith(IMAGE_EXTENSIONS)
+    )[:limit]
+    if not paths:
+        raise SystemExit(f"Error: no images found in '{image_dir}'")
+    samples = []
+    for path in paths:
+        if remove_bg:
+            samples.append(preprocessing.preprocess(path))
+        else:
+            # Already-cropped images: treat as fully opaque and just letterbox
+            rgba = np.array(preprocessing.open_image(path).convert("RGBA"))
+            samples.append(preprocessing.crop_and_letterbox(rgba))
+    print(f"Loaded {len(samples)} sample images from {image_dir}")
+    return np.stack(samples).astype(np.float32)
+
+
+def export_tflite(model, output_path, quantize, calibration):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "int8":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: ([sample[None]] for sample in calibration)
+        # Integer kernels inside, float input/output so the serving code doesn't change
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8, tf.lite.OpsSet.TFLITE_BUILTINS]
+    with open(output_path, "wb") as f:
+        f.write(converter.convert())
+
+
+def export_onnx(model, output_path, quantize, calibration):
+    import tensorflow as tf
+    import tf2onnx
+    import onnx
+
+    spec = [tf.TensorSpec((None, *model.input_shape[1:]), tf.float32, name="input")]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        fp32_path = output_path if quantize == "none" else os.path.join(tmpdir, "model_fp32.onnx")
+        tf2onnx.convert.from_keras(model, input_signature=spec, opset=13, output_path=fp32_path)
+
+        if quantize == "float16":
+            from onnxconverter_common import float16
+            fp16 = float16.convert_float_to_float16(onnx.load(fp32_path), keep_io_types=True)
+            onnx.save(fp16, output_path)
+        elif quantize == "int8":
+            from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+            class Reader(CalibrationDataReader):
+                def __init__(self):
+                    self._samples = iter(calibration)
+
+                def get_next(self):
+                    sample = next(self._samples, None)
+                    return None if sample is None else {"input": sample[None]}
+
+            quantize_static(fp32_path, output_path, Reader(), quant_format=QuantFormat.QDQ,
+                            activation_type=QuantType.QUInt8, weight_type=QuantType.QInt8)
+
+
+def agreement(reference, candidate, k=5):
+    """Top-1 agreement and mean top-k overlap between two (N, classes) probability arrays."""
+    top1 = float(np.mean(reference.argmax(axis=1) == candidate.argmax(axis=1)))
+    ref_topk = np.argpartition(reference, -k, axis=1)[:, -k:]
+    cand_topk = np.argpartition(candidate, -k, axis=1)[:, -k:]
+    overlap = np.mean([len(set(a) & set(b)) / k for a, b in zip(ref_topk, cand_topk)])
+    return {"top1_agreement": top1, f"top{k}_overlap": float(overlap),
+            "max_abs_prob_diff": float(np.abs(reference - candidate).max())}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("model", help="Path to the Keras .keras/.h5 model")
+    parser.add_argument("--format", choices=("tflite", "onnx"), required=True)
+    parser.add_argument("--quantize", choices=("none", "float16", "int8"), default="none")
+    parser.add_argument("--output", help="Output path (default: next to the input model)")
+    parser.add_argument("--calibration-dir", help="Leaf photos used to calibrate int8 quantization")
+    parser.add_argument("--calibration-count", type=int, default=200)
+    parser.add_argument("--check-dir", help="Leaf photos for the Keras vs export agreement check "
+                                            "(default: the calibration set, else random inputs)")
+    parser.add_argument("--check-count", type=int, default=100)
+    parser.add_argument("--no-rembg", action="store_true", help="Sample images are already cropped; skip background removal")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"Error: File '{args.model}' not found.")
+        sys.exit(1)
+    if args.quantize == "int8" and not args.calibration_dir:
+        parser.error("--quantize int8 requires --calibration-dir")
+
+    suffix = "" if args.quantize == "none" else f"_{args.quantize}"
+    output_path = args.output or f"{os.path.splitext(args.model)[0]}{suffix}.{args.format}"
+
+    try:
+        keras = KerasBackend(args.model)
+        print(f"Model loaded. Input shape: {keras.model.input_shape}")
+
+        calibration = None
+        if args.calibration_dir:
+            calibration = load_samples(args.calibration_dir, args.calibration_count, not args.no_rembg)
+
+        print(f"Exporting {args.format} ({args.quantize}) to {output_path}...")
+        start = time.perf_counter()
+        exporter = export_tflite if args.format == "tflite" else export_onnx
+        exporter(keras.model, output_path, args.quantize, calibration)
+        print(f"✓ Export complete in {time.perf_counter() - start:.1f}s "
+              f"({os.path.getsize(output_path) / 1e6:.1f} MB, Keras file {os.path.getsize(args.model) / 1e6:.1f} MB)")
+
+        if args.check_dir:
+            check = load_samples(args.check_dir, args.check_count, not args.no_rembg)
+        elif calibration is not None:
+            check = calibration[:args.check_count]
+        else:
+            print("No --check-dir given, checking agreement on random inputs (not representative of accuracy)")
+            check = np.random.default_rng(0).uniform(0, 255, (16, 224, 224, 3)).astype(np.float32)
+
+        exported = load_backend(output_path)
+        reference = np.concatenate([keras.predict(check[i:i + 32]) for i in range(0, len(check), 32)])
+        candidate = np.concatenate([exported.predict(check[i:i + 32]) for i in range(0, len(check), 32)])
+        report = agreement(reference, candidate)
+        print(f"✓ Agreement with Keras on {len(check)} images: "
+              f"top-1 {report['top1_agreement']:.1%}, top-5 overlap {report['top5_overlap']:.1%}, "
+              f"max |Δp| {report['max_abs_prob_diff']:.4f}")
+
+    except ImportError as e:
+        print(f"Error: missing dependency ({e}).")
+        print("Install with:")
+        print("  pip install tensorflow            # TFLite export")
+        print("  pip install tf2onnx onnx onnxruntime onnxconverter-common   # ONNX export / quantization")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
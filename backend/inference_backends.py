@@ -0,0 +1,107 @@
+"""Interchangeable runtimes for the EfficientNet plant classifier.
+
+Every backend takes a float32 (N, 224, 224, 3) batch of raw 0-255 pixels and returns
+an (N, num_classes) array of probabilities. Use `convert_model.py` to produce the
+.tflite / .onnx artifacts from the Keras model.
+"""
+import os
+
+import numpy as np
+
+BACKENDS = ("keras", "tflite", "onnx")
+
+
+def _num_threads():
+    value = os.getenv("INFERENCE_THREADS")
+    return int(value) if value else None
+
+
+class KerasBackend:
+    name = "keras"
+
+    def __init__(self, model_path):
+        from tensorflow.keras.models import load_model
+        from tensorflow.keras.applications.efficientnet import preprocess_input
+
+        self._preprocess_input = preprocess_input
+        self.model = load_model(model_path, compile=False)
+
+    def predict(self, batch):
+        batch = self._preprocess_input(batch)
+        return self.model.predict(batch, batch_size=len(batch), verbose=0)
+
+
+class TFLiteBackend:
+    name = "tflite"
+
+    def __init__(self, model_path):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+
+        self.interpreter = Interpreter(model_path=model_path, num_threads=_num_threads())
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+
+    def predict(self, batch):
+        # The exported graph is resized in place whenever the batch size changes
+        if len(batch) != self._batch_size:
+            self.interpreter.resize_tensor_input(self._input["index"], [len(batch), *batch.shape[1:]])
+            self.interpreter.allocate_tensors()
+            self._input = self.interpreter.get_input_details()[0]
+            self._output = self.interpreter.get_output_details()[0]
+            self._batch_size = len(batch)
+
+        scale, zero_point = self._input["quantization"]
+        if scale:  # Fully integer model: quantize the input ourselves, saturating instead of wrapping
+            limits = np.iinfo(self._input["dtype"])
+            batch = np.clip(np.round(batch / scale + zero_point), limits.min, limits.max)
+        self.interpreter.set_tensor(self._input["index"], batch.astype(self._input["dtype"], copy=False))
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self._output["index"])
+
+        scale, zero_point = self._output["quantization"]
+        if scale:
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+class OnnxBackend:
+    name = "onnx"
+
+    def __init__(self, model_path):
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        threads = _num_threads()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        self._input_name = self.session.get_inputs()[0].name
+
+    def predict(self, batch):
+        return self.session.run(None, {self._input_name: batch.astype(np.float32, copy=False)})[0]
+
+
+def backend_for_path(model_path):
+    ext = os.path.splitext(model_path)[1].lower()
+    if ext == ".tflite":
+        return "tflite"
+    if ext == ".onnx":
+        return "onnx"
+    return "keras"
+
+
+def load_backend(model_path, kind=None):
+    """Load `model_path` with the requested backend (inferred from the file extension by default)."""
+    kind = (kind or backend_for_path(model_path)).lower()
+    if kind == "keras":
+        return KerasBackend(model_path)
+    if kind == "tflite":
+        return TFLiteBackend(model_path)
+    if kind == "onnx":
+        return OnnxBackend(model_path)
+    raise ValueError(f"Unknown inference backend '{kind}' (expected one of {', '.join(BACKENDS)})")
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Incrementally ingest PDF / text / markdown sources into the chroma_db_nccn knowledge base.
+
+Documents are streamed page by page through the text splitter, and chunk ids are a hash
+of the chunk text, so re-running over the same material skips every chunk that is
+already stored and only embeds what is new or changed. Embedding runs in batches on
+several worker threads while the next batch is being read and chunked. Each chunk's
+`source` is its path relative to --source-root (this folder by default), so --prune
+finds the same chunks whichever directory the command is run from.
+
+Stores built before this script have random (UUID) chunk ids, which would make every
+chunk look new and get stored twice. Run once with --migrate first: it re-keys those
+chunks by content, reusing their stored embeddings, drops exact duplicates and rewrites
+`source` relative to --source-root where the file can be found. Chunks the splitter now
+cuts differently stay as they are; `--prune` on their source removes them. (Or rebuild
+from scratch into an empty --persist-dir.)
+
+Usage:
+  python ingest.py <file-or-folder> [<file-or-folder> ...] [options]
+
+Examples:
+  python ingest.py sources/                          # add anything new under sources/
+  python ingest.py sources/nccn.pdf --prune          # also drop chunks no longer in that file
+  python ingest.py sources/ --dry-run                # count chunks without touching the store
+  python ingest.py sources/ --migrate --prune        # first run against a pre-existing store
+
+The server picks up the changes on its next start: the vector index export and the
+semantic answer cache are both invalidated when chroma_db_nccn changes.
+"""
+
+import argparse
+import hashlib
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+SOURCE_EXTENSIONS = (".pdf", ".txt", ".md", ".markdown")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"  # Must match the query-side model in rag.py
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def find_sources(paths):
+    """Expand files and folders into a sorted list of ingestible files."""
+    found = []
+    for path in paths:
+        if os.path.isdir(path):
+            found += [os.path.join(root, name)
+                      for root, _, files in os.walk(path)
+                      for name in files if name.lower().endswith(SOURCE_EXTENSIONS)]
+        elif os.path.isfile(path):
+            found.append(path)
+        else:
+            raise SystemExit(f"Error: '{path}' not found")
+    return sorted(found)
+
+
+def read_pages(path):
+    """Yield (page_number, text) one page at a time; text files are a single page."""
+    if path.lower().endswith(".pdf"):
+        from pypdf import PdfReader
+
+        for number, page in enumerate(PdfReader(path).pages, start=1):
+            yield number, page.extract_text() or ""
+    else:
+        with open(path, encoding="utf-8", errors="replace") as f:
+            yield 1, f.read()
+
+
+def chunk_id(text):
+    return hashlib.sha256(" ".join(text.split()).encode()).hexdigest()[:32]
+
+
+def is_content_id(id_):
+    """True for ids made by `chunk_id`; older stores use UUIDs."""
+    return len(id_) == 32 and all(c in "0123456789abcdef" for c in id_)
+
+
+def source_name(path, root):
+    """`source` metadata for `path`: relative to `root` with / separators, or absolute when outside it."""
+    path = os.path.abspath(path)
+    relative = os.path.relpath(path, root)
+    if relative == ".." or relative.startswith(".." + os.sep):
+        return path
+    return relative.replace(os.sep, "/")
+
+
+def iter_chunks(paths, splitter, root):
+    """Yield (id, text, metadata) for every chunk of every page of every source."""
+    for path in paths:
+        source = source_name(path, root)
+        for page, text in read_pages(path):
+            for index, chunk in enumerate(splitter.split_text(text)):
+                if chunk.strip():
+                    yield chunk_id(chunk), chunk, {"source": source, "page": page, "chunk": index}
+
+
+def _canonical_source(source, root):
+    # Legacy paths were relative to wherever the old loader ran; keep them unless the file is found
+    for candidate in (source, os.path.join(root, source)):
+        if os.path.isfile(candidate):
+            return source_name(candidate, root)
+    return source
+
+
+def migrate_legacy_ids(collection, root, dry_run=False, batch_size=1000):
+    """Re-key chunks with non-content ids by their text, reusing the stored embeddings.
+
+    Chunks whose content id is already stored are deleted as duplicates. Each batch is
+    upserted under the new ids before the old ids are deleted, so an interrupted run can
+    simply be repeated. Returns (re-keyed, duplicates removed).
+    """
+    ids = collection.get(include=[])["ids"]
+    known = {i for i in ids if is_content_id(i)}
+    rekeyed = duplicates = 0
+    for batch in batched([i for i in ids if not is_content_id(i)], batch_size):
+        page = collection.get(ids=batch, include=["documents", "metadatas", "embeddings"])
+        new_ids, documents, metadatas, embeddings = [], [], [], []
+        for document, metadata, embedding in zip(page["documents"], page["metadatas"], page["embeddings"]):
+            new_id = chunk_id(document or "")
+            if new_id in known:
+                duplicates += 1
+                continue
+            known.add(new_id)
+            metadata = dict(metadata or {})
+            if "source" in metadata:
+                metadata["source"] = _canonical_source(metadata["source"], root)
+            new_ids.append(new_id)
+            documents.append(document)
+            metadatas.append(metadata)
+            embeddings.append(embedding)
+        rekeyed += len(new_ids)
+        if dry_run:
+            continue
+        if new_ids:
+            collection.upsert(ids=new_ids, documents=documents, metadatas=metadatas, embeddings=embeddings)
+        collection.delete(ids=page["ids"])
+    return rekeyed, duplicates
+
+
+def batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Ingestor:
+    """Skips stored chunks, embeds new ones on a thread pool and upserts them as batches finish."""
+
+    def __init__(self, collection, model, workers=2, batch_size=64, dry_run=False):
+        self.collection = collection
+        self.model = model
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="embed")
+        self._pending = deque()
+        self.seen_ids = set()
+        self.stats = {"chunks": 0, "duplicates": 0, "unchanged": 0, "embedded": 0}
+
+    def _embed(self, texts):
+        return self.model.encode(texts, batch_size=self.batch_size, show_progress_bar=False,
+                                 convert_to_numpy=True).tolist()
+
+    def _drain(self, limit):
+        # Chroma writes stay on this thread; only embedding is parallel
+        while len(self._pending) > limit:
+            batch, future = self._pending.popleft()
+            ids, texts, metadatas = zip(*batch)
+            self.collection.upsert(ids=list(ids), documents=list(texts), metadatas=list(metadatas),
+                                   embeddings=future.result())
+            self.stats["embedded"] += len(batch)
+
+    def add(self, batch):
+        self.stats["chunks"] += len(batch)
+        unique = []
+        for item in batch:
+            if item[0] in self.seen_ids:
+                self.stats["duplicates"] += 1
+            else:
+                self.seen_ids.add(item[0])
+                unique.append(item)
+        if not unique:
+            return
+        stored = set(self.collection.get(ids=[item[0] for item in unique], include=[])["ids"])
+        new = [item for item in unique if item[0] not in stored]
+        self.stats["unchanged"] += len(unique) - len(new)
+        if self.dry_run:
+            self.stats["embedded"] += len(new)
+            return
+        if not new:
+            return
+        self._pending.append((new, self._executor.submit(self._embed, [text for _, text, _ in new])))
+        self._drain(self.workers * 2)  # Bounded read-ahead
+
+    def finish(self):
+        self._drain(0)
+        self._executor.shutdown()
+
+    def prune(self, sources):
+        """Delete stored chunks of `sources` that weren't produced by this run."""
+        removed = 0
+        for source in sources:
+            stored = self.collection.get(where={"source": source}, include=[])["ids"]
+            stale = [i for i in stored if i not in self.seen_ids]
+            if stale and not self.dry_run:
+                self.collection.delete(ids=stale)
+            removed += len(stale)
+        self.stats["pruned"] = removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("sources", nargs="+", help="PDF / .txt / .md files or folders of them")
+    parser.add_argument("--persist-dir", default=os.path.join(BACKEND_DIR, "chroma_db_nccn"))
+    parser.add_argument("--source-root", default=BACKEND_DIR,
+                        help="Sources are recorded relative to this folder (default: the backend folder)")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Re-key chunks from stores built before this script by content (needed once)")
+    parser.add_argument("--collection", default="langchain", help="Collection name (langchain's default)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="Characters per chunk")
+    parser.add_argument("--chunk-overlap", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=64, help="Chunks per embedding call")
+    parser.add_argument("--workers", type=int, default=max(1, min(4, (os.cpu_count() or 1) // 2)),
+                        help="Parallel embedding threads")
+    parser.add_argument("--prune", action="store_true", help="Remove stored chunks of these sources that no longer exist")
+    parser.add_argument("--dry-run", action="store_true", help="Report what would change without writing")
+    args = parser.parse_args()
+
+    paths = find_sources(args.sources)
+    if not paths:
+        print("Error: no .pdf, .txt or .md files found")
+        sys.exit(1)
+    root = os.path.abspath(args.source_root)
+
+    try:
+        import chromadb
+        import torch
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+        from sentence_transformers import SentenceTransformer
+    except ImportError as e:
+        print(f"Error: missing dependency ({e}).")
+        print("Install with: pip install chromadb sentence-transformers langchain-text-splitters pypdf")
+        sys.exit(1)
+
+    # Split the cores between the embedding threads instead of letting each one grab all of them
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // args.workers))
+    print(f"🔄 Loading {EMBEDDING_MODEL}...")
+    model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+    collection = chromadb.PersistentClient(path=args.persist_dir).get_or_create_collection(args.collection)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap)
+    ingestor = Ingestor(collection, model, args.workers, args.batch_size, args.dry_run)
+
+    legacy = sum(not is_content_id(i) for i in collection.get(include=[])["ids"])
+    if legacy and args.migrate:
+        rekeyed, duplicates = migrate_legacy_ids(collection, root, args.dry_run)
+        print(f"✓ {rekeyed} legacy chunks {'would be ' if args.dry_run else ''}re-keyed by content, "
+              f"{duplicates} duplicates {'would be ' if args.dry_run else ''}removed")
+    elif legacy:
+        print(f"Error: {legacy} stored chunks have ids from before ingest.py, so every chunk would be stored twice.")
+        print("Run once with --migrate (re-keys them by content, no re-embedding), or ingest into a fresh --persist-dir.")
+        sys.exit(1)
+
+    print(f"🔄 Ingesting {len(paths)} file(s) into '{args.collection}' ({collection.count()} chunks stored)"
+          f"{' [dry run]' if args.dry_run else ''}")
+    start = last_report = time.perf_counter()
+    for batch in batched(iter_chunks(paths, splitter, root), args.batch_size):
+        ingestor.add(batch)
+        if time.perf_counter() - last_report > 5:
+            last_report = time.perf_counter()
+            print(f"   {ingestor.stats['chunks']} chunks read, {ingestor.stats['embedded']} embedded, "
+                  f"{ingestor.stats['chunks'] / (last_report - start):.1f} chunks/s")
+    ingestor.finish()
+    if args.prune:
+        ingestor.prune([source_name(p, root) for p in paths])
+    elapsed = time.perf_counter() - start
+
+    stats = ingestor.stats
+    print(f"✓ {stats['chunks']} chunks in {elapsed:.1f}s ({stats['chunks'] / elapsed:.1f} chunks/s): "
+          f"{stats['embedded']} {'would be ' if args.dry_run else ''}embedded "
+          f"({stats['embedded'] / elapsed:.1f}/s), {stats['unchanged']} unchanged, {stats['duplicates']} duplicate"
+          + (f", {stats['pruned']} {'would be ' if args.dry_run else ''}pruned" if args.prune else ""))
+    if not args.dry_run:
+        print(f"✓ Collection now has {collection.count()} chunks")
+
+
+if __name__ == "__main__":
+    main()
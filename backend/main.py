@@ -1,25 +1,39 @@
 import os
-import shutil
+import io
+import hmac
+import json
+import asyncio
+import zipfile
 import numpy as np
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+from typing import List, Optional
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Header, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from PIL import Image, ImageFile
-from rembg import remove
-from tensorflow.keras.models import load_model
-from tensorflow.keras.applications.efficientnet import preprocess_input
 from dotenv import load_dotenv
 
+import model_server
+import preprocessing
+import tta
+from admission import AdmissionMiddleware, DeadlineExceeded, EndpointLimiter, within_deadline
+from batching import BatchScheduler
+from inference_backends import load_backend
+from metrics import REGISTRY, BATCH_SIZE, CallbackGauge, MetricsMiddleware, record_error, time_stage
+from preprocessing import PreprocessPool, PoolSaturated
+from prediction_cache import PredictionCache, content_key, perceptual_key
+from rag_service import MISSING_KEY_RESPONSE, NO_CONTEXT_RESPONSE, PROMPTS
+from semantic_cache import SemanticAnswerCache
+from startup import StartupManager
+
 # --- LOAD ENV FROM ROOT DIRECTORY ---
 # This looks for the .env file in the folder one level up (the project root)
 env_path = Path(__file__).resolve().parent.parent / '.env'
 load_dotenv(dotenv_path=env_path)
 
-# --- RAG Imports ---
-from langchain_community.vectorstores import Chroma
-from langchain_huggingface import HuggingFaceEmbeddings
-from openai import OpenAI
+# Heavy libraries (TensorFlow, rembg, langchain, openai) are imported lazily by the components
+# that need them, so importing this module is cheap and startup can load them in parallel.
 
 # Safety fixes
 ImageFile.LOAD_TRUNCATED_IMAGES = True
@@ -28,6 +42,31 @@ os.environ['TF_CPP_MIN_LOG_LEVEL'] = '3'
 
 app = FastAPI()
 
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(15 * 1024 * 1024)))
+
+# --- Admission control ---
+# Per-endpoint concurrency limits and bounded queues, checked before the body is parsed, plus a
+# per-request deadline that preprocessing, inference, retrieval and LLM calls give up at.
+def _limiter(name, env, max_concurrent, max_queue, deadline, **kwargs):
+    return EndpointLimiter(
+        name,
+        max_concurrent=int(os.getenv(f"{env}_MAX_CONCURRENT", str(max_concurrent))),
+        max_queue=int(os.getenv(f"{env}_MAX_QUEUE", str(max_queue))),
+        queue_timeout=float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "5")),
+        deadline=float(os.getenv(f"{env}_DEADLINE_SECONDS", str(deadline))),
+        **kwargs,
+    )
+
+admission_limiters = {
+    "/api/identify": _limiter("identify", "IDENTIFY", 16, 64, 30, cancel_on_disconnect=True,
+                              max_body_bytes=MAX_UPLOAD_BYTES + 64 * 1024),  # + multipart framing
+    "/api/identify/batch": _limiter("identify_batch", "IDENTIFY_BATCH", 2, 4, 0),  # Streams; cancels itself on disconnect
+    "/api/remedy": _limiter("remedy", "REMEDY", 32, 128, 90, cancel_on_disconnect=True, max_body_bytes=64 * 1024),
+}
+if os.getenv("ADMISSION_CONTROL", "1") == "1":
+    # Added first so it sits inside CORS: browsers must be able to read the 429 / 503 responses
+    app.add_middleware(AdmissionMiddleware, limiters=admission_limiters)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000"],
@@ -35,12 +74,18 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Request counts, latency and in-flight gauges for the hot endpoints (plus opt-in cProfile dumps)
+app.add_middleware(MetricsMiddleware, paths=["/api/identify", "/api/identify/batch", "/api/remedy"])
 
 # --- 1. EfficientNet Plant Predictor ---
+TTA_MODE = os.getenv("TTA_MODE", "fast")  # Default test-time augmentation: fast (1 view), balanced (3) or accurate (6)
+UNKNOWN_PLANT_THRESHOLD = float(os.getenv("UNKNOWN_PLANT_THRESHOLD", "0.3"))  # Top-1 probability below this -> "unknown"
+
 class MedicinalLeafPredictor:
-    def __init__(self, model_path):
+    def __init__(self, model_path, backend=None):
+        """`backend` is a backend name for `load_backend` or an already loaded backend (e.g. the model server's)."""
         print("🔄 Loading EfficientNet model...")
-        self.model = load_model(model_path, compile=False)
+        self.backend = load_backend(model_path, backend) if backend is None or isinstance(backend, str) else backend
         self.class_names = ['Aloevera', 'Amla', 'Amruthaballi', 'Arali', 'Astma_weed', 'Badipala', 'Balloon_Vine', 
                            'Bamboo', 'Beans', 'Betel', 'Bhrami', 'Bringaraja', 'Caricature', 'Castor', 
                            'Catharanthus', 'Chakte', 'Chilly', 'Citron lime (herelikai)', 'Coffee', 
@@ -53,184 +98,545 @@ class MedicinalLeafPredictor:
                            'Pomoegranate', 'Pumpkin', 'Raddish', 'Rose', 'Sampige', 'Sapota', 'Seethaashoka', 
                            'Seethapala', 'Spinach1', 'Tamarind', 'Taro', 'Tecoma', 'Thumbe', 'Tomato', 'Tulsi', 
                            'Turmeric', 'ashoka', 'camphor', 'kamakasturi', 'kepala']
-        print(f"✅ Plant Model loaded!")
+        print(f"✅ Plant Model loaded! (backend: {self.backend.name})")
     
     def resize_with_padding(self, img, target_size=(224, 224)):
-        original_w, original_h = img.size
-        target_w, target_h = target_size
-        scale = min(target_w / original_w, target_h / original_h)
-        new_w = int(original_w * scale)
-        new_h = int(original_h * scale)
-        resized = img.resize((new_w, new_h), Image.BILINEAR)
-        padded = Image.new("RGB", target_size, (0, 0, 0))
-        padded.paste(resized, ((target_w - new_w) // 2, (target_h - new_h) // 2))
-        return padded
-    
-    def preprocess_image(self, img_path):
-        image = Image.open(img_path).convert("RGBA")
-        image.load()
-        removed_bg = remove(image)
-        black_bg = Image.new("RGBA", removed_bg.size, (0, 0, 0, 255))
-        merged = Image.alpha_composite(black_bg, removed_bg).convert("RGB")
-        np_img = np.array(merged)
-        mask = np.any(np_img != [0, 0, 0], axis=-1)
-        coords = np.column_stack(np.where(mask))
-        if coords.size == 0: return self.resize_with_padding(merged, (224, 224)) # Fallback
-        y_min, x_min = coords.min(axis=0)
-        y_max, x_max = coords.max(axis=0)
-        pad = 10
-        cropped = merged.crop((max(0, x_min-pad), max(0, y_min-pad), min(merged.width, x_max+pad), min(merged.height, y_max+pad)))
-        final_image = self.resize_with_padding(cropped, (224, 224))
-        img_array = np.array(final_image, dtype=np.float32)
-        img_array = np.expand_dims(img_array, axis=0)
-        return preprocess_input(img_array)
-
-    def predict(self, img_path):
+        return preprocessing.resize_with_padding(img, target_size)
+
+    def preprocess_image(self, image):
+        """Background removal + crop + letterbox; returns a raw float32 224x224x3 array.
+
+        `image` may be a file path, raw bytes / memoryview or a binary file-like object.
+        """
+        return preprocessing.preprocess(image)
+
+    def top_predictions(self, predictions, k=5, mode=TTA_MODE):
+        top_indices = tta.top_k(predictions, k)
+        confidence = float(predictions[top_indices[0]])
+        return {
+            'success': True,
+            'predictions': [{'label': self.class_names[i], 'score': float(predictions[i])} for i in top_indices],
+            'confidence': confidence,
+            'unknown': confidence < UNKNOWN_PLANT_THRESHOLD,  # Probably not one of the plants we know
+            'mode': mode,
+        }
+
+    def predict_probabilities(self, tensors):
+        """Run one forward pass over preprocessed 224x224x3 tensors and return a probability row per tensor."""
+        BATCH_SIZE.observe(len(tensors))
+        batch = np.stack(tensors).astype(np.float32, copy=False)
+        with time_stage("model_predict"):
+            return list(self.backend.predict(batch))
+
+    def predict_batch(self, tensors):
+        """`predict_probabilities` with a top-5 result per tensor."""
+        return [self.top_predictions(p, mode="fast") for p in self.predict_probabilities(tensors)]
+
+    def predict_views(self, tensor, mode=TTA_MODE):
+        """Top-5 for one tensor from the fused probabilities of all its `mode` views, in one forward pass."""
+        return self.top_predictions(tta.fuse(self.predict_probabilities(tta.augment(tensor, mode))), mode=mode)
+
+    def predict(self, image, mode=TTA_MODE):
         try:
-            img_array = self.preprocess_image(img_path)
-            predictions = self.model.predict(img_array, verbose=0)[0]
-            top_indices = np.argsort(predictions)[-5:][::-1]
-            return {
-                'success': True,
-                'predictions': [{'label': self.class_names[i], 'score': float(predictions[i])} for i in top_indices]
-            }
+            return self.predict_views(self.preprocess_image(image), mode)
         except Exception as e:
+            record_error("identify", e)
             return {'success': False, 'error': str(e)}
 
 # --- 2. RAG Symptom Checker Setup ---
-class RAGSystem:
-    def __init__(self):
-        print("🔄 Initializing RAG System...")
-        
-        # Load API Key securely from the loaded environment
-        self.pplx_key = os.getenv("PERPLEXITY_API_KEY")
-        
-        if not self.pplx_key:
-            print("❌ Error: PERPLEXITY_API_KEY not found in .env file")
-            
-        self.embedding_func = HuggingFaceEmbeddings(
-            model_name="sentence-transformers/all-MiniLM-L6-v2", 
-            model_kwargs={'device':'cpu'}
-        )
-        self.vector_db = Chroma(
-            persist_directory="./chroma_db_nccn", 
-            embedding_function=self.embedding_func
+# Retrieval, prompting and the LLM client live in rag_service.RAGService; one instance is shared
+# with chroma_db_nccn/rag.py so the embedding model and vector store are only loaded once.
+RAG_RELOAD_TOKEN = os.getenv("RAG_RELOAD_TOKEN")  # POST /api/rag/reload needs a matching X-Reload-Token; disabled when unset
+
+# --- Global Instances ---
+predictor = None
+inference_batcher = None  # Micro-batches concurrent /api/identify requests into one model.predict
+preprocess_pool = None  # Process pool running rembg + crop/resize off the event loop
+batch_slots = None  # Shared by all /api/identify/batch requests so they leave pool room for single images
+prediction_cache = None  # Results for repeated uploads, keyed on upload bytes / perceptual hash
+
+# .keras (default), or a .tflite / .onnx export from convert_model.py
+PLANT_MODEL_PATH = os.getenv("PLANT_MODEL_PATH", "efficientnet_b0_final_nb.keras")
+PLANT_MODEL_BACKEND = os.getenv("PLANT_MODEL_BACKEND")  # Inferred from the extension when unset
+rag = None  # The shared rag_service.RAGService
+answer_cache = None  # Semantic cache of remedy answers for near-duplicate symptom queries
+
+startup_manager = StartupManager()
+
+# --- Metrics read from live objects at scrape time ---
+def _cache_stat(cache, field):
+    return cache.stats()[field] if cache else None
+
+REGISTRY.register(CallbackGauge("swasth_inference_queue_depth", "Images waiting for the next model batch",
+                                lambda: inference_batcher.queue_depth if inference_batcher else None))
+REGISTRY.register(CallbackGauge("swasth_preprocess_in_flight", "Images queued or running in the preprocessing pool",
+                                lambda: preprocess_pool.in_flight if preprocess_pool else None))
+REGISTRY.register(CallbackGauge("swasth_preprocess_capacity", "Preprocessing queue limit before requests get 503",
+                                lambda: preprocess_pool.max_pending if preprocess_pool else None))
+REGISTRY.register(CallbackGauge("swasth_prediction_cache_hit_ratio", "Prediction cache hit ratio since start",
+                                lambda: _cache_stat(prediction_cache, "hit_ratio")))
+REGISTRY.register(CallbackGauge("swasth_prediction_cache_entries", "Entries in the in-memory prediction cache",
+                                lambda: _cache_stat(prediction_cache, "entries")))
+REGISTRY.register(CallbackGauge("swasth_answer_cache_hit_ratio", "Semantic answer cache hit ratio since start",
+                                lambda: _cache_stat(answer_cache, "hit_ratio")))
+REGISTRY.register(CallbackGauge("swasth_answer_cache_entries", "Entries in the semantic answer cache",
+                                lambda: _cache_stat(answer_cache, "entries")))
+REGISTRY.register(CallbackGauge("swasth_admission_active", "Requests holding an admission slot",
+                                lambda: {(l.name,): l.active for l in admission_limiters.values()},
+                                labelnames=["endpoint"]))
+REGISTRY.register(CallbackGauge("swasth_admission_queued", "Requests waiting for an admission slot",
+                                lambda: {(l.name,): l.queued for l in admission_limiters.values()},
+                                labelnames=["endpoint"]))
+REGISTRY.register(CallbackGauge("swasth_component_ready", "1 once a startup component is loaded and warmed up",
+                                lambda: {(name,): float(c.state == "ready") for name, c in startup_manager.components.items()},
+                                labelnames=["component"]))
+
+def _load_plant_model():
+    models = model_server.connect()  # Set up by serve.py: one plant model for every worker
+    return MedicinalLeafPredictor(PLANT_MODEL_PATH, model_server.RemoteBackend(models) if models else PLANT_MODEL_BACKEND)
+
+def _warm_plant_model(model):
+    # Trace the graph / initialise the session for the shapes we will actually see. Straight to
+    # the backend, so the batch-size and model_predict metrics only count real requests.
+    view_counts = {len(views) for views in tta.MODES.values()}
+    for size in sorted({1, int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "32")), *view_counts}):
+        model.backend.predict(np.zeros((size, 224, 224, 3), dtype=np.float32))
+
+def _publish_plant_model(model):
+    global predictor, inference_batcher, prediction_cache
+    inference_batcher = BatchScheduler(
+        model.predict_probabilities,
+        max_batch_size=int(os.getenv("INFERENCE_MAX_BATCH_SIZE", "32")),
+        max_wait_ms=float(os.getenv("INFERENCE_MAX_WAIT_MS", "5")),
+        name="plant-inference",
+    )
+    inference_batcher.start()
+    print(f"✅ Inference batching enabled (max batch {inference_batcher.max_batch_size}, max wait {inference_batcher.max_wait * 1000:.0f} ms)")
+    if os.getenv("PREDICTION_CACHE", "1") == "1":
+        prediction_cache = PredictionCache(
+            PLANT_MODEL_PATH,
+            max_entries=int(os.getenv("PREDICTION_CACHE_SIZE", "4096")),
+            max_bytes=int(os.getenv("PREDICTION_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+            ttl_seconds=int(os.getenv("PREDICTION_CACHE_TTL", str(7 * 24 * 3600))),
+            persist_path=(PLANT_MODEL_PATH + ".predcache.sqlite3") if os.getenv("PREDICTION_CACHE_PERSIST") == "1" else None,
+            variant=f"{preprocessing.pipeline_signature()}|unknown<{UNKNOWN_PLANT_THRESHOLD:g}",
         )
-        
-        self.client = OpenAI(
-            api_key=self.pplx_key,
-            base_url="https://api.perplexity.ai"
+        print(f"✅ Prediction cache enabled (persistent: {prediction_cache.persist_path is not None})")
+    predictor = model
+
+async def _start_preprocess_pool():
+    global preprocess_pool, batch_slots
+    models = model_server.connect()
+    if models:
+        pool = model_server.RemotePreprocessPool(models)  # Shared by every serve.py worker
+    else:
+        pool = PreprocessPool(
+            workers=int(os.getenv("PREPROCESS_WORKERS", "0")) or None,
+            max_pending=int(os.getenv("PREPROCESS_MAX_PENDING", "0")) or None,
+            threads=int(os.getenv("PREPROCESS_THREADS", "0")) or None,
         )
-        print("✅ RAG System ready!")
+    pool.start()
+    preprocess_pool = pool  # Published early so shutdown can always stop the workers
+    # Batches together may hold at most half the preprocessing queue, however many run at once
+    batch_slots = asyncio.Semaphore(max(1, pool.max_pending // 2))
+    print(f"✅ Preprocessing pool started ({pool.workers} workers, queue limit {pool.max_pending}, "
+          f"{preprocessing.pipeline_signature()})")
+    return pool
 
-    def get_remedy(self, query: str):
-        if not self.pplx_key:
-             return "Configuration Error: API Key missing on server. Please check .env file."
+async def _warm_preprocess_pool(pool):
+    # One small job per worker loads rembg's weights and runs its first ONNX inference. The model
+    # server warms its shared pool itself, so there one job only checks that it answers.
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (40, 140, 60)).save(buffer, format="PNG")
+    jobs = 1 if isinstance(pool, model_server.RemotePreprocessPool) else pool.workers
+    await asyncio.gather(*(pool.run(buffer.getvalue()) for _ in range(jobs)))
 
-        try:
-            # 1. Retrieve Context
-            docs = self.vector_db.similarity_search(query, k=3)
-            context = "\n".join([doc.page_content for doc in docs])
-            
-            if not context.strip():
-                return "I couldn't find specific ayurvedic data for this in my database. However, broadly speaking..."
-
-            # 2. Generate Answer
-            messages = [
-                {
-                    "role": "system",
-                    "content": (
-                        "You are an expert Ayurvedic doctor. Answer ONLY using the medical context provided below. "
-                        "If the context is insufficient, state that clearly. "
-                        "Use simple language suitable for patients/kids. "
-                        "Format your answer strictly as:\n"
-                        "1. **Remedy & Preparation**\n2. **Dosage**\n3. **Suggestions**\n4. **Severity**\n\n"
-                        f"Medical Context:\n{context}"
-                    )
-                },
-                {"role": "user", "content": query}
-            ]
-            
-            response = self.client.chat.completions.create(
-                model="sonar-pro", 
-                messages=messages,
-                temperature=0.3,
-                max_tokens=1000
-            )
-            return response.choices[0].message.content
-        except Exception as e:
-            print(f"RAG Error: {e}")
-            return f"Sorry, I encountered an error consulting the knowledge base: {str(e)}"
+def _load_rag():
+    from rag_service import get_service
+    return get_service()
 
-# --- Global Instances ---
-predictor = None
-rag_system = None
-rag_module = None  # Optional external rag utilities (chroma_db_nccn/rag.py)
+def _warm_rag(service):
+    service.warmup()
+
+def _publish_rag(service):
+    global rag
+    rag = service
+    init_answer_cache()
 
 @app.on_event("startup")
 async def startup():
-    global predictor, rag_system
-    # Load Plant Model
-    if os.path.exists("efficientnet_b0_final_nb.keras"):
-        predictor = MedicinalLeafPredictor("efficientnet_b0_final_nb.keras")
-    
-    # Load RAG System or external RAG utilities
-    if os.path.exists("./chroma_db_nccn"):
-        try:
-            import importlib
-            rag_module = importlib.import_module("chroma_db_nccn.rag")
-            print("✅ External RAG utilities loaded from chroma_db_nccn/rag.py")
-        except Exception as e:
-            print(f"⚠️ Failed to import external RAG module: {e}. Falling back to built-in RAGSystem.")
-            try:
-                rag_system = RAGSystem()
-                print("✅ Built-in RAG System initialized")
-            except Exception as e2:
-                print(f"❌ Failed to initialize built-in RAG System: {e2}")
-    else:
+    model_present = os.path.exists(PLANT_MODEL_PATH)
+    kb_present = os.path.exists("./chroma_db_nccn")
+    if not kb_present:
         print("⚠️ Warning: chroma_db_nccn folder not found. RAG features will be disabled.")
 
+    startup_manager.register("plant_model", _load_plant_model, _warm_plant_model, _publish_plant_model, enabled=model_present)
+    startup_manager.register("preprocess_pool", _start_preprocess_pool, _warm_preprocess_pool, enabled=model_present)
+    startup_manager.register("rag", _load_rag, _warm_rag, _publish_rag, enabled=kb_present)
+    startup_manager.start()
+
+    # Default: accept traffic immediately and report progress on /readyz
+    if os.getenv("STARTUP_BLOCKING") == "1":
+        await startup_manager.wait()
+
+def init_answer_cache():
+    global answer_cache
+    if rag and os.getenv("SEMANTIC_CACHE", "1") == "1":
+        answer_cache = SemanticAnswerCache(
+            rag.embed_query,  # Reuse the MiniLM already in memory
+            kb_path="./chroma_db_nccn",
+            persist_path=os.getenv("SEMANTIC_CACHE_PATH", "./semantic_cache.sqlite3") or None,
+            threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92")),
+            max_entries=int(os.getenv("SEMANTIC_CACHE_SIZE", "2000")),
+            ttl_seconds=int(os.getenv("SEMANTIC_CACHE_TTL", str(24 * 3600))),
+            aembed_fn=rag.aembed_query,  # Batched and bounded alongside retrieval
+        )
+        print(f"✅ Semantic answer cache enabled ({answer_cache.stats()['entries']} entries restored)")
+
+@app.on_event("shutdown")
+async def shutdown():
+    await startup_manager.cancel()
+    if inference_batcher:
+        await inference_batcher.stop()
+    if preprocess_pool:
+        preprocess_pool.shutdown()
+    if rag:
+        await rag.aclose()
+
 # --- API Endpoints ---
 
+UPLOAD_CHUNK_BYTES = 256 * 1024
+# Off by default: an exact dHash match can still come from a different photo of a different plant
+USE_PERCEPTUAL_CACHE = os.getenv("PREDICTION_CACHE_PHASH", "0") == "1"
+
+async def read_upload(file: UploadFile, max_bytes: int = MAX_UPLOAD_BYTES) -> bytes:
+    """Stream an upload into memory in chunks, rejecting it with 413 once it exceeds `max_bytes`."""
+    if max_bytes and file.size is not None and file.size > max_bytes:
+        raise HTTPException(413, f"Upload too large (limit {max_bytes} bytes)")
+    chunks, total = [], 0
+    with time_stage("upload_read"):
+        while chunk := await file.read(UPLOAD_CHUNK_BYTES):
+            total += len(chunk)
+            if max_bytes and total > max_bytes:
+                raise HTTPException(413, f"Upload too large (limit {max_bytes} bytes)")
+            chunks.append(chunk)
+    if not total:
+        raise HTTPException(400, "Empty upload")
+    return b"".join(chunks)
+
+def resolve_tta_mode(mode: Optional[str]) -> str:
+    mode = mode or TTA_MODE
+    if mode not in tta.MODES:
+        raise HTTPException(400, f"Unknown mode '{mode}' (expected one of: {', '.join(tta.MODES)})")
+    return mode
+
+def _mode_key(key, mode):
+    # Fast results keep the plain key so existing cache entries stay valid
+    return key if not key or mode == "fast" else f"{key}|tta:{mode}"
+
+async def _cache_call(method, *args, **kwargs):
+    """Best-effort prediction cache access: SQLite runs off the event loop and errors only get logged.
+
+    A locked database (e.g. serve.py workers sharing the persisted file) must not fail a request
+    whose inference would succeed.
+    """
+    try:
+        if prediction_cache.persist_path:
+            return await asyncio.to_thread(method, *args, **kwargs)
+        return method(*args, **kwargs)
+    except Exception as e:
+        record_error("prediction_cache", e)
+        print(f"Prediction cache error: {e}")
+        return None
+
+async def identify_bytes(data: bytes, mode: str = TTA_MODE):
+    """Cache lookup -> preprocessing pool -> batched inference for one image. Raises PoolSaturated.
+
+    In the balanced / accurate modes every augmented view goes into the same model batch
+    and their probabilities are averaged.
+    """
+    key = _mode_key(content_key(data), mode) if prediction_cache else None
+    if key and (cached := await _cache_call(prediction_cache.get, key, count_miss=not USE_PERCEPTUAL_CACHE)):
+        return cached
+    img_array = await within_deadline(preprocess_pool.run(data))
+    pkey = _mode_key(perceptual_key(img_array), mode) if prediction_cache and USE_PERCEPTUAL_CACHE else None
+    if pkey and (cached := await _cache_call(prediction_cache.get, pkey)):
+        await _cache_call(prediction_cache.put, key, cached)
+        return cached
+    views = tta.augment(img_array, mode)
+    if len(views) == 1:
+        probabilities = await within_deadline(inference_batcher.submit(views[0]))
+    else:
+        probabilities = tta.fuse(await within_deadline(inference_batcher.submit_many(views)))
+    result = predictor.top_predictions(probabilities, mode=mode)
+    if key and result.get('success'):
+        await _cache_call(prediction_cache.put, key, result)
+        if pkey: await _cache_call(prediction_cache.put, pkey, result)
+    return result
+
+def require_plant_model():
+    if predictor and preprocess_pool and startup_manager.state("preprocess_pool") == "ready":
+        return
+    state = startup_manager.state("plant_model")
+    if state in ("pending", "loading", "warming") or startup_manager.state("preprocess_pool") in ("pending", "loading", "warming"):
+        raise HTTPException(503, "Plant model is still loading", headers={"Retry-After": "5"})
+    raise HTTPException(503, "Plant model not loaded")
+
 @app.post("/api/identify")
-async def identify_plant(file: UploadFile = File(...)):
-    if not predictor: raise HTTPException(503, "Plant model not loaded")
-    temp_filename = f"temp_{file.filename}"
+async def identify_plant(file: UploadFile = File(...), mode: Optional[str] = None):
+    """Top-5 plants for one leaf photo. `?mode=fast|balanced|accurate` trades latency for accuracy."""
+    require_plant_model()
+    mode = resolve_tta_mode(mode)
+    data = await read_upload(file)
     try:
-        with open(temp_filename, "wb") as buffer: shutil.copyfileobj(file.file, buffer)
-        return predictor.predict(temp_filename)
-    finally:
-        if os.path.exists(temp_filename): os.remove(temp_filename)
+        return await identify_bytes(data, mode)
+    except PoolSaturated as e:
+        raise HTTPException(503, str(e), headers={"Retry-After": "1"})
+    except DeadlineExceeded:
+        raise  # 504 from AdmissionMiddleware
+    except Exception as e:
+        record_error("identify", e)
+        print(f"Identify error: {e}")
+        return {'success': False, 'error': str(e)}
+
+MAX_BATCH_ITEMS = int(os.getenv("MAX_BATCH_ITEMS", "500"))
+MAX_ZIP_BYTES = int(os.getenv("MAX_ZIP_BYTES", str(512 * 1024 * 1024)))
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp", ".bmp", ".heic")
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _is_zip(file: UploadFile):
+    return (file.filename or "").lower().endswith(".zip") or file.content_type in ("application/zip", "application/x-zip-compressed")
+
+async def _expand_batch(files: List[UploadFile]):
+    """Flatten uploads (and image entries of any zip archives) into (filename, loader) pairs.
+
+    Loaders read lazily so a few hundred photos are never all held in memory at once.
+    """
+    items = []
+    for file in files:
+        if not _is_zip(file):
+            items.append((file.filename, lambda file=file: read_upload(file)))
+            continue
+        try:
+            archive = zipfile.ZipFile(io.BytesIO(await read_upload(file, max_bytes=MAX_ZIP_BYTES)))
+        except zipfile.BadZipFile:
+            raise HTTPException(400, f"{file.filename} is not a valid zip archive")
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+            if info.file_size > MAX_UPLOAD_BYTES:
+                items.append((info.filename, None))  # Reported as a per-item error
+                continue
+            async def load(archive=archive, info=info):
+                return await asyncio.to_thread(archive.read, info)
+            items.append((info.filename, load))
+    if len(items) > MAX_BATCH_ITEMS:
+        raise HTTPException(413, f"Too many images in batch ({len(items)} > {MAX_BATCH_ITEMS})")
+    if not items:
+        raise HTTPException(400, "No images in upload")
+    return items
+
+async def _identify_item(index, filename, loader, limit, mode):
+    item = {'index': index, 'filename': filename}
+    async with limit:
+        try:
+            if loader is None:
+                raise HTTPException(413, f"Upload too large (limit {MAX_UPLOAD_BYTES} bytes)")
+            data = await loader()
+            # Other traffic may fill the preprocessing queue; back off instead of failing the item
+            for attempt in range(20):
+                try:
+                    return {**item, **await identify_bytes(data, mode)}
+                except PoolSaturated:
+                    await asyncio.sleep(min(0.05 * 2 ** attempt, 1.0))
+            return {**item, 'success': False, 'error': 'Server busy, preprocessing queue full'}
+        except HTTPException as e:
+            return {**item, 'success': False, 'error': e.detail}
+        except Exception as e:
+            record_error("identify_batch", e)
+            return {**item, 'success': False, 'error': str(e)}
+
+@app.post("/api/identify/batch")
+async def identify_batch(request: Request, files: List[UploadFile] = File(...), format: str = "ndjson",
+                         mode: Optional[str] = None):
+    """Identify many leaf photos (or zips of them), streaming each result as it finishes.
+
+    Results are NDJSON lines by default, or Server-Sent Events with `?format=sse` /
+    `Accept: text/event-stream`. Each carries `index` and `filename` plus the usual
+    `{'success', 'predictions'}` / `{'success': False, 'error'}` body, in completion order.
+    `mode` applies to every image, as for /api/identify.
+    """
+    require_plant_model()
+    mode = resolve_tta_mode(mode)
+    sse = format == "sse" or "text/event-stream" in request.headers.get("accept", "")
+    items = await _expand_batch(files)
+
+    async def stream():
+        tasks = [asyncio.create_task(_identify_item(i, name, loader, batch_slots, mode)) for i, (name, loader) in enumerate(items)]
+        ok = 0
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                ok += bool(result.get('success'))
+                yield _sse("result", result) if sse else json.dumps(result) + "\n"
+            summary = {'done': True, 'total': len(items), 'succeeded': ok, 'failed': len(items) - ok}
+            yield _sse("done", summary) if sse else json.dumps(summary) + "\n"
+        finally:
+            # Client went away: don't keep burning CPU on the rest of the batch
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="text/event-stream" if sse else "application/x-ndjson")
+
+@app.get("/api/identify/cache")
+async def identify_cache_stats():
+    return prediction_cache.stats() if prediction_cache else {"enabled": False}
 
 class RemedyRequest(BaseModel):
     symptoms: str
+    stream: bool = False  # Stream `context` / `token` / `done` events instead of one JSON body
+    prompt: Optional[str] = None  # One of rag_service.PROMPTS; the service default when unset
 
-@app.post("/api/remedy")
-async def get_remedy(request: RemedyRequest):
-    global rag_system, rag_module
+OFFLINE_RESPONSE = "System is offline (Knowledge base not found). Please check backend setup."
+
+async def cached_answer(symptoms: str, prompt=None):
+    """(answer, query vector) from the semantic cache; answer is None on a miss or when the cache is off.
 
-    # Prefer external module (allows rapid updates in chroma_db_nccn folder)
-    if rag_module:
+    On a miss the vector goes on to retrieval, so the query is embedded once. MiniLM's embeddings
+    are already unit length, so the cache's normalised copy is the same vector retrieval would use.
+    """
+    # Cached answers were written with the default prompt
+    if not answer_cache or prompt:
+        return None, None
+    try:
+        answer, _, vector = await answer_cache.alookup(symptoms)
+        return answer, vector
+    except Exception as e:
+        record_error("semantic_cache", e)
+        print(f"Semantic cache error: {e}")
+        return None, None
+
+async def remember_answer(symptoms: str, answer: str, vector, prompt=None):
+    if answer_cache and answer and not prompt:
         try:
-            context = rag_module.get_relevant(request.symptoms)
-            if not context.strip():
-                return {"response": "I couldn't find specific ayurvedic data for this in my database. However, broadly speaking..."}
-            answer = rag_module.generate_answer(request.symptoms, context)
-            return {"response": answer}
+            await answer_cache.astore(symptoms, answer, vector)
         except Exception as e:
-            print(f"External RAG error: {e}. Falling back to built-in RAG system.")
+            record_error("semantic_cache", e)
+            print(f"Semantic cache error: {e}")
+
+async def remedy_events(symptoms: str, prompt=None):
+    """Streaming counterpart of /api/remedy as (event, data) pairs."""
+    answer, vector = await cached_answer(symptoms, prompt)
+    if answer is not None:
+        yield "context", {"found": True, "cached": True}
+        yield "token", {"text": answer}
+        yield "done", {"response": answer}
+        return
 
-    # Fallback to built-in RAG system
-    if not rag_system:
-        return {"response": "System is offline (Knowledge base not found). Please check backend setup."}
+    if not rag:
+        yield "done", {"response": OFFLINE_RESPONSE}
+        return
+    async for event, data in rag.astream_events(symptoms, prompt, vector):
+        if event == "done" and data.pop("generated", False):
+            await remember_answer(symptoms, data["response"], vector, prompt)
+        yield event, data
+
+def stream_remedy(symptoms: str, sse: bool = True, prompt=None):
+    async def body():
+        try:
+            async for event, data in remedy_events(symptoms, prompt):
+                yield _sse(event, data) if sse else json.dumps({"event": event, **data}) + "\n"
+        except Exception as e:
+            record_error("rag", e)
+            print(f"RAG stream error: {e}")
+            error = {"error": f"Sorry, I encountered an error consulting the knowledge base: {str(e)}"}
+            yield _sse("error", error) if sse else json.dumps({"event": "error", **error}) + "\n"
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream" if sse else "application/x-ndjson",
+        # Stop proxies from buffering the stream and defeating the point
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.post("/api/remedy")
+async def get_remedy(request: RemedyRequest, format: str = "sse"):
+    if request.prompt is not None and request.prompt not in PROMPTS:
+        raise HTTPException(status_code=400, detail=f"Unknown prompt '{request.prompt}'. Choose from: {', '.join(PROMPTS)}")
 
-    answer = rag_system.get_remedy(request.symptoms)
+    if request.stream:
+        return stream_remedy(request.symptoms, sse=format != "ndjson", prompt=request.prompt)
+
+    answer, vector = await cached_answer(request.symptoms, request.prompt)
+    if answer is not None:
+        return {"response": answer}
+
+    if not rag:
+        return {"response": OFFLINE_RESPONSE}
+    if not rag.api_key:
+        return {"response": MISSING_KEY_RESPONSE}
+
+    try:
+        answer = await rag.aanswer(request.symptoms, request.prompt, vector)
+    except DeadlineExceeded:
+        raise  # 504 from AdmissionMiddleware
+    except Exception as e:
+        return {"response": rag.error_message(e)}
+    if answer is None:
+        return {"response": NO_CONTEXT_RESPONSE}
+    await remember_answer(request.symptoms, answer, vector, request.prompt)
     return {"response": answer}
 
+@app.get("/api/remedy/cache")
+async def remedy_cache_stats():
+    return answer_cache.stats() if answer_cache else {"enabled": False}
+
 
 @app.get("/api/rag/status")
 async def rag_status():
-    return {"loaded": bool(rag_module or rag_system), "source": ("external" if rag_module else ("built-in" if rag_system else "none"))}
+    component = startup_manager.components.get("rag")
+    return {
+        "loaded": rag is not None,
+        **(rag.status() if rag else {}),
+        **({"startup": component.status()} if component else {}),
+    }
+
+@app.post("/api/rag/reload")
+async def rag_reload(x_reload_token: Optional[str] = Header(None)):
+    """Reopen the knowledge base (e.g. after ingest.py) without restarting the server."""
+    if not RAG_RELOAD_TOKEN:
+        raise HTTPException(status_code=404, detail="Reload is disabled; set RAG_RELOAD_TOKEN to enable it")
+    if not x_reload_token or not hmac.compare_digest(x_reload_token.encode(), RAG_RELOAD_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="Invalid reload token")
+    if not rag:
+        raise HTTPException(status_code=503, detail="RAG is not loaded")
+    try:
+        status = await rag.areload()
+    except Exception as e:
+        record_error("rag", e)
+        raise HTTPException(status_code=500, detail=f"Reload failed: {e}")
+    if answer_cache:
+        answer_cache.clear()
+    return status
+
+@app.get("/metrics")
+async def metrics():
+    """Prometheus text exposition of stage timings, request counters, queue depths and cache ratios."""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving, whatever the models are doing."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once every enabled component is loaded and warmed up, 503 until then."""
+    status = startup_manager.status()
+    if not status["ready"]:
+        return JSONResponse(status, status_code=503, headers={"Retry-After": "5"})
+    return status
 
 if __name__ == "__main__":
     import uvicorn
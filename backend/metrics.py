@@ -0,0 +1,271 @@
+"""Minimal Prometheus-style metrics: counters, gauges and histograms rendered in text exposition format.
+
+Usage:
+    from metrics import time_stage, REQUESTS
+    with time_stage("rembg"):
+        ...
+"""
+import bisect
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values)) + (extra or [])
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = "untyped"
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Gauge(Counter):
+    type = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class CallbackGauge(_Metric):
+    """Gauge (or counter) whose value is read from `fn` at scrape time.
+
+    `fn` returns a number, None (series omitted), or a dict of label-value tuple -> number.
+    """
+
+    def __init__(self, name, help, fn, labelnames=(), type="gauge"):
+        super().__init__(name, help, labelnames)
+        self.fn = fn
+        self.type = type
+
+    def render(self):
+        try:
+            value = self.fn()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {(): value}
+        return [f"{self.name}{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in value.items()]
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def render(self):
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._series.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics.values():
+            body = metric.render()
+            if body:
+                lines += metric.header() + body
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "swasth_stage_seconds", "Time spent in each hot-path stage", ["stage"]))
+REQUESTS = REGISTRY.register(Counter(
+    "swasth_requests_total", "HTTP requests handled", ["endpoint", "status"]))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "swasth_request_seconds", "End-to-end request latency, including streamed bodies", ["endpoint"]))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    "swasth_requests_in_flight", "Requests currently being handled", ["endpoint"]))
+ERRORS = REGISTRY.register(Counter(
+    "swasth_errors_total", "Errors caught on the hot paths", ["component", "error"]))
+BATCH_SIZE = REGISTRY.register(Histogram(
+    "swasth_inference_batch_size", "Images per model.predict call", buckets=(1, 2, 4, 8, 16, 32, 64, 128)))
+PROMPT_TOKENS = REGISTRY.register(Histogram(
+    "swasth_prompt_tokens", "Estimated prompt tokens per LLM call", buckets=(128, 256, 512, 1024, 1536, 2048, 3072, 4096, 8192)))
+CONTEXT_CHUNKS = REGISTRY.register(Counter(
+    "swasth_context_chunks_total", "Retrieved chunks by what context assembly did with them", ["outcome"]))
+ADMISSIONS = REGISTRY.register(Counter(
+    "swasth_admissions_total", "Admission decisions per endpoint (admitted, queued, rejected, cancelled, deadline)",
+    ["endpoint", "outcome"]))
+
+
+def time_stage(stage):
+    """Context manager recording the duration of `stage` in swasth_stage_seconds."""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def record_error(component, error):
+    ERRORS.inc(component=component, error=type(error).__name__)
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests, in-flight gauges and latency for the given paths.
+
+    Latency is measured until the last body chunk is sent, so streamed responses are
+    timed in full. Requests carrying `X-Profile: 1` (with PROFILING_ENABLED=1), or a
+    random PROFILE_SAMPLE_RATE fraction of them, are run under cProfile and dumped to
+    PROFILE_DIR; the dump path comes back in the `X-Profile-File` response header.
+    cProfile only sees the event-loop thread, so work in the preprocessing processes
+    and executor threads shows up as time waiting on futures.
+    """
+
+    def __init__(self, app, paths):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.profiling_enabled = os.getenv("PROFILING_ENABLED") == "1"
+        self.sample_rate = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+        self.profile_dir = os.getenv("PROFILE_DIR", "./profiles")
+        self._profile_lock = threading.Lock()
+
+    def _wants_profile(self, scope):
+        if not self.profiling_enabled:
+            return False
+        headers = dict(scope.get("headers") or [])
+        if headers.get(b"x-profile") == b"1":
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        endpoint = scope.get("path") if scope["type"] == "http" else None
+        if endpoint not in self.paths:
+            return await self.app(scope, receive, send)
+
+        # One profile at a time: cProfile can't nest and concurrent requests share the loop thread
+        profiler = None
+        if self._wants_profile(scope) and self._profile_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+        profile_path = None
+        if profiler is not None:
+            os.makedirs(self.profile_dir, exist_ok=True)
+            profile_path = os.path.join(self.profile_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-{endpoint.strip('/').replace('/', '_')}-{os.getpid()}-{random.randrange(1 << 16):04x}.prof")
+
+        status = {"code": 500}
+        start = time.perf_counter()
+        IN_FLIGHT.inc(endpoint=endpoint)
+        finished = False
+
+        def finish():
+            nonlocal finished
+            if finished:
+                return
+            finished = True
+            IN_FLIGHT.dec(endpoint=endpoint)
+            REQUESTS.inc(endpoint=endpoint, status=status["code"])
+            REQUEST_SECONDS.observe(time.perf_counter() - start, endpoint=endpoint)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if profile_path:
+                    message["headers"] = list(message.get("headers", [])) + [(b"x-profile-file", profile_path.encode())]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                finish()
+
+        try:
+            if profiler is not None:
+                profiler.enable()
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(profile_path)
+                self._profile_lock.release()
+            finish()
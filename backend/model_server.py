@@ -0,0 +1,153 @@
+"""
+One process serving the plant model and the rembg preprocessing pool to every serve.py worker.
+
+TensorFlow / ONNX Runtime / TFLite thread pools and rembg's ONNX sessions don't survive
+fork, so without this each forked worker loads its own EfficientNet and starts its own
+pool of rembg processes (each holding U2Net). serve.py starts the server before forking;
+the workers find it through MODEL_SERVER_ADDRESS and call it over a Unix socket
+(multiprocessing.managers), so the plant model is loaded once and a single rembg pool is
+shared, and load-balanced, by all of them.
+
+Each worker still micro-batches its own /api/identify requests; the server runs one
+forward pass at a time with the whole inference thread budget.
+"""
+import asyncio
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import get_context
+from multiprocessing.managers import BaseManager
+
+from PIL import Image
+
+from preprocessing import PreprocessPool, record_timings
+
+ADDRESS_ENV = "MODEL_SERVER_ADDRESS"
+AUTHKEY_ENV = "MODEL_SERVER_AUTHKEY"
+
+_models = None  # The server process's ModelService
+
+
+class ModelService:
+    """Lives in the server process; the manager calls it from one thread per client connection."""
+
+    def __init__(self, model_path, backend, preprocess_workers):
+        from inference_backends import load_backend
+
+        self.backend = load_backend(model_path, backend)
+        self._predict_lock = threading.Lock()  # TFLite interpreters and Keras models aren't shared between threads
+        self.pool = PreprocessPool(workers=preprocess_workers, threads=1,
+                                   max_pending=int(os.getenv("PREPROCESS_MAX_PENDING", "0")) or None)
+        self.pool.start()
+        # Start every rembg process (and load U2Net in it) now rather than on the first requests
+        for job in [self.pool.submit(_blank_png()) for _ in range(self.pool.workers)]:
+            job.result()
+
+    def info(self):
+        return {"backend": self.backend.name, "workers": self.pool.workers, "max_pending": self.pool.max_pending}
+
+    def predict(self, batch):
+        with self._predict_lock:
+            return self.backend.predict(batch)
+
+    def preprocess(self, source):
+        return self.pool.submit(source).result()
+
+    def in_flight(self):
+        return self.pool.in_flight
+
+
+def _blank_png():
+    buffer = io.BytesIO()
+    Image.new("RGB", (64, 64), (40, 140, 60)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+class ModelManager(BaseManager):
+    pass
+
+
+def _get_models():
+    return _models
+
+
+def _init_server(model_path, backend, inference_threads, preprocess_workers):
+    global _models
+    # All workers' forward passes run here, so this process gets the whole inference budget
+    for name in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "TF_NUM_INTRAOP_THREADS", "INFERENCE_THREADS"):
+        os.environ[name] = str(inference_threads)
+    _models = ModelService(model_path, backend, preprocess_workers)
+
+
+ModelManager.register("models", callable=_get_models)
+
+
+def start(model_path, backend=None, inference_threads=1, preprocess_workers=None):
+    """Start the server (returns once the model is loaded) and point child processes at it via the environment."""
+    authkey = os.urandom(32)
+    manager = ModelManager(authkey=authkey, ctx=get_context("spawn"))
+    manager.start(_init_server, (model_path, backend, inference_threads, preprocess_workers))
+    os.environ[ADDRESS_ENV] = manager.address
+    os.environ[AUTHKEY_ENV] = authkey.hex()
+    return manager
+
+
+def connect():
+    """Proxy to the server's ModelService, or None when this process wasn't given one by serve.py."""
+    address = os.getenv(ADDRESS_ENV)
+    if not address:
+        return None
+    manager = ModelManager(address=address, authkey=bytes.fromhex(os.environ[AUTHKEY_ENV]))
+    manager.connect()
+    return manager.models()
+
+
+class RemoteBackend:
+    """Inference backend (see inference_backends.py) that forwards each batch to the model server."""
+
+    def __init__(self, models):
+        self._models = models
+        self.name = f"{models.info()['backend']} via model server"
+
+    def predict(self, batch):
+        return self._models.predict(batch)
+
+
+class RemotePreprocessPool:
+    """`PreprocessPool` whose jobs run in the model server's shared pool.
+
+    `workers` and `max_pending` describe the shared pool; a full pool raises `PoolSaturated`
+    from the server.
+    """
+
+    def __init__(self, models):
+        info = models.info()
+        self._models = models
+        self.workers = info["workers"]
+        self.max_pending = info["max_pending"]
+        self._executor = None
+
+    @property
+    def in_flight(self):
+        return self._models.in_flight()
+
+    def start(self):
+        if self._executor is None:
+            # One blocking call (and manager connection) per job the server could accept
+            self._executor = ThreadPoolExecutor(max_workers=self.max_pending, thread_name_prefix="model-server")
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, source):
+        if self._executor is None:
+            raise RuntimeError("Preprocessing pool is not running")
+        start = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        result, timings = await loop.run_in_executor(self._executor, self._models.preprocess, source)
+        record_timings(start, timings)
+        return result
@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def content_key(data) -> str:
+    """Key for the raw upload bytes."""
+    return "sha256:" + hashlib.sha256(data).hexdigest()
+
+
+def perceptual_key(tensor) -> str:
+    """64-bit difference hash of a preprocessed 224x224x3 tensor.
+
+    Re-encoded or slightly recompressed copies of the same photo usually survive
+    background removal and letterboxing with an identical dHash, so this catches
+    repeats that the byte hash misses.
+    """
+    gray = np.asarray(tensor, dtype=np.float32).mean(axis=-1)
+    h, w = gray.shape
+    # Block-average down to 8 rows x 9 columns
+    row_starts = np.linspace(0, h, 9).astype(int)[:-1]
+    col_starts = np.linspace(0, w, 10).astype(int)[:-1]
+    sums = np.add.reduceat(np.add.reduceat(gray, row_starts, axis=0), col_starts, axis=1)
+    counts = np.outer(np.diff(np.append(row_starts, h)), np.diff(np.append(col_starts, w)))
+    small = sums / counts
+    bits = small[:, 1:] > small[:, :-1]
+    return "dhash:" + np.packbits(bits).tobytes().hex()
+
+
+def model_fingerprint(model_path) -> str:
+    try:
+        st = os.stat(model_path)
+    except OSError:
+        return "missing"
+    return f"{st.st_size}:{st.st_mtime_ns}"
+
+
+class PredictionCache:
+    """LRU + TTL cache of `predict` results, invalidated whenever the model file changes.
+
+    `variant` names anything else the results depend on (e.g. the preprocessing
+    settings); persisted rows stored under a different one are dropped at startup.
+
+    Entries live in an in-memory OrderedDict bounded by `max_entries` and `max_bytes`.
+    With `persist_path` set, they are also written to a SQLite file so they survive
+    restarts; memory misses fall through to it.
+    """
+
+    def __init__(self, model_path, max_entries=4096, max_bytes=32 * 1024 * 1024,
+                 ttl_seconds=7 * 24 * 3600, persist_path=None, variant=""):
+        self.model_path = model_path
+        self.variant = variant
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (stored_at, size, result)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._fingerprint = self._current_fingerprint()
+        self._checked_at = time.monotonic()
+        self._db = None
+        if persist_path:
+            self._open_db()
+
+    def _open_db(self):
+        self._db = sqlite3.connect(self.persist_path, check_same_thread=False, timeout=1.0)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "key TEXT PRIMARY KEY, fingerprint TEXT NOT NULL, stored_at REAL NOT NULL, result TEXT NOT NULL)"
+        )
+        # Rows written against an older model are useless
+        self._db.execute("DELETE FROM predictions WHERE fingerprint != ?", (self._fingerprint,))
+        self._db.commit()
+
+    def _current_fingerprint(self):
+        fingerprint = model_fingerprint(self.model_path)
+        return f"{fingerprint}|{self.variant}" if self.variant else fingerprint
+
+    def _check_model(self):
+        # A stat per second is plenty to notice a model swap
+        now = time.monotonic()
+        if now - self._checked_at < 1.0:
+            return
+        self._checked_at = now
+        fingerprint = self._current_fingerprint()
+        if fingerprint != self._fingerprint:
+            print("🔄 Plant model changed on disk, clearing prediction cache")
+            self._fingerprint = fingerprint
+            self._clear_locked()
+
+    def _write_locked(self, sql, params=()):
+        try:
+            self._db.execute(sql, params)
+            self._db.commit()
+        except sqlite3.Error:
+            # e.g. "database is locked" by another worker: don't leave our transaction open
+            self._db.rollback()
+            raise
+
+    def _clear_locked(self):
+        self._entries.clear()
+        self._bytes = 0
+        if self._db is not None:
+            self._write_locked("DELETE FROM predictions")
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def _expired(self, stored_at):
+        return self.ttl_seconds and time.time() - stored_at > self.ttl_seconds
+
+    def _insert_locked(self, key, stored_at, result, size):
+        if key in self._entries:
+            self._bytes -= self._entries.pop(key)[1]
+        self._entries[key] = (stored_at, size, result)
+        self._bytes += size
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            _, (_, old_size, _) = self._entries.popitem(last=False)
+            self._bytes -= old_size
+            self.evictions += 1
+
+    def get(self, key, count_miss=True):
+        """Cached result for `key`, or None.
+
+        Pass `count_miss=False` when another key will be tried for the same request, so
+        each request counts as one lookup in the hit ratio.
+        """
+        with self._lock:
+            self._check_model()
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, _, result = entry
+                if not self._expired(stored_at):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return result
+                self._bytes -= self._entries.pop(key)[1]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT stored_at, result FROM predictions WHERE key = ? AND fingerprint = ?",
+                    (key, self._fingerprint),
+                ).fetchone()
+                if row is not None and not self._expired(row[0]):
+                    result = json.loads(row[1])
+                    self._insert_locked(key, row[0], result, len(row[1]))
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return result
+
+            if count_miss:
+                self.misses += 1
+            return None
+
+    def put(self, key, result):
+        payload = json.dumps(result)
+        stored_at = time.time()
+        with self._lock:
+            self._check_model()
+            self._insert_locked(key, stored_at, result, len(payload))
+            if self._db is not None:
+                self._write_locked(
+                    "INSERT OR REPLACE INTO predictions (key, fingerprint, stored_at, result) VALUES (?, ?, ?, ?)",
+                    (key, self._fingerprint, stored_at, payload),
+                )
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits / lookups) if lookups else 0.0,
+                "persistent": self._db is not None,
+            }
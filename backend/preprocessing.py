@@ -0,0 +1,383 @@
+import asyncio
+import io
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageFile, ImageFilter
+
+from metrics import observe_stage
+
+ImageFile.LOAD_TRUNCATED_IMAGES = True
+
+TARGET_SIZE = (224, 224)
+CROP_PAD = 10
+
+# --- Segmentation settings (read again in each spawned worker) ---
+REMBG_MODEL = os.getenv("REMBG_MODEL", "u2net")  # u2netp / silueta are several times cheaper
+# "full": rembg.remove on the whole photo; "fast" (opt-in until benchmarks/segmentation.py shows no
+# accuracy loss on real photos): low-res mask, upsampled over the crop only
+SEGMENTATION = os.getenv("SEGMENTATION", "full")
+SEGMENT_SIZE = int(os.getenv("SEGMENT_SIZE", "320"))  # Longest side of the image the mask is predicted on
+WORK_MAX_SIDE = int(os.getenv("WORK_MAX_SIDE", "1024"))  # Longest side the photo is decoded and cropped at
+PLAIN_BACKGROUND_SKIP = os.getenv("PLAIN_BACKGROUND_SKIP", "0") == "1"  # Skip rembg for leaves shot on a plain background
+PLAIN_BACKGROUND_MAX_STD = float(os.getenv("PLAIN_BACKGROUND_MAX_STD", "10"))
+
+# Each worker process keeps its own warm rembg session per model (weights + ONNX session)
+_sessions = {}
+_session_model = REMBG_MODEL
+
+
+def _init_worker(model_name=REMBG_MODEL, threads=None):
+    global _session_model
+    _session_model = model_name
+    if threads:
+        os.environ["OMP_NUM_THREADS"] = str(threads)  # rembg sizes its ONNX Runtime session from this
+    _get_session()
+
+
+def _get_session(model_name=None):
+    model_name = model_name or _session_model
+    if model_name not in _sessions:
+        from rembg import new_session
+        _sessions[model_name] = new_session(model_name)
+    return _sessions[model_name]
+
+
+def pipeline_signature(model_name=REMBG_MODEL):
+    """Short description of the preprocessing settings, so cached predictions follow changes to them."""
+    if SEGMENTATION != "fast":
+        return f"full:{model_name}"
+    return f"fast:{model_name}:{SEGMENT_SIZE}:{WORK_MAX_SIDE}:{int(PLAIN_BACKGROUND_SKIP)}:{PLAIN_BACKGROUND_MAX_STD:g}"
+
+
+def open_image(source):
+    """Open an image from a path, raw bytes / memoryview, or a binary file-like object."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    image = Image.open(source)
+    image.load()
+    return image
+
+
+def resize_with_padding(img, target_size=TARGET_SIZE):
+    original_w, original_h = img.size
+    target_w, target_h = target_size
+    scale = min(target_w / original_w, target_h / original_h)
+    new_w = int(original_w * scale)
+    new_h = int(original_h * scale)
+    resized = img.resize((new_w, new_h), Image.BILINEAR)
+    padded = Image.new("RGB", target_size, (0, 0, 0))
+    padded.paste(resized, ((target_w - new_w) // 2, (target_h - new_h) // 2))
+    return padded
+
+
+# Per-process output buffer reused by the pool workers (results are pickled straight away)
+_out_buffer = None
+
+
+def remove_background(source, timings=None, model_name=None):
+    """Run rembg on `source` and return the RGBA result as a writable uint8 array.
+
+    When `timings` is a dict, the decode and rembg durations (seconds) are stored in it.
+    """
+    from rembg import remove
+
+    start = time.perf_counter()
+    image = open_image(source).convert("RGBA")
+    decoded = time.perf_counter()
+    rgba = np.array(remove(image, session=_get_session(model_name)))
+    if timings is not None:
+        timings["decode"] = decoded - start
+        timings["rembg"] = time.perf_counter() - decoded
+    return rgba
+
+
+def composite_on_black(rgba):
+    """Premultiply RGB by alpha in place (same as alpha_composite onto opaque black) and return the RGB view."""
+    rgb = rgba[..., :3]
+    tmp = rgb.astype(np.uint16)
+    tmp *= rgba[..., 3:4]
+    tmp += 127
+    tmp //= 255
+    rgb[...] = tmp
+    return rgb
+
+
+def _span(flags):
+    """First and last True index of a 1-D boolean array, or None."""
+    if not flags.any():
+        return None
+    return int(flags.argmax()), len(flags) - 1 - int(flags[::-1].argmax())
+
+
+def foreground_bbox(mask):
+    """(y_min, y_max, x_min, x_max) of the non-zero entries of a 2-D mask, or None when it is empty."""
+    rows = _span(mask.any(axis=1))
+    if rows is None:
+        return None
+    return rows + _span(mask.any(axis=0))
+
+
+def letterbox_into(img, out):
+    """Aspect-preserving resize of an HxWx3 uint8 array into the centre of `out`, zero padded."""
+    target_h, target_w = out.shape[:2]
+    original_h, original_w = img.shape[:2]
+    scale = min(target_w / original_w, target_h / original_h)
+    new_w = max(1, int(original_w * scale))
+    new_h = max(1, int(original_h * scale))
+    # PIL's antialiased bilinear keeps the output bit-identical to the reference path
+    resized = np.asarray(Image.fromarray(np.ascontiguousarray(img)).resize((new_w, new_h), Image.BILINEAR))
+    out.fill(0)
+    y_off = (target_h - new_h) // 2
+    x_off = (target_w - new_w) // 2
+    out[y_off:y_off + new_h, x_off:x_off + new_w] = resized
+    return out
+
+
+def crop_and_letterbox(rgba, out=None):
+    """Composite, crop to the leaf and letterbox a background-removed RGBA array.
+
+    The bounding box comes from row/column reductions over the alpha channel, so only
+    the region around the leaf is composited (in place) before the final crop and a
+    single resize into `out` (a float32 224x224x3 array, allocated when not given).
+    """
+    if out is None:
+        out = np.empty((TARGET_SIZE[1], TARGET_SIZE[0], 3), dtype=np.float32)
+    height, width = rgba.shape[:2]
+    alpha_box = foreground_bbox(rgba[..., 3])
+    if alpha_box is None:  # Fallback: fully transparent -> all black
+        out.fill(0)
+        return out
+
+    # Everything outside the alpha box is black once composited; only the box plus padding matters
+    y0, y1, x0, x1 = alpha_box
+    wy0, wy1 = max(0, y0 - CROP_PAD), min(height, y1 + 1 + CROP_PAD)
+    wx0, wx1 = max(0, x0 - CROP_PAD), min(width, x1 + 1 + CROP_PAD)
+    rgb = composite_on_black(rgba[wy0:wy1, wx0:wx1])
+
+    # Low-alpha dark pixels can round to black, so refine the box on the composited colours
+    box = foreground_bbox(rgb[..., 0] | rgb[..., 1] | rgb[..., 2])
+    if box is None:
+        out.fill(0)
+        return out
+    y_min, y_max, x_min, x_max = box[0] + wy0, box[1] + wy0, box[2] + wx0, box[3] + wx0
+    cropped = rgb[max(0, y_min - CROP_PAD) - wy0:min(height, y_max + CROP_PAD) - wy0,
+                  max(0, x_min - CROP_PAD) - wx0:min(width, x_max + CROP_PAD) - wx0]
+    return letterbox_into(cropped, out)
+
+
+def decode_for_segmentation(source, max_side=WORK_MAX_SIDE):
+    """Decode to RGB with the longest side at most `max_side`; JPEGs are downscaled while decoding."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    image = Image.open(source)
+    if max_side:
+        scale = max_side / max(image.size)
+        if scale < 1:
+            # Only JPEG honours this: DCT scaling to the smallest 1/2^n size still >= the request
+            image.draft("RGB", (math.ceil(image.width * scale), math.ceil(image.height * scale)))
+    image = image.convert("RGB")
+    if max_side and max(image.size) > max_side:
+        image.thumbnail((max_side, max_side), Image.BILINEAR)
+    return image
+
+
+def plain_background_mask(small, max_std=PLAIN_BACKGROUND_MAX_STD):
+    """Foreground mask from the distance to the border colour, or None unless the border is one plain colour.
+
+    Also None when that finds almost nothing or almost everything, leaving those photos to rembg.
+    """
+    pixels = np.asarray(small, dtype=np.int16)
+    height, width = pixels.shape[:2]
+    band = max(2, min(height, width) // 20)
+    border = np.concatenate([pixels[:band].reshape(-1, 3), pixels[-band:].reshape(-1, 3),
+                             pixels[:, :band].reshape(-1, 3), pixels[:, -band:].reshape(-1, 3)])
+    if border.std(axis=0).max() > max_std:
+        return None
+    distance = np.abs(pixels - np.median(border, axis=0)).max(axis=2)
+    mask = np.where(distance > max(30.0, 3 * max_std), 255, 0).astype(np.uint8)
+    mask = np.asarray(Image.fromarray(mask).filter(ImageFilter.MedianFilter(3)))  # Drop speckle
+    coverage = np.count_nonzero(mask) / mask.size
+    if coverage < 0.01 or coverage > 0.95:
+        return None
+    return mask
+
+
+def crop_with_mask(rgb, mask, out=None):
+    """`crop_and_letterbox` for an RGB image and a lower-resolution alpha mask.
+
+    The leaf's box is found on the small mask; only the matching window of `rgb` is
+    cut out and only that part of the mask is upsampled to it.
+    """
+    if out is None:
+        out = np.empty((TARGET_SIZE[1], TARGET_SIZE[0], 3), dtype=np.float32)
+    box = foreground_bbox(mask)
+    if box is None:
+        out.fill(0)
+        return out
+    height, width = rgb.shape[:2]
+    sy, sx = height / mask.shape[0], width / mask.shape[1]
+    # One mask pixel of slack for the upsampling blur, plus the usual crop padding
+    y0 = max(0, int((box[0] - 1) * sy) - CROP_PAD)
+    y1 = min(height, math.ceil((box[1] + 2) * sy) + CROP_PAD)
+    x0 = max(0, int((box[2] - 1) * sx) - CROP_PAD)
+    x1 = min(width, math.ceil((box[3] + 2) * sx) + CROP_PAD)
+    alpha = Image.fromarray(mask).resize((x1 - x0, y1 - y0), Image.BILINEAR,
+                                         box=(x0 / sx, y0 / sy, x1 / sx, y1 / sy))
+    rgba = np.dstack([rgb[y0:y1, x0:x1], np.asarray(alpha)])
+    return crop_and_letterbox(rgba, out)
+
+
+def preprocess_fast(source, out=None, timings=None, model_name=None, segment_size=SEGMENT_SIZE,
+                    work_max_side=WORK_MAX_SIDE, plain_background_skip=PLAIN_BACKGROUND_SKIP):
+    """`preprocess` with the mask predicted on a `segment_size` copy of the photo.
+
+    rembg resizes to its 320px input anyway; what this avoids is decoding, resizing and
+    compositing the full-resolution upload. With `plain_background_skip`, photos whose
+    border is a single plain colour are segmented by colour distance without rembg.
+    """
+    start = time.perf_counter()
+    image = decode_for_segmentation(source, work_max_side)
+    small = image.copy()
+    small.thumbnail((segment_size, segment_size), Image.BILINEAR)
+    decoded = time.perf_counter()
+
+    mask = plain_background_mask(small) if plain_background_skip else None
+    stage = "plain_background"
+    if mask is None:
+        mask = np.asarray(_get_session(model_name).predict(small)[0].convert("L"))
+        stage = "rembg"
+    segmented = time.perf_counter()
+
+    result = crop_with_mask(np.asarray(image), mask, out)
+    if timings is not None:
+        timings["decode"] = decoded - start
+        timings[stage] = segmented - decoded
+        timings["crop_resize"] = time.perf_counter() - segmented
+    return result
+
+
+def preprocess(source, out=None, timings=None):
+    """Remove the background, crop to the leaf and letterbox to 224x224.
+
+    `source` is anything `open_image` accepts. Returns a float32 (224, 224, 3) array
+    with raw 0-255 pixel values; the model's `preprocess_input` is applied later on
+    the stacked batch. Stage durations go into `timings` when a dict is passed.
+    SEGMENTATION=fast goes through `preprocess_fast` instead.
+    """
+    if SEGMENTATION == "fast":
+        return preprocess_fast(source, out, timings)
+    rgba = remove_background(source, timings)
+    start = time.perf_counter()
+    result = crop_and_letterbox(rgba, out)
+    if timings is not None:
+        timings["crop_resize"] = time.perf_counter() - start
+    return result
+
+
+def _preprocess_in_worker(source):
+    global _out_buffer
+    if _out_buffer is None:
+        _out_buffer = np.empty((TARGET_SIZE[1], TARGET_SIZE[0], 3), dtype=np.float32)
+    timings = {}
+    return preprocess(source, out=_out_buffer, timings=timings), timings
+
+
+def crop_and_letterbox_reference(removed_bg):
+    """Original PIL implementation of `crop_and_letterbox`, kept as the numerical reference."""
+    black_bg = Image.new("RGBA", removed_bg.size, (0, 0, 0, 255))
+    merged = Image.alpha_composite(black_bg, removed_bg).convert("RGB")
+    np_img = np.array(merged)
+    mask = np.any(np_img != [0, 0, 0], axis=-1)
+    coords = np.column_stack(np.where(mask))
+    if coords.size == 0:  # Fallback
+        return np.array(resize_with_padding(merged, TARGET_SIZE), dtype=np.float32)
+    y_min, x_min = coords.min(axis=0)
+    y_max, x_max = coords.max(axis=0)
+    pad = CROP_PAD
+    cropped = merged.crop((max(0, x_min-pad), max(0, y_min-pad), min(merged.width, x_max+pad), min(merged.height, y_max+pad)))
+    final_image = resize_with_padding(cropped, TARGET_SIZE)
+    return np.array(final_image, dtype=np.float32)
+
+
+class PoolSaturated(Exception):
+    """Raised when the preprocessing queue is full and the request should be retried later."""
+
+
+class PreprocessPool:
+    """Runs `preprocess` in a pool of worker processes so rembg never blocks the event loop.
+
+    At most `max_pending` jobs may be queued or running; beyond that `run` raises
+    `PoolSaturated` immediately instead of letting the backlog grow without bound.
+    With several workers each one is single-threaded unless `threads` says otherwise,
+    so N ONNX Runtime sessions don't each try to use every core.
+    """
+
+    def __init__(self, workers=None, max_pending=None, rembg_model=REMBG_MODEL, threads=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.rembg_model = rembg_model
+        # Per-worker ONNX Runtime threads; None (a single worker only) lets rembg decide
+        self.threads = threads or (1 if self.workers > 1 else None)
+        self.in_flight = 0
+        self._in_flight_lock = threading.Lock()
+        self._executor = None
+
+    def start(self):
+        if self._executor is not None:
+            return
+        # spawn keeps TensorFlow state from the parent out of the workers
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(self.rembg_model, self.threads),
+        )
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _release(self, _job=None):
+        with self._in_flight_lock:
+            self.in_flight -= 1
+
+    @property
+    def saturated(self):
+        return self.in_flight >= self.max_pending
+
+    def submit(self, source):
+        """Queue one job; the returned future resolves to (tensor, worker-side stage timings)."""
+        if self._executor is None:
+            raise RuntimeError("Preprocessing pool is not running")
+        with self._in_flight_lock:  # Checked and taken together: the model server submits from many threads
+            if self.saturated:
+                raise PoolSaturated(f"Preprocessing queue full ({self.in_flight}/{self.max_pending})")
+            self.in_flight += 1
+        try:
+            job = self._executor.submit(_preprocess_in_worker, source)
+        except BaseException:
+            self._release()
+            raise
+        # Released when the job really finishes: a cancelled await (e.g. a deadline) leaves it running in the worker
+        job.add_done_callback(self._release)
+        return job
+
+    async def run(self, source):
+        start = time.perf_counter()
+        result, timings = await asyncio.wrap_future(self.submit(source))
+        record_timings(start, timings)
+        return result
+
+
+def record_timings(start, timings):
+    """Observe a job's worker-side stage timings; whatever is left over since `start` was spent queued or pickling."""
+    for stage, seconds in timings.items():
+        observe_stage(stage, seconds)
+    observe_stage("preprocess_queue", max(0.0, time.perf_counter() - start - sum(timings.values())))
@@ -0,0 +1,377 @@
+import asyncio
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from admission import within_deadline
+from context import assemble_context, record_prompt
+from metrics import observe_stage, record_error, time_stage
+
+# --- Configuration ---
+PERSIST_DIR = os.getenv("RAG_PERSIST_DIR", "./chroma_db_nccn")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+LLM_MODEL = os.getenv("LLM_MODEL", "sonar-pro")
+LLM_BASE_URL = os.getenv("PERPLEXITY_BASE_URL", "https://api.perplexity.ai")  # Point at stub_llm.py for offline testing
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "60"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+RETRIEVAL_WORKERS = int(os.getenv("RETRIEVAL_WORKERS", "4"))
+RETRIEVAL_TIMEOUT_SECONDS = float(os.getenv("RETRIEVAL_TIMEOUT_SECONDS", "10"))
+RAG_TOP_K = int(os.getenv("RAG_TOP_K", "10"))  # Candidates per query; context assembly trims them to the token budget
+RAG_PROMPT = os.getenv("RAG_PROMPT", "assistant")
+VECTOR_INDEX = os.getenv("VECTOR_INDEX", "1") == "1"  # Exact in-memory search over an export of the collection
+VECTOR_INDEX_CACHE = os.getenv("VECTOR_INDEX_CACHE", "./vector_index_cache")
+
+NO_CONTEXT_RESPONSE = "I couldn't find specific ayurvedic data for this in my database. However, broadly speaking..."
+MISSING_KEY_RESPONSE = "Configuration Error: API Key missing on server. Please check .env file."
+
+
+def _doctor_messages(query, context):
+    return [
+        {
+            "role": "system",
+            "content": (
+                "You are an expert Ayurvedic doctor. Answer ONLY using the medical context provided below. "
+                "If the context is insufficient, state that clearly. "
+                "Use simple language suitable for patients/kids. "
+                "Format your answer strictly as:\n"
+                "1. **Remedy & Preparation**\n2. **Dosage**\n3. **Suggestions**\n4. **Severity**\n\n"
+                f"Medical Context:\n{context}"
+            )
+        },
+        {"role": "user", "content": query}
+    ]
+
+
+def _assistant_messages(query, context):
+    return [
+        {"role": "system", "content": (
+            "You are a medical assistant. "
+            "Answer ONLY using the medical context provided. "
+            "If the context does not contain the answer, say "
+            "'This answer is based on general medical knowledge, not the database.' "
+            "Use simple language for patients. Add simple language so that even a small kid could understand along with medical context "
+            "Format strictly and only add if the condition requires to break the series as:\n"
+            "1. Remedy and step wise preparation\n2. Dosage\n3. Suggestions\n4. Severity"
+            "Dont add references like this [1][2]"
+        )},
+        {"role": "system", "content": f"Medical Context:\n{context}"},
+        {"role": "user", "content": query}
+    ]
+
+
+# "doctor" was the built-in RAGSystem prompt in main.py, "assistant" the one in chroma_db_nccn/rag.py
+PROMPTS = {"doctor": _doctor_messages, "assistant": _assistant_messages}
+
+KnowledgeBase = namedtuple("KnowledgeBase", "vector_db index retriever fingerprint loaded_at")
+
+
+class RAGService:
+    """The one retrieval + generation stack for the process.
+
+    Owns a single MiniLM embedding model, Chroma handle (plus the in-memory vector
+    index when enabled), pooled async LLM client and bounded retrieval pool. Callers
+    use `retrieve`/`aretrieve` for context, `generate`/`agenerate`/`astream` for
+    completions and `aanswer`/`astream_events` for the whole remedy flow. `areload()`
+    swaps in a freshly opened knowledge base without restarting the server.
+    """
+
+    def __init__(self, persist_dir=PERSIST_DIR, api_key=None, prompt=RAG_PROMPT, top_k=RAG_TOP_K,
+                 open_knowledge_base=True, embeddings=None):
+        if prompt not in PROMPTS:
+            raise ValueError(f"Unknown prompt '{prompt}' (choose from {', '.join(PROMPTS)})")
+        print("🔄 Initializing RAG service...")
+
+        self.persist_dir = persist_dir
+        self.prompt = prompt
+        self.top_k = top_k
+        self.api_key = api_key or os.getenv("PERPLEXITY_API_KEY")
+        if not self.api_key:
+            print("❌ Error: PERPLEXITY_API_KEY not found in .env file")
+
+        if embeddings is None:  # Any LangChain Embeddings object may be passed in instead (e.g. in tests)
+            from langchain_huggingface import HuggingFaceEmbeddings
+            embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL, model_kwargs={'device': 'cpu'})
+        self.embeddings = embeddings
+        # serve.py defers this to its forked workers: chromadb's client doesn't survive fork
+        self.kb = self._open_knowledge_base() if open_knowledge_base else None
+        self._client = None  # Sync client, only created for the CLI / sync callers
+        self.aclient = self._make_async_client()
+        # Embedding + Chroma search are blocking; keep them on a small bounded pool
+        self._search_executor = ThreadPoolExecutor(max_workers=RETRIEVAL_WORKERS, thread_name_prefix="rag-search")
+        self._search_slots = asyncio.Semaphore(RETRIEVAL_WORKERS)
+        self._llm_slots = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
+        self._reload_lock = asyncio.Lock()
+        print(f"✅ RAG service ready! (prompt: {prompt}, vector index: {bool(self.kb and self.kb.index is not None)})")
+
+    # --- Knowledge base ---
+    def _open_knowledge_base(self):
+        from langchain_community.vectorstores import Chroma
+        from vector_index import knowledge_base_fingerprint
+
+        if not os.path.isdir(self.persist_dir):
+            raise FileNotFoundError(f"Knowledge base not found at {self.persist_dir}")
+        fingerprint = knowledge_base_fingerprint(self.persist_dir)
+        vector_db = Chroma(persist_directory=self.persist_dir, embedding_function=self.embeddings)
+        index = retriever = None
+        if VECTOR_INDEX:
+            try:
+                from vector_index import BatchedRetriever, VectorIndex
+                index = VectorIndex.from_collection(vector_db._collection, self.persist_dir, VECTOR_INDEX_CACHE)
+                # Concurrent queries share one embedding call and one matrix product
+                retriever = BatchedRetriever(self.embeddings.embed_documents, index)
+                print(f"✅ In-memory vector index loaded ({len(index)} chunks)")
+            except Exception as e:
+                print(f"⚠️ Vector index unavailable, using Chroma search: {e}")
+        return KnowledgeBase(vector_db, index, retriever, fingerprint, time.time())
+
+    @staticmethod
+    def _clear_client_cache():
+        try:
+            # chromadb shares one client per path; drop it so the next handle opens the files afresh
+            from chromadb.api.client import SharedSystemClient
+            SharedSystemClient.clear_system_cache()
+        except Exception:
+            pass
+
+    def reopen(self):
+        """Open a fresh Chroma handle and vector index, e.g. in a worker forked by serve.py.
+
+        The embedding model is left alone, so its weights stay shared copy-on-write with the parent.
+        """
+        self._clear_client_cache()
+        self.kb = self._open_knowledge_base()
+
+    async def areload(self):
+        """Reopen the knowledge base from disk (e.g. after ingest.py) and swap it in.
+
+        Requests already queued on the old one's batching worker, or in its current
+        batch, finish against it before the worker is stopped.
+        """
+        async with self._reload_lock:
+            self._clear_client_cache()
+            old, self.kb = self.kb, await asyncio.to_thread(self._open_knowledge_base)
+            await asyncio.to_thread(self.warmup)
+            if old is not None and old.retriever is not None:
+                await old.retriever.stop(timeout=RETRIEVAL_TIMEOUT_SECONDS, drain=True)
+            print(f"✅ Knowledge base reloaded ({self.kb.fingerprint})")
+            return self.status()
+
+    def status(self):
+        return {
+            "prompt": self.prompt,
+            "prompts": list(PROMPTS),
+            "top_k": self.top_k,
+            "api_key": bool(self.api_key),
+            "vector_index": self.kb.index is not None,
+            "chunks": len(self.kb.index) if self.kb.index is not None else None,
+            "knowledge_base": self.kb.fingerprint,
+            "loaded_at": self.kb.loaded_at,
+        }
+
+    # --- Retrieval ---
+    def embed_query(self, query):
+        return self.embeddings.embed_query(query)
+
+    def search(self, query, k=None, vector=None):
+        """(document, distance) pairs for the k nearest chunks, timing embedding and search separately.
+
+        Pass `vector` when the query has already been embedded (e.g. by the semantic cache lookup).
+        """
+        kb = self.kb
+        if vector is None:
+            vector = self._embed_timed(query)
+        with time_stage("similarity_search"):
+            if kb.index is not None:
+                return [(hit, hit.distance) for hit in kb.index.search(vector, k or self.top_k)]
+            return kb.vector_db.similarity_search_by_vector_with_relevance_scores([float(x) for x in vector], k=k or self.top_k)
+
+    def _assemble(self, results, kb):
+        vectors = kb.index.vectors([doc for doc, _ in results]) if kb.index is not None and results else None
+        return assemble_context(results, vectors).text
+
+    def warmup(self):
+        """Run one embedding + search so the first user query doesn't pay for model/index initialisation."""
+        self.search("cough and cold", k=1)
+
+    def retrieve(self, query, k=None):
+        """Context for `query`: top-k chunks, thresholded, deduplicated and token-budgeted."""
+        kb = self.kb
+        return self._assemble(self.search(query, k), kb)
+
+    def _embed_timed(self, query):
+        with time_stage("embedding"):
+            return self.embeddings.embed_query(query)
+
+    async def _in_search_pool(self, fn, *args):
+        async with self._search_slots:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._search_executor, fn, *args)
+
+    async def aembed_query(self, query):
+        """`embed_query` for the event loop, batched with concurrent retrievals when the vector index is loaded."""
+        kb = self.kb
+        if kb.retriever is not None:
+            return await within_deadline(kb.retriever.embed(query), RETRIEVAL_TIMEOUT_SECONDS)
+        return await within_deadline(self._in_search_pool(self._embed_timed, query), RETRIEVAL_TIMEOUT_SECONDS)
+
+    async def aretrieve(self, query, k=None, vector=None):
+        """`retrieve` without blocking the event loop, under RETRIEVAL_TIMEOUT_SECONDS and the request deadline.
+
+        A precomputed query `vector` (e.g. from the semantic cache lookup) skips the embedding.
+        """
+        kb = self.kb
+        k = k or self.top_k
+        if kb.retriever is not None:
+            hits = await within_deadline(kb.retriever.search(query, k, vector), RETRIEVAL_TIMEOUT_SECONDS)
+            return self._assemble([(hit, hit.distance) for hit in hits], kb)
+        results = await within_deadline(self._in_search_pool(self.search, query, k, vector), RETRIEVAL_TIMEOUT_SECONDS)
+        return self._assemble(results, kb)
+
+    # --- Generation ---
+    def build_messages(self, query, context, prompt=None):
+        messages = PROMPTS[prompt or self.prompt](query, context)
+        record_prompt(messages)
+        return messages
+
+    def _make_async_client(self):
+        """AsyncOpenAI client on a pooled keep-alive HTTP connection with explicit timeouts."""
+        import httpx
+        from openai import AsyncOpenAI
+
+        http_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=LLM_MAX_CONCURRENCY, max_keepalive_connections=LLM_MAX_CONCURRENCY),
+            timeout=httpx.Timeout(LLM_TIMEOUT_SECONDS, connect=5.0),
+        )
+        return AsyncOpenAI(api_key=self.api_key or "missing", base_url=LLM_BASE_URL, http_client=http_client, max_retries=1)
+
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+            self._client = OpenAI(api_key=self.api_key or "missing", base_url=LLM_BASE_URL, timeout=LLM_TIMEOUT_SECONDS)
+        return self._client
+
+    def generate(self, query, context, prompt=None, temperature=0.3, max_tokens=1000):
+        """Blocking completion; errors propagate."""
+        with time_stage("llm_call"):
+            response = self.client.chat.completions.create(
+                model=LLM_MODEL,
+                messages=self.build_messages(query, context, prompt),
+                temperature=temperature,
+                max_tokens=max_tokens
+            )
+        return response.choices[0].message.content
+
+    async def agenerate(self, query, context, prompt=None, temperature=0.3, max_tokens=1000):
+        """One completion over the pooled client, capped at LLM_MAX_CONCURRENCY calls; errors propagate.
+
+        Waiting for a slot and the call itself both stop at the request deadline.
+        """
+        await within_deadline(self._llm_slots.acquire())
+        try:
+            with time_stage("llm_call"):
+                response = await within_deadline(self.aclient.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=self.build_messages(query, context, prompt),
+                    temperature=temperature,
+                    max_tokens=max_tokens
+                ))
+        finally:
+            self._llm_slots.release()
+        return response.choices[0].message.content
+
+    async def astream(self, query, context, prompt=None, temperature=0.3, max_tokens=1000):
+        """Yield text deltas as soon as the API sends them, until the stream ends or the request deadline."""
+        await within_deadline(self._llm_slots.acquire())
+        stream = None
+        # llm_call only counts time spent waiting on the API, not on our consumer between chunks
+        waited = 0.0
+        try:
+            start = time.perf_counter()
+            first = True
+            try:
+                stream = await within_deadline(self.aclient.chat.completions.create(
+                    model=LLM_MODEL,
+                    messages=self.build_messages(query, context, prompt),
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    stream=True
+                ))
+            finally:
+                waited += time.perf_counter() - start
+            chunks = stream.__aiter__()
+            while True:
+                started = time.perf_counter()
+                try:
+                    chunk = await within_deadline(chunks.__anext__())
+                except StopAsyncIteration:
+                    break
+                finally:
+                    waited += time.perf_counter() - started
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    if first:
+                        observe_stage("llm_first_token", time.perf_counter() - start)
+                        first = False
+                    yield delta
+        finally:
+            observe_stage("llm_call", waited)
+            if stream is not None:
+                await stream.close()  # Free the pooled connection when we stop early
+            self._llm_slots.release()
+
+    # --- Remedy flow ---
+    async def aanswer(self, query, prompt=None, vector=None):
+        """Retrieve + generate; returns None when the knowledge base has nothing relevant and raises on errors.
+
+        `vector` is the query's embedding when the caller already has it.
+        """
+        context = await self.aretrieve(query, vector=vector)
+        if not context.strip():
+            return None
+        return await self.agenerate(query, context, prompt)
+
+    async def astream_events(self, query, prompt=None, vector=None):
+        """Yield (event, data) pairs: one `context` event after retrieval, then `token` deltas and a final `done`."""
+        if not self.api_key:
+            yield "done", {"response": MISSING_KEY_RESPONSE}
+            return
+
+        context = await self.aretrieve(query, vector=vector)
+        yield "context", {"found": bool(context.strip()), "characters": len(context)}
+        if not context.strip():
+            yield "done", {"response": NO_CONTEXT_RESPONSE}
+            return
+
+        parts = []
+        async for delta in self.astream(query, context, prompt):
+            parts.append(delta)
+            yield "token", {"text": delta}
+        yield "done", {"response": "".join(parts), "generated": True}
+
+    @staticmethod
+    def error_message(e: Exception):
+        record_error("rag", e)
+        if isinstance(e, asyncio.TimeoutError):
+            print("RAG Error: knowledge base search timed out")
+            return "Sorry, the knowledge base took too long to respond. Please try again."
+        print(f"RAG Error: {e}")
+        return f"Sorry, I encountered an error consulting the knowledge base: {str(e)}"
+
+    async def aclose(self):
+        if self.kb is not None and self.kb.retriever is not None:
+            await self.kb.retriever.stop()
+        await self.aclient.close()
+        self._search_executor.shutdown(wait=False)
+
+
+_service = None
+
+
+def get_service(**kwargs):
+    """The process-wide RAGService, created on first use (with `kwargs`)."""
+    global _service
+    if _service is None:
+        _service = RAGService(**kwargs)
+    return _service
@@ -0,0 +1,192 @@
+import asyncio
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from vector_index import knowledge_base_fingerprint
+
+
+def normalize_query(text: str) -> str:
+    """Case-, punctuation- and whitespace-insensitive form of a symptoms query, used as the exact-match key."""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+class SemanticAnswerCache:
+    """Remedy answers keyed by query meaning rather than exact text.
+
+    A lookup first tries the normalized query text, then embeds the query with
+    `embed_fn` (the RAG stack's MiniLM; `aembed_fn` in `alookup`) and returns the
+    closest cached answer whose cosine similarity is at least `threshold`. Entries are LRU-bounded, expire after
+    `ttl_seconds`, are persisted to SQLite and are dropped whenever the Chroma
+    directory at `kb_path` changes.
+    """
+
+    def __init__(self, embed_fn, kb_path, persist_path=None, threshold=0.92,
+                 max_entries=2000, ttl_seconds=24 * 3600, aembed_fn=None):
+        self.embed_fn = embed_fn
+        self.aembed_fn = aembed_fn  # Coroutine version, e.g. the RAG service's batched, bounded embedding
+        self.kb_path = kb_path
+        self.persist_path = persist_path
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # normalized query -> (stored_at, answer, unit vector)
+        self._matrix = None
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        self._fingerprint = knowledge_base_fingerprint(kb_path)
+        self._checked_at = time.monotonic()
+        self._db = None
+        if persist_path:
+            self._load()
+
+    # --- persistence ---
+    def _load(self):
+        self._db = sqlite3.connect(self.persist_path, check_same_thread=False, timeout=1.0)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            "key TEXT PRIMARY KEY, kb TEXT NOT NULL, stored_at REAL NOT NULL, answer TEXT NOT NULL, vector BLOB NOT NULL)"
+        )
+        self._db.execute("DELETE FROM answers WHERE kb != ?", (self._fingerprint,))
+        if self.ttl_seconds:
+            self._db.execute("DELETE FROM answers WHERE stored_at < ?", (time.time() - self.ttl_seconds,))
+        self._db.commit()
+        rows = self._db.execute(
+            "SELECT key, stored_at, answer, vector FROM answers ORDER BY stored_at DESC LIMIT ?", (self.max_entries,)
+        ).fetchall()
+        for key, stored_at, answer, vector in reversed(rows):
+            self._entries[key] = (stored_at, answer, np.frombuffer(vector, dtype=np.float32))
+        self._matrix = None
+
+    def _check_knowledge_base(self):
+        now = time.monotonic()
+        if now - self._checked_at < 5.0:
+            return
+        self._checked_at = now
+        fingerprint = knowledge_base_fingerprint(self.kb_path)
+        if fingerprint != self._fingerprint:
+            print("🔄 Knowledge base changed, clearing semantic answer cache")
+            self._fingerprint = fingerprint
+            self._clear_locked()
+
+    def _clear_locked(self):
+        self._entries.clear()
+        self._matrix = None
+        if self._db is not None:
+            self._db.execute("DELETE FROM answers")
+            self._db.commit()
+
+    def clear(self):
+        with self._lock:
+            self._clear_locked()
+
+    def _drop_locked(self, key):
+        self._entries.pop(key, None)
+        self._matrix = None
+        if self._db is not None:
+            self._db.execute("DELETE FROM answers WHERE key = ?", (key,))
+            self._db.commit()
+
+    def _expired(self, stored_at):
+        return self.ttl_seconds and time.time() - stored_at > self.ttl_seconds
+
+    # --- lookup / store ---
+    def _unit(self, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def embed(self, query):
+        return self._unit(self.embed_fn(query))
+
+    async def aembed(self, query):
+        if self.aembed_fn is not None:
+            return self._unit(await self.aembed_fn(query))
+        return await asyncio.to_thread(self.embed, query)
+
+    def _exact(self, key):
+        with self._lock:
+            self._check_knowledge_base()
+            entry = self._entries.get(key)
+            if entry is not None:
+                if not self._expired(entry[0]):
+                    self._entries.move_to_end(key)
+                    self.exact_hits += 1
+                    return entry[1]
+                self._drop_locked(key)
+        return None
+
+    def _nearest(self, vector):
+        with self._lock:
+            if self._entries:
+                if self._matrix is None:
+                    self._matrix_keys = list(self._entries)
+                    self._matrix = np.stack([self._entries[k][2] for k in self._matrix_keys])
+                scores = self._matrix @ vector
+                best = int(scores.argmax())
+                match = self._matrix_keys[best]
+                entry = self._entries.get(match)
+                if scores[best] >= self.threshold and entry is not None and not self._expired(entry[0]):
+                    self._entries.move_to_end(match)
+                    self.semantic_hits += 1
+                    return entry[1], "semantic", vector
+            self.misses += 1
+            return None, None, vector
+
+    def lookup(self, query):
+        """Return (answer, kind, vector): kind is "exact", "semantic" or None on a miss.
+
+        `vector` is the query embedding (None on exact hits) so `store` needn't embed again.
+        """
+        answer = self._exact(normalize_query(query))
+        if answer is not None:
+            return answer, "exact", None
+        return self._nearest(self.embed(query))  # Embedding happens outside the lock: it is the slow part
+
+    def store(self, query, answer, vector=None):
+        key = normalize_query(query)
+        if vector is None:
+            vector = self.embed(query)
+        stored_at = time.time()
+        with self._lock:
+            self._entries[key] = (stored_at, answer, vector)
+            self._entries.move_to_end(key)
+            self._matrix = None
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO answers (key, kb, stored_at, answer, vector) VALUES (?, ?, ?, ?, ?)",
+                    (key, self._fingerprint, stored_at, answer, vector.astype(np.float32).tobytes()),
+                )
+                self._db.commit()
+            while len(self._entries) > self.max_entries:
+                self._drop_locked(next(iter(self._entries)))
+
+    async def alookup(self, query):
+        """`lookup` for the event loop; the query is embedded with `aembed_fn` when one was given."""
+        answer = await asyncio.to_thread(self._exact, normalize_query(query))
+        if answer is not None:
+            return answer, "exact", None
+        return self._nearest(await self.aembed(query))
+
+    async def astore(self, query, answer, vector=None):
+        await asyncio.to_thread(self.store, query, answer, vector)
+
+    def stats(self):
+        with self._lock:
+            hits = self.exact_hits + self.semantic_hits
+            lookups = hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_ratio": (hits / lookups) if lookups else 0.0,
+                "threshold": self.threshold,
+                "persistent": self._db is not None,
+            }
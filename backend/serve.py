@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Production server: load the models once in a parent process, then fork N uvicorn workers.
+
+`python main.py` runs one process, so TensorFlow, rembg, sentence-transformers and every
+request share one interpreter and one GIL; `uvicorn --workers N` fixes that but loads
+every model N times. Here the parent binds the socket, loads the MiniLM embedding model
+and refreshes the vector index export before forking, so the workers share those pages
+copy-on-write (the export is memory-mapped). The plant model and rembg don't survive
+fork (TensorFlow / ONNX Runtime / TFLite thread pools), so before forking the parent
+also starts model_server.py: one process that loads the plant model once and runs a
+single pool of single-threaded rembg processes (one per core by default), which every
+worker calls for preprocessing and forward passes. Only the Chroma client (chromadb's
+native runtime doesn't survive fork either) is still opened per worker. With
+--no-preload each worker loads everything itself, including its own plant model and
+rembg pool.
+
+Each worker gets cores / workers threads for OpenMP/MKL/OpenBLAS and torch (anything
+already set in the environment wins over these defaults); the model server gets
+workers x threads for the plant model, since it runs every worker's forward passes.
+
+Usage:
+  python serve.py --workers 4
+  python serve.py --workers 2 --threads 4 --port 8000
+  python serve.py --workers 4 --preprocess-workers 6
+  kill -HUP <parent pid>        # rolling restart, e.g. to pick up a re-ingested knowledge base
+
+On SIGHUP the workers are replaced one at a time: a new worker is started next to the old
+one, and the old one only gets SIGTERM once the new one reports its startup finished, so
+the server keeps answering throughout. If a new worker comes up with a required component
+failed, the restart stops there and the remaining old workers keep serving. The model
+server is left running across restarts.
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+RESTART_BACKOFF_SECONDS = 1.0  # Wait before replacing a worker that died within a few seconds of starting
+
+
+def available_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def apply_thread_limits(threads, interop_threads):
+    """Cap every native thread pool at `threads`; must run before numpy / TF / torch are imported."""
+    defaults = {
+        "OMP_NUM_THREADS": threads,
+        "MKL_NUM_THREADS": threads,
+        "OPENBLAS_NUM_THREADS": threads,
+        "TF_NUM_INTRAOP_THREADS": threads,
+        "TF_NUM_INTEROP_THREADS": interop_threads,
+        "INFERENCE_THREADS": threads,  # TFLite / ONNX plant model backends (--no-preload only)
+        "PREPROCESS_WORKERS": threads,  # rembg processes per worker (--no-preload only)...
+        "PREPROCESS_THREADS": 1,  # ...each single-threaded
+        "TOKENIZERS_PARALLELISM": "false",  # HF tokenizers' own pool doesn't survive fork
+    }
+    for name, value in defaults.items():
+        os.environ.setdefault(name, str(value))
+
+
+def bind_socket(host, port, backlog=2048):
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def export_vector_index():
+    """Bring the vector index export up to date in a child process, so the parent never opens Chroma
+    and the workers only have to memory-map it."""
+    from rag_service import PERSIST_DIR, VECTOR_INDEX, VECTOR_INDEX_CACHE
+    if not VECTOR_INDEX:
+        return
+    result = subprocess.run([sys.executable, "vector_index.py", "--persist-dir", PERSIST_DIR,
+                             "--cache-dir", VECTOR_INDEX_CACHE])
+    if result.returncode:
+        print("⚠️ Vector index export failed; workers will fall back to exporting it themselves")
+
+
+def preload():
+    """Load the RAG embedding model in the parent so its weights are shared by every worker."""
+    if not os.path.exists("./chroma_db_nccn"):
+        print("⚠️ chroma_db_nccn not found, nothing to preload")
+        return None
+    from rag_service import get_service
+    start = time.perf_counter()
+    export_vector_index()
+    service = get_service(open_knowledge_base=False)
+    print(f"✅ Preloaded RAG service in {time.perf_counter() - start:.1f}s")
+    return service
+
+
+def start_model_server(inference_threads, preprocess_workers):
+    """Load the plant model and the shared rembg pool in model_server.py; None if there is no model."""
+    from main import PLANT_MODEL_BACKEND, PLANT_MODEL_PATH
+    if not os.path.exists(PLANT_MODEL_PATH):
+        print(f"⚠️ {PLANT_MODEL_PATH} not found, no model server started")
+        return None
+    import model_server
+    start = time.perf_counter()
+    try:
+        manager = model_server.start(PLANT_MODEL_PATH, PLANT_MODEL_BACKEND, inference_threads, preprocess_workers)
+    except Exception as e:
+        print(f"⚠️ Model server failed to start ({e}); each worker will load its own plant model and rembg pool")
+        return None
+    print(f"✅ Model server started in {time.perf_counter() - start:.1f}s "
+          f"({inference_threads} inference threads, {preprocess_workers} rembg processes)")
+    return manager
+
+
+def report_ready(fd):
+    """Write b"1" (or b"0" if a required component failed) to `fd` once this worker's startup has finished."""
+    import main
+    while main.startup_manager.finished_at is None:
+        time.sleep(0.2)
+    os.write(fd, b"1" if main.startup_manager.ready() else b"0")
+    os.close(fd)
+
+
+def run_worker(sock, args, service, ready_fd):
+    """Body of a forked worker; never returns."""
+    for sig in (signal.SIGTERM, signal.SIGINT, signal.SIGHUP):
+        signal.signal(sig, signal.SIG_DFL)
+    code = 0
+    try:
+        if "torch" in sys.modules:
+            sys.modules["torch"].set_num_threads(int(os.environ["OMP_NUM_THREADS"]))
+        if service is not None:
+            service.reopen()
+
+        import uvicorn
+        from main import app
+        threading.Thread(target=report_ready, args=(ready_fd,), daemon=True).start()
+
+        config = uvicorn.Config(app, host=args.host, port=args.port, log_level=args.log_level,
+                                timeout_keep_alive=args.keep_alive)
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException as e:
+        print(f"❌ Worker {os.getpid()} failed: {e}")
+        code = 1
+    finally:
+        sys.stdout.flush()
+        os._exit(code)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SERVE_WORKERS", "2")))
+    parser.add_argument("--threads", type=int, help="Native threads per worker (default: cores / workers)")
+    parser.add_argument("--interop-threads", type=int, default=2, help="TensorFlow inter-op threads per worker")
+    parser.add_argument("--model-threads", type=int, help="Plant model threads in the model server (default: workers x threads)")
+    parser.add_argument("--preprocess-workers", type=int, help="rembg processes shared by all workers (default: cores)")
+    parser.add_argument("--no-preload", action="store_true", help="Load everything in each worker instead")
+    parser.add_argument("--keep-alive", type=int, default=5, help="HTTP keep-alive timeout in seconds")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers must be >= 1")
+
+    threads = args.threads or max(1, available_cores() // args.workers)
+    apply_thread_limits(threads, args.interop_threads)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))  # main.py expects its models next to it
+    sys.path.insert(0, os.getcwd())
+
+    sock = bind_socket(args.host, args.port)
+    import main as _  # noqa: F401  Loads .env and registers metrics before anything is shared
+    service = None if args.no_preload else preload()
+    models = None if args.no_preload else start_model_server(
+        args.model_threads or min(available_cores(), threads * args.workers), args.preprocess_workers or available_cores())
+    # Keep the garbage collector from touching (and so copying) every preloaded object in each worker
+    gc.collect()
+    gc.freeze()
+
+    workers = {}
+    ready_pipes = {}  # pid -> read end of the pipe the worker reports readiness on
+    retiring = set()
+    state = {"stopping": False, "reload": False}
+    rollout = {"queue": [], "replacement": None}  # Old workers still to replace; the new one starting up
+
+    def spawn(slot):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            for fd in ready_pipes.values():
+                os.close(fd)
+            run_worker(sock, args, service, write_fd)
+        os.close(write_fd)
+        os.set_blocking(read_fd, False)
+        workers[pid] = (slot, time.monotonic())
+        ready_pipes[pid] = read_fd
+        return pid
+
+    def readiness(pid):
+        """True / False once the worker has reported (ready / failed), None while it is still starting."""
+        try:
+            report = os.read(ready_pipes[pid], 1)
+        except BlockingIOError:
+            return None
+        return report == b"1"  # EOF (b"") means it died first
+
+    def forget(pid):
+        fd = ready_pipes.pop(pid, None)
+        if fd is not None:
+            os.close(fd)
+
+    def terminate(pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def stop(signum, frame):
+        state["stopping"] = True
+        terminate(list(workers))
+
+    def reload(signum, frame):
+        state["reload"] = True
+
+    def step_rollout():
+        """Start a replacement for the next old worker, or retire that worker once its replacement is ready."""
+        queue = rollout["queue"]
+        while queue and queue[0] not in workers:
+            queue.pop(0)  # Died on its own; the normal restart already replaced it
+        if not queue:
+            return
+        replacement = rollout["replacement"]
+        if replacement is None:
+            rollout["replacement"] = spawn(workers[queue[0]][0])
+            return
+        ready = readiness(replacement)
+        if ready is None:
+            return
+        rollout["replacement"] = None
+        if not ready:
+            print(f"❌ Replacement worker {replacement} failed to start; keeping {len(queue)} old worker(s)")
+            queue.clear()
+            retiring.add(replacement)
+            terminate([replacement])
+            return
+        old = queue.pop(0)
+        retiring.add(old)
+        terminate([old])
+        if not queue:
+            print("✅ Workers restarted")
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGHUP, reload)
+
+    print(f"🚀 Serving on http://{args.host}:{args.port} with {args.workers} workers x {threads} threads "
+          f"(parent pid {os.getpid()})")
+    for slot in range(args.workers):
+        spawn(slot)
+
+    while workers:
+        if state["reload"] and not state["stopping"]:
+            state["reload"] = False
+            print("🔄 Restarting workers one at a time...")
+            # Export once here rather than in every new worker
+            if service is not None:
+                export_vector_index()
+            rollout["queue"] = [pid for pid in workers if pid not in retiring and pid != rollout["replacement"]]
+        if not state["stopping"]:
+            step_rollout()
+
+        pid, status = os.waitpid(-1, os.WNOHANG)
+        if pid == 0:
+            time.sleep(0.2)
+            continue
+        if pid not in workers:
+            continue
+        slot, started = workers.pop(pid)
+        forget(pid)
+        if state["stopping"]:
+            continue
+        if pid in retiring:
+            retiring.discard(pid)  # Its replacement is already serving
+            continue
+        print(f"⚠️ Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}, replacing it")
+        if time.monotonic() - started < 5:
+            time.sleep(RESTART_BACKOFF_SECONDS)
+        if pid == rollout["replacement"]:
+            rollout["replacement"] = None  # step_rollout starts another one; the old worker is still serving
+            continue
+        spawn(slot)
+    sock.close()
+    if models is not None:
+        models.shutdown()
+    print("✅ All workers stopped")
+
+
+if __name__ == "__main__":
+    main()
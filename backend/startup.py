@@ -0,0 +1,127 @@
+import asyncio
+import inspect
+import time
+
+
+class Component:
+    """One heavy dependency (model, pool, knowledge base) loaded in the background at startup."""
+
+    def __init__(self, name, loader, warmup=None, on_ready=None, required=True):
+        self.name = name
+        self.loader = loader
+        self.warmup = warmup
+        self.on_ready = on_ready
+        self.required = required
+        self.state = "pending"
+        self.error = None
+        self.value = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        self._ready = asyncio.Event()
+
+    def status(self):
+        return {
+            "state": self.state,
+            "required": self.required,
+            "load_seconds": self.load_seconds,
+            "warmup_seconds": self.warmup_seconds,
+            "error": self.error,
+        }
+
+
+async def _call(fn, *args):
+    # Coroutine functions run on the loop; blocking loaders go to a worker thread
+    if inspect.iscoroutinefunction(fn):
+        return await fn(*args)
+    return await asyncio.to_thread(fn, *args)
+
+
+class StartupManager:
+    """Loads registered components concurrently and tracks their state for /healthz and /readyz.
+
+    Each component goes pending -> loading -> warming -> ready (or failed / disabled).
+    `loader()` builds the object, `warmup(obj)` runs a throwaway request through it so
+    the first real request doesn't pay for graph tracing or session initialisation,
+    and `on_ready(obj)` publishes it (runs on the event loop).
+    """
+
+    def __init__(self):
+        self.components = {}
+        self.started_at = None
+        self.finished_at = None
+        self._tasks = []
+
+    def register(self, name, loader, warmup=None, on_ready=None, required=True, enabled=True):
+        component = Component(name, loader, warmup, on_ready, required)
+        if not enabled:
+            component.state = "disabled"
+            component._ready.set()
+        self.components[name] = component
+        return component
+
+    async def _load(self, component):
+        try:
+            component.state = "loading"
+            start = time.perf_counter()
+            component.value = await _call(component.loader)
+            component.load_seconds = round(time.perf_counter() - start, 3)
+
+            if component.warmup is not None:
+                component.state = "warming"
+                start = time.perf_counter()
+                await _call(component.warmup, component.value)
+                component.warmup_seconds = round(time.perf_counter() - start, 3)
+
+            if component.on_ready is not None:
+                result = component.on_ready(component.value)
+                if inspect.isawaitable(result):
+                    await result
+            component.state = "ready"
+            total = component.load_seconds + (component.warmup_seconds or 0)
+            print(f"✅ {component.name} ready in {total:.1f}s (load {component.load_seconds:.1f}s, warm-up {component.warmup_seconds or 0:.1f}s)")
+        except asyncio.CancelledError:
+            component.state = "failed"
+            component.error = "cancelled"
+            raise
+        except Exception as e:
+            component.state = "failed"
+            component.error = str(e)
+            print(f"❌ {component.name} failed to load: {e}")
+        finally:
+            component._ready.set()
+
+    def start(self):
+        """Kick off every enabled component without waiting for them."""
+        self.started_at = time.time()
+        pending = [c for c in self.components.values() if c.state == "pending"]
+        loads = [asyncio.create_task(self._load(c), name=f"startup:{c.name}") for c in pending]
+
+        async def finish():
+            await asyncio.gather(*loads, return_exceptions=True)
+            self.finished_at = time.time()
+            print(f"🚀 Startup complete in {self.finished_at - self.started_at:.1f}s")
+
+        self._tasks = loads + [asyncio.create_task(finish(), name="startup:finish")]
+
+    async def wait(self, name=None):
+        names = [name] if name else list(self.components)
+        await asyncio.gather(*(self.components[n]._ready.wait() for n in names))
+
+    async def cancel(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def state(self, name):
+        component = self.components.get(name)
+        return component.state if component else "disabled"
+
+    def ready(self):
+        return all(c.state == "ready" for c in self.components.values() if c.required and c.state != "disabled")
+
+    def status(self):
+        return {
+            "ready": self.ready(),
+            "startup_seconds": round(self.finished_at - self.started_at, 3) if self.finished_at else None,
+            "components": {name: c.status() for name, c in self.components.items()},
+        }
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the Perplexity (OpenAI-compatible) chat completions API.
+
+Lets the remedy path run offline for development, load tests and benchmarks:
+  python stub_llm.py --port 8089 --delay-ms 800
+  PERPLEXITY_BASE_URL=http://127.0.0.1:8089 PERPLEXITY_API_KEY=stub python main.py
+"""
+
+import argparse
+import asyncio
+import json
+import re
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+app = FastAPI()
+app.state.delay_ms = 0.0
+app.state.requests = 0
+
+
+def canned_answer(query: str, context: str) -> str:
+    return (
+        f"1. **Remedy & Preparation**\nStub remedy for: {query}\n"
+        f"2. **Dosage**\nAs directed.\n"
+        f"3. **Suggestions**\nContext had {len(context)} characters.\n"
+        f"4. **Severity**\nMild."
+    )
+
+
+@app.post("/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    app.state.requests += 1
+    messages = body.get("messages", [])
+    query = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    context = "\n".join(m["content"] for m in messages if m.get("role") == "system")
+    answer = canned_answer(query, context)
+    completion_id = f"stub-{uuid.uuid4().hex[:12]}"
+    model = body.get("model", "sonar-pro")
+
+    if body.get("stream"):
+        return StreamingResponse(_stream(completion_id, model, answer), media_type="text/event-stream")
+
+    await asyncio.sleep(app.state.delay_ms / 1000)
+    return {
+        "id": completion_id,
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": answer}}],
+        "usage": {"prompt_tokens": len(context) // 4, "completion_tokens": len(answer) // 4,
+                  "total_tokens": (len(context) + len(answer)) // 4},
+    }
+
+
+async def _stream(completion_id, model, answer):
+    # A quarter of the delay before the first token, the rest spread over the remaining tokens
+    tokens = re.findall(r"\S+\s*|\s+", answer)
+    delay = app.state.delay_ms / 1000
+    await asyncio.sleep(delay / 4)
+    for i, token in enumerate(tokens):
+        if i:
+            await asyncio.sleep(delay * 0.75 / max(1, len(tokens) - 1))
+        chunk = {
+            "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+            "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}],
+        }
+        yield f"data: {json.dumps(chunk)}\n\n"
+    final = {
+        "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": model,
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+    }
+    yield f"data: {json.dumps(final)}\n\n"
+    yield "data: [DONE]\n\n"
+
+
+@app.get("/stats")
+async def stats():
+    return {"requests": app.state.requests}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--delay-ms", type=float, default=0.0, help="Simulated generation latency per request")
+    args = parser.parse_args()
+    app.state.delay_ms = args.delay_ms
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
@@ -0,0 +1,162 @@
+import asyncio
+import json
+
+import pytest
+
+from admission import AdmissionMiddleware, DeadlineExceeded, EndpointLimiter, Rejected, within_deadline
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def call(app, path="/work", headers=()):
+    """Drive one HTTP request through an ASGI app; returns (status, headers, JSON body)."""
+    scope = {"type": "http", "method": "POST", "path": path, "headers": list(headers)}
+    messages = []
+    sent_body = False
+    never = asyncio.Event()
+
+    async def receive():
+        nonlocal sent_body
+        if not sent_body:
+            sent_body = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        await never.wait()  # The client stays connected
+
+    async def send(message):
+        messages.append(message)
+
+    await app(scope, receive, send)
+    start = next(m for m in messages if m["type"] == "http.response.start")
+    body = b"".join(m.get("body", b"") for m in messages if m["type"] == "http.response.body")
+    return start["status"], dict(start["headers"]), json.loads(body) if body else None
+
+
+def blocking_app(release):
+    async def app(scope, receive, send):
+        await within_deadline(release.wait())
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"{}"})
+    return app
+
+
+def test_limiter_queues_then_rejects_with_429():
+    async def scenario():
+        limiter = EndpointLimiter("test", max_concurrent=1, max_queue=1, queue_timeout=5)
+        await limiter.acquire()
+        queued = asyncio.ensure_future(limiter.acquire())
+        await asyncio.sleep(0)
+        assert limiter.queued == 1
+        with pytest.raises(Rejected) as rejected:
+            await limiter.acquire()
+        assert rejected.value.status == 429
+        assert rejected.value.retry_after >= 1
+        limiter.release()
+        await queued  # Handed the slot directly
+        assert limiter.active == 1 and limiter.queued == 0
+        limiter.release()
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_limiter_queue_wait_times_out_with_503():
+    async def scenario():
+        limiter = EndpointLimiter("test", max_concurrent=1, max_queue=4, queue_timeout=0.05)
+        await limiter.acquire()
+        with pytest.raises(Rejected) as rejected:
+            await limiter.acquire()
+        assert rejected.value.status == 503
+        assert limiter.queued == 0
+        limiter.release()
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_limiter_serves_waiters_in_order():
+    async def scenario():
+        limiter = EndpointLimiter("test", max_concurrent=1, max_queue=4, queue_timeout=5)
+        await limiter.acquire()
+        order = []
+
+        async def waiter(name):
+            await limiter.acquire()
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(waiter(name)) for name in "abc"]
+        await asyncio.sleep(0)
+        for _ in tasks:
+            limiter.release()
+            await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        assert order == ["a", "b", "c"]
+
+    run(scenario())
+
+
+def test_middleware_rejects_429_before_503_while_busy():
+    async def scenario():
+        release = asyncio.Event()
+        limiter = EndpointLimiter("test", max_concurrent=1, max_queue=1, queue_timeout=0.1)
+        app = AdmissionMiddleware(blocking_app(release), {"/work": limiter})
+
+        first = asyncio.ensure_future(call(app))
+        await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(call(app))
+        await asyncio.sleep(0.01)
+        third = await call(app)  # Queue full: rejected straight away
+        assert third[0] == 429 and b"retry-after" in third[1]
+
+        second = await second  # Waited queue_timeout in the queue
+        assert second[0] == 503 and b"retry-after" in second[1]
+
+        release.set()
+        assert (await first)[0] == 200
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_middleware_turns_an_expired_deadline_into_504():
+    async def scenario():
+        limiter = EndpointLimiter("test", max_concurrent=2, max_queue=2, deadline=0.05)
+        app = AdmissionMiddleware(blocking_app(asyncio.Event()), {"/work": limiter})
+        status, _, body = await call(app)
+        assert status == 504
+        assert body["detail"] == "Request deadline exceeded"
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_request_timeout_header_only_shortens_the_deadline():
+    async def scenario():
+        limiter = EndpointLimiter("test", max_concurrent=1, max_queue=1, deadline=30)
+        app = AdmissionMiddleware(blocking_app(asyncio.Event()), {"/work": limiter})
+        status, _, _ = await asyncio.wait_for(call(app, headers=[(b"x-request-timeout", b"0.05")]), 5)
+        assert status == 504
+
+    run(scenario())
+
+
+def test_oversized_body_is_rejected_with_413():
+    async def scenario():
+        limiter = EndpointLimiter("test", max_concurrent=1, max_queue=1, max_body_bytes=10)
+        app = AdmissionMiddleware(blocking_app(asyncio.Event()), {"/work": limiter})
+        status, _, _ = await call(app, headers=[(b"content-length", b"11")])
+        assert status == 413
+        assert limiter.active == 0
+
+    run(scenario())
+
+
+def test_within_deadline_without_a_deadline_is_a_plain_await():
+    async def scenario():
+        assert await within_deadline(asyncio.sleep(0, result="ok")) == "ok"
+        with pytest.raises(asyncio.TimeoutError) as raised:
+            await within_deadline(asyncio.sleep(1), timeout=0.01)
+        assert not isinstance(raised.value, DeadlineExceeded)
+
+    run(scenario())
@@ -0,0 +1,207 @@
+import asyncio
+import io
+import json
+import zipfile
+
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("httpx")
+from fastapi.testclient import TestClient  # noqa: E402
+
+import main  # noqa: E402
+from metrics import STAGE_SECONDS  # noqa: E402
+from preprocessing import PoolSaturated  # noqa: E402
+
+
+class FakeBackend:
+    """Plant model backend giving every image the same probabilities, favouring class `best`."""
+
+    name = "fake"
+
+    def __init__(self, best=0):
+        self.best = best
+        self.batch_sizes = []
+
+    def predict(self, batch):
+        self.batch_sizes.append(len(batch))
+        probabilities = np.full((len(batch), 80), 0.1 / 79, dtype=np.float32)  # 80 plant classes
+        probabilities[:, self.best] = 0.9
+        return probabilities
+
+
+class FakePool:
+    """Preprocessing pool stub: b"corrupt..." uploads fail, b"busy..." ones are turned away once."""
+
+    workers = 1
+    max_pending = 8
+    in_flight = 0
+
+    def __init__(self):
+        self.turned_away = set()
+
+    async def run(self, data):
+        if data.startswith(b"corrupt"):
+            raise ValueError("cannot identify image file")
+        if data.startswith(b"busy") and data not in self.turned_away:
+            self.turned_away.add(data)
+            raise PoolSaturated("Preprocessing queue full (8/8)")
+        return np.zeros((224, 224, 3), dtype=np.float32)
+
+
+class DirectBatcher:
+    """Inference batcher stub running every submit as its own forward pass."""
+
+    def __init__(self, predictor):
+        self.predictor = predictor
+
+    async def submit(self, view):
+        return self.predictor.predict_probabilities([view])[0]
+
+    async def submit_many(self, views):
+        return self.predictor.predict_probabilities(views)
+
+
+class ReadyStartup:
+    def state(self, name):
+        return "ready"
+
+
+class FakeRAG:
+    def __init__(self):
+        self.reloads = 0
+
+    async def areload(self):
+        self.reloads += 1
+        return {"knowledge_base": "test"}
+
+
+@pytest.fixture
+def client():
+    # No `with`: the startup hook (which loads the real models) is not run
+    return TestClient(main.app)
+
+
+@pytest.fixture
+def fake_rag(monkeypatch):
+    rag = FakeRAG()
+    monkeypatch.setattr(main, "rag", rag)
+    monkeypatch.setattr(main, "answer_cache", None)
+    return rag
+
+
+@pytest.fixture
+def plant_stack(monkeypatch):
+    backend = FakeBackend()
+    predictor = main.MedicinalLeafPredictor("unused.keras", backend)
+    monkeypatch.setattr(main, "predictor", predictor)
+    monkeypatch.setattr(main, "inference_batcher", DirectBatcher(predictor))
+    monkeypatch.setattr(main, "preprocess_pool", FakePool())
+    monkeypatch.setattr(main, "batch_slots", asyncio.Semaphore(8))
+    monkeypatch.setattr(main, "prediction_cache", None)
+    monkeypatch.setattr(main, "startup_manager", ReadyStartup())
+    return backend
+
+
+def make_zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, data in entries.items():
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def sse_events(response):
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        event, data = block.split("\n")
+        events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+    return events
+
+
+def test_reload_is_disabled_without_a_token(client, fake_rag, monkeypatch):
+    monkeypatch.setattr(main, "RAG_RELOAD_TOKEN", None)
+    assert client.post("/api/rag/reload").status_code == 404
+    assert client.post("/api/rag/reload", headers={"X-Reload-Token": ""}).status_code == 404
+    assert fake_rag.reloads == 0
+
+
+def test_reload_requires_the_configured_token(client, fake_rag, monkeypatch):
+    monkeypatch.setattr(main, "RAG_RELOAD_TOKEN", "s3cret")
+    assert client.post("/api/rag/reload").status_code == 403
+    assert client.post("/api/rag/reload", headers={"X-Reload-Token": "wrong"}).status_code == 403
+    response = client.post("/api/rag/reload", headers={"X-Reload-Token": "s3cret"})
+    assert response.status_code == 200 and response.json() == {"knowledge_base": "test"}
+    assert fake_rag.reloads == 1
+
+
+def test_plant_model_warm_up_skips_inference_metrics():
+    backend = FakeBackend()
+    model = main.MedicinalLeafPredictor("unused.keras", backend)
+
+    def model_predict_series():
+        return [line for line in STAGE_SECONDS.render() if 'stage="model_predict"' in line]
+
+    before = main.BATCH_SIZE.render(), model_predict_series()
+    main._warm_plant_model(model)
+    assert 1 in backend.batch_sizes and len(backend.batch_sizes) > 1
+    assert (main.BATCH_SIZE.render(), model_predict_series()) == before
+
+
+def test_identify_batch_expands_zip_archives(client, plant_stack):
+    archive = make_zip({"leaves/tulsi.jpg": b"leaf-1", "leaves/neem.png": b"leaf-2",
+                        "leaves/notes.txt": b"not an image", "leaves/empty/": b""})
+    response = client.post("/api/identify/batch?mode=fast", files=[
+        ("files", ("field.zip", archive, "application/zip")),
+        ("files", ("single.jpg", b"leaf-3", "image/jpeg")),
+    ])
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    *results, summary = ndjson(response)
+    assert summary == {"done": True, "total": 3, "succeeded": 3, "failed": 0}
+    assert sorted(r["filename"] for r in results) == ["leaves/neem.png", "leaves/tulsi.jpg", "single.jpg"]
+    assert sorted(r["index"] for r in results) == [0, 1, 2]
+    assert all(r["success"] and r["predictions"][0]["label"] == "Aloevera" for r in results)
+
+
+def test_identify_batch_reports_failures_per_item(client, plant_stack, monkeypatch):
+    monkeypatch.setattr(main, "MAX_UPLOAD_BYTES", 64)  # Zip entries are checked against it before reading
+    archive = make_zip({"huge.jpg": b"x" * 100, "ok.jpg": b"leaf-1"})
+    response = client.post("/api/identify/batch", files=[
+        ("files", ("photos.zip", archive, "application/zip")),
+        ("files", ("broken.jpg", b"corrupt-bytes", "image/jpeg")),
+        ("files", ("retried.jpg", b"busy-then-fine", "image/jpeg")),
+    ])
+    *results, summary = ndjson(response)
+    by_name = {r["filename"]: r for r in results}
+    assert summary == {"done": True, "total": 4, "succeeded": 2, "failed": 2}
+    assert not by_name["huge.jpg"]["success"] and "too large" in by_name["huge.jpg"]["error"]
+    assert by_name["broken.jpg"] == {"index": 2, "filename": "broken.jpg", "success": False,
+                                     "error": "cannot identify image file"}
+    assert by_name["ok.jpg"]["success"]
+    assert by_name["retried.jpg"]["success"]  # Waited out the full preprocessing queue
+
+
+def test_identify_batch_streams_server_sent_events(client, plant_stack):
+    files = [("files", (f"leaf{i}.jpg", f"leaf-{i}".encode(), "image/jpeg")) for i in range(3)]
+    for params, headers in (({"format": "sse"}, {}), ({}, {"Accept": "text/event-stream"})):
+        response = client.post("/api/identify/batch", params=params, headers=headers, files=files)
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = sse_events(response)
+        assert [event for event, _ in events] == ["result"] * 3 + ["done"]
+        assert {data["filename"] for _, data in events[:-1]} == {"leaf0.jpg", "leaf1.jpg", "leaf2.jpg"}
+        assert events[-1][1] == {"done": True, "total": 3, "succeeded": 3, "failed": 0}
+
+
+def test_identify_batch_rejects_bad_uploads(client, plant_stack, monkeypatch):
+    bad_zip = client.post("/api/identify/batch", files=[("files", ("photos.zip", b"not a zip", "application/zip"))])
+    assert bad_zip.status_code == 400
+    no_images = client.post("/api/identify/batch", files=[("files", ("notes.zip", make_zip({"a.txt": b"x"}), "application/zip"))])
+    assert no_images.status_code == 400
+    monkeypatch.setattr(main, "MAX_BATCH_ITEMS", 2)
+    files = [("files", (f"leaf{i}.jpg", b"leaf", "image/jpeg")) for i in range(3)]
+    assert client.post("/api/identify/batch", files=files).status_code == 413
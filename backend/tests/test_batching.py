@@ -0,0 +1,170 @@
+import asyncio
+import time
+
+import pytest
+
+from batching import BatchScheduler
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class Recorder:
+    """Batch function doubling each item and remembering the size of every batch."""
+
+    def __init__(self):
+        self.sizes = []
+
+    def __call__(self, items):
+        self.sizes.append(len(items))
+        return [item * 2 for item in items]
+
+
+async def _with_scheduler(fn, body, **kwargs):
+    scheduler = BatchScheduler(fn, **kwargs)
+    scheduler.start()
+    try:
+        return await body(scheduler)
+    finally:
+        await scheduler.stop()
+
+
+def test_concurrent_submits_share_one_batch():
+    recorder = Recorder()
+
+    async def body(scheduler):
+        return await asyncio.gather(*(scheduler.submit(i) for i in range(5)))
+
+    results = run(_with_scheduler(recorder, body, max_batch_size=8, max_wait_ms=50))
+    assert results == [0, 2, 4, 6, 8]
+    assert recorder.sizes == [5]
+
+
+def test_batches_are_capped_at_max_batch_size():
+    recorder = Recorder()
+
+    async def body(scheduler):
+        return await asyncio.gather(*(scheduler.submit(i) for i in range(10)))
+
+    results = run(_with_scheduler(recorder, body, max_batch_size=4, max_wait_ms=50))
+    assert results == [i * 2 for i in range(10)]
+    assert recorder.sizes == [4, 4, 2]
+
+
+def test_lone_request_is_flushed_after_max_wait():
+    recorder = Recorder()
+
+    async def body(scheduler):
+        start = time.perf_counter()
+        result = await scheduler.submit(21)
+        return result, time.perf_counter() - start
+
+    result, elapsed = run(_with_scheduler(recorder, body, max_batch_size=32, max_wait_ms=30))
+    assert result == 42
+    assert recorder.sizes == [1]
+    assert 0.02 <= elapsed < 1.0
+
+
+def test_full_batch_does_not_wait_for_the_timeout():
+    recorder = Recorder()
+
+    async def body(scheduler):
+        start = time.perf_counter()
+        await asyncio.gather(*(scheduler.submit(i) for i in range(4)))
+        return time.perf_counter() - start
+
+    elapsed = run(_with_scheduler(recorder, body, max_batch_size=4, max_wait_ms=5000))
+    assert recorder.sizes == [4]
+    assert elapsed < 1.0
+
+
+def test_submit_many_keeps_a_group_in_one_batch():
+    recorder = Recorder()
+
+    async def body(scheduler):
+        single = asyncio.ensure_future(scheduler.submit(1))
+        group = asyncio.ensure_future(scheduler.submit_many([2, 3, 4]))
+        return await single, await group
+
+    single, group = run(_with_scheduler(recorder, body, max_batch_size=3, max_wait_ms=20))
+    assert single == 2
+    assert group == [4, 6, 8]
+    # The group doesn't fit next to the single item, so it runs in its own batch
+    assert recorder.sizes == [1, 3]
+
+
+def test_batch_errors_reach_every_caller():
+    def fail(items):
+        raise ValueError("boom")
+
+    async def body(scheduler):
+        return await asyncio.gather(*(scheduler.submit(i) for i in range(3)), return_exceptions=True)
+
+    results = run(_with_scheduler(fail, body, max_batch_size=8, max_wait_ms=10))
+    assert all(isinstance(r, ValueError) for r in results)
+
+
+def test_submit_requires_a_running_scheduler():
+    scheduler = BatchScheduler(Recorder())
+    with pytest.raises(RuntimeError):
+        run(scheduler.submit(1))
+
+
+def test_stop_lets_the_in_flight_batch_finish():
+    def slow(items):
+        time.sleep(0.3)
+        return [item * 2 for item in items]
+
+    async def scenario():
+        scheduler = BatchScheduler(slow, max_batch_size=8, max_wait_ms=1)
+        scheduler.start()
+        running = asyncio.ensure_future(scheduler.submit(1))
+        await asyncio.sleep(0.05)  # Batch is now inside `slow`
+        queued = asyncio.ensure_future(scheduler.submit(2))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(scheduler.stop(), 2)
+        assert await asyncio.wait_for(running, 1) == 2
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(queued, 1)
+        assert not scheduler.running
+
+    run(scenario())
+
+
+def test_stop_timeout_fails_the_in_flight_batch():
+    def slow(items):
+        time.sleep(0.3)
+        return items
+
+    async def scenario():
+        scheduler = BatchScheduler(slow, max_batch_size=8, max_wait_ms=1)
+        scheduler.start()
+        running = asyncio.ensure_future(scheduler.submit(1))
+        await asyncio.sleep(0.05)
+        await scheduler.stop(timeout=0.01)
+        with pytest.raises(RuntimeError):
+            await asyncio.wait_for(running, 1)
+
+    run(scenario())
+
+
+def test_drain_runs_queued_items_before_stopping():
+    def slow(items):
+        time.sleep(0.2)
+        return [item * 2 for item in items]
+
+    async def scenario():
+        scheduler = BatchScheduler(slow, max_batch_size=8, max_wait_ms=1)
+        scheduler.start()
+        running = asyncio.ensure_future(scheduler.submit(1))
+        await asyncio.sleep(0.05)
+        queued = asyncio.ensure_future(scheduler.submit(2))
+        await asyncio.sleep(0)
+        await asyncio.wait_for(scheduler.stop(drain=True), 2)
+        assert await asyncio.wait_for(asyncio.gather(running, queued), 1) == [2, 4]
+        with pytest.raises(RuntimeError):
+            await scheduler.submit(3)
+        assert not scheduler.running
+
+    run(scenario())
@@ -0,0 +1,44 @@
+from collections import namedtuple
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from context import assemble_context, count_tokens  # noqa: E402
+
+Doc = namedtuple("Doc", "page_content metadata")
+
+
+def doc(text):
+    return Doc(text, {})
+
+
+def test_far_chunks_are_dropped():
+    context = assemble_context([(doc("close"), 0.2), (doc("far"), 1.9)], max_distance=1.5)
+    assert context.text == "close"
+    assert context.dropped["below_threshold"] == 1
+
+
+def test_near_duplicates_are_dropped_by_embedding():
+    results = [(doc("turmeric milk"), 0.1), (doc("turmeric milk again"), 0.2), (doc("ginger tea"), 0.3)]
+    vectors = [[1.0, 0.0], [0.99, 0.05], [0.0, 1.0]]
+    context = assemble_context(results, vectors, dedup_threshold=0.95)
+    assert context.text == "turmeric milk\nginger tea"
+    assert context.dropped["duplicate"] == 1
+
+
+def test_near_duplicates_are_dropped_by_shingles_without_vectors():
+    text = "boil ginger in water for ten minutes then add honey and drink warm"
+    context = assemble_context([(doc(text), 0.1), (doc(text + "."), 0.2)], dedup_threshold=0.9)
+    assert context.chunks == 1
+
+
+def test_token_budget_keeps_rank_order_and_truncates_an_oversized_first_chunk():
+    chunks = [doc("word " * 40), doc("word " * 40), doc("other " * 5)]
+    budget = count_tokens(chunks[0].page_content) + count_tokens(chunks[2].page_content) + 2
+    context = assemble_context([(c, 0.1) for c in chunks], dedup_threshold=1.1, token_budget=budget)
+    assert context.chunks == 2 and context.dropped["over_budget"] == 1
+    assert context.tokens <= budget
+
+    long = assemble_context([(doc("word " * 400), 0.1)], token_budget=20)
+    assert long.chunks == 1 and 0 < long.tokens <= 20
@@ -0,0 +1,75 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import model_server  # noqa: E402
+from preprocessing import PoolSaturated  # noqa: E402
+
+
+class FakeModels:
+    """Stands in for ModelService: doubles each batch, 'preprocesses' bytes into their length."""
+
+    def __init__(self):
+        self.in_flight_jobs = 0
+
+    def info(self):
+        return {"backend": "fake", "workers": 2, "max_pending": 4}
+
+    def predict(self, batch):
+        return batch * 2
+
+    def preprocess(self, source):
+        if source == b"full":
+            raise PoolSaturated("Preprocessing queue full (4/4)")
+        return np.full((2, 2, 3), len(source), dtype=np.float32), {"rembg": 0.01}
+
+    def in_flight(self):
+        return self.in_flight_jobs
+
+
+@pytest.fixture
+def models(monkeypatch):
+    # Forked, so the server process starts with the fake already in place of the loaded models
+    monkeypatch.setattr(model_server, "_models", FakeModels())
+    manager = model_server.ModelManager(authkey=b"test", ctx=multiprocessing.get_context("fork"))
+    manager.start()
+    monkeypatch.setenv(model_server.ADDRESS_ENV, manager.address)
+    monkeypatch.setenv(model_server.AUTHKEY_ENV, b"test".hex())
+    yield model_server.connect()
+    manager.shutdown()
+
+
+def test_connect_without_a_server(monkeypatch):
+    monkeypatch.delenv(model_server.ADDRESS_ENV, raising=False)
+    assert model_server.connect() is None
+
+
+def test_backend_forwards_batches(models):
+    backend = model_server.RemoteBackend(models)
+    assert backend.name == "fake via model server"
+    assert np.array_equal(backend.predict(np.ones((3, 2), dtype=np.float32)), np.full((3, 2), 2.0))
+
+
+def test_preprocess_pool_runs_jobs_on_the_server(models):
+    pool = model_server.RemotePreprocessPool(models)
+    assert (pool.workers, pool.max_pending, pool.in_flight) == (2, 4, 0)
+
+    async def scenario():
+        pool.start()
+        try:
+            tensors = await asyncio.gather(*(pool.run(b"x" * n) for n in (1, 2, 3)))
+            with pytest.raises(PoolSaturated):
+                await pool.run(b"full")
+            return tensors
+        finally:
+            pool.shutdown()
+
+    assert [float(t[0, 0, 0]) for t in asyncio.run(scenario())] == [1.0, 2.0, 3.0]
+
+
+def test_run_requires_start(models):
+    with pytest.raises(RuntimeError):
+        asyncio.run(model_server.RemotePreprocessPool(models).run(b"x"))
@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from prediction_cache import PredictionCache, content_key, perceptual_key  # noqa: E402
+
+
+def result(label):
+    return {"success": True, "predictions": [{"label": label, "score": 0.9}]}
+
+
+@pytest.fixture
+def model_path(tmp_path):
+    path = tmp_path / "model.keras"
+    path.write_bytes(b"weights")
+    return str(path)
+
+
+def test_lru_eviction_keeps_recently_used_entries(model_path):
+    cache = PredictionCache(model_path, max_entries=2)
+    cache.put("a", result("Neem"))
+    cache.put("b", result("Tulsi"))
+    assert cache.get("a") == result("Neem")  # a is now the most recent
+    cache.put("c", result("Mint"))
+    assert cache.get("b") is None
+    assert cache.get("a") == result("Neem")
+    assert cache.get("c") == result("Mint")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_byte_budget_evicts_oldest(model_path):
+    size = len('{"success": true, "predictions": [{"label": "Neem", "score": 0.9}]}')
+    cache = PredictionCache(model_path, max_entries=100, max_bytes=2 * size)
+    for key in "abc":
+        cache.put(key, result("Neem"))
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 2
+
+
+def test_entries_expire_after_ttl(model_path):
+    cache = PredictionCache(model_path, ttl_seconds=0.05)
+    cache.put("a", result("Neem"))
+    assert cache.get("a") is not None
+    time.sleep(0.1)
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_persisted_entries_survive_a_restart(model_path, tmp_path):
+    db = str(tmp_path / "cache.sqlite3")
+    PredictionCache(model_path, persist_path=db).put("a", result("Neem"))
+    restarted = PredictionCache(model_path, persist_path=db)
+    assert restarted.get("a") == result("Neem")
+    assert restarted.stats()["disk_hits"] == 1
+
+
+def test_model_change_clears_the_cache(model_path, tmp_path):
+    db = str(tmp_path / "cache.sqlite3")
+    cache = PredictionCache(model_path, persist_path=db)
+    cache.put("a", result("Neem"))
+    with open(model_path, "ab") as f:
+        f.write(b" retrained")
+    cache._checked_at -= 2  # Skip the once-a-second stat throttle
+    assert cache.get("a") is None
+    assert PredictionCache(model_path, persist_path=db).get("a") is None
+
+
+def test_other_variant_drops_persisted_rows(model_path, tmp_path):
+    db = str(tmp_path / "cache.sqlite3")
+    PredictionCache(model_path, persist_path=db, variant="full:u2net").put("a", result("Neem"))
+    assert PredictionCache(model_path, persist_path=db, variant="fast:u2net").get("a") is None
+
+
+def test_uncounted_miss_keeps_one_lookup_per_request(model_path):
+    cache = PredictionCache(model_path)
+    assert cache.get("sha256:x", count_miss=False) is None  # Content key, perceptual key still to try
+    assert cache.get("dhash:y") is None
+    assert cache.stats()["misses"] == 1
+
+
+def test_keys():
+    assert content_key(b"abc") == content_key(b"abc") != content_key(b"abd")
+    tensor = np.random.default_rng(0).uniform(0, 255, (224, 224, 3)).astype(np.float32)
+    assert perceptual_key(tensor) == perceptual_key(tensor + 0.5)  # Tiny change, same hash
+    assert perceptual_key(tensor).startswith("dhash:")
@@ -0,0 +1,159 @@
+"""RAGService round trips against stub_llm.py, the local stand-in for the Perplexity API."""
+import asyncio
+import json
+import socket
+import threading
+import time
+from collections import namedtuple
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("openai")
+uvicorn = pytest.importorskip("uvicorn")
+stub_llm = pytest.importorskip("stub_llm")  # Needs fastapi
+
+import rag_service  # noqa: E402
+from rag_service import KnowledgeBase, RAGService  # noqa: E402
+
+Doc = namedtuple("Doc", "page_content metadata")
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(stub_llm.app, log_level="warning"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    for _ in range(100):
+        if server.started:
+            break
+        time.sleep(0.05)
+    yield f"http://127.0.0.1:{sock.getsockname()[1]}"
+    server.should_exit = True
+    thread.join(5)
+    sock.close()
+
+
+class Embeddings:
+    def __init__(self):
+        self.queries = []
+
+    def embed_query(self, query):
+        self.queries.append(query)
+        return [1.0, 0.0]
+
+
+class Store:
+    """Chroma stand-in returning fixed (document, distance) pairs."""
+
+    def __init__(self, results):
+        self.results = results
+        self.vectors = []
+
+    def similarity_search_by_vector_with_relevance_scores(self, vector, k):
+        self.vectors.append(vector)
+        return self.results[:k]
+
+
+def requests_served():
+    return stub_llm.app.state.requests
+
+
+def make_service(stub_url, monkeypatch, results):
+    monkeypatch.setattr(rag_service, "LLM_BASE_URL", stub_url)
+    embeddings = Embeddings()
+    service = RAGService(api_key="stub", embeddings=embeddings, open_knowledge_base=False, top_k=3)
+    store = Store(results)
+    service.kb = KnowledgeBase(store, None, None, "test", 0.0)
+    return service, embeddings, store
+
+
+async def with_service(stub_url, monkeypatch, results, body):
+    service, embeddings, store = make_service(stub_url, monkeypatch, results)
+    try:
+        return await body(service), embeddings, store
+    finally:
+        await service.aclose()
+
+
+GINGER = [(Doc("Ginger tea with honey soothes a cough.", {}), 0.2)]
+
+
+def test_answer_round_trip(stub_url, monkeypatch):
+    before = requests_served()
+    answer, embeddings, _ = asyncio.run(with_service(
+        stub_url, monkeypatch, GINGER, lambda service: service.aanswer("dry cough")))
+    assert "Stub remedy for: dry cough" in answer
+    assert embeddings.queries == ["dry cough"]
+    assert requests_served() == before + 1
+
+
+def test_stream_events_round_trip(stub_url, monkeypatch):
+    async def collect(service):
+        return [event async for event in service.astream_events("dry cough")]
+
+    events, _, _ = asyncio.run(with_service(stub_url, monkeypatch, GINGER, collect))
+    kinds = [kind for kind, _ in events]
+    assert kinds[0] == "context" and events[0][1]["found"]
+    assert kinds[-1] == "done" and kinds.count("token") > 1
+    streamed = "".join(data["text"] for kind, data in events if kind == "token")
+    assert events[-1][1] == {"response": streamed, "generated": True}
+    assert "Stub remedy for: dry cough" in streamed
+
+
+def test_precomputed_vector_skips_embedding(stub_url, monkeypatch):
+    answer, embeddings, store = asyncio.run(with_service(
+        stub_url, monkeypatch, GINGER, lambda service: service.aanswer("dry cough", vector=[0.6, 0.8])))
+    assert answer
+    assert embeddings.queries == []
+    assert store.vectors == [[0.6, 0.8]]
+
+
+def test_no_relevant_context_skips_the_llm(stub_url, monkeypatch):
+    before = requests_served()
+    far = [(Doc("Unrelated chunk.", {}), 1.99)]
+    answer, _, _ = asyncio.run(with_service(
+        stub_url, monkeypatch, far, lambda service: service.aanswer("dry cough")))
+    assert answer is None
+    assert requests_served() == before
+
+
+def test_streaming_remedy_endpoint_caches_the_answer(stub_url, monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+
+    import main
+    from semantic_cache import SemanticAnswerCache
+
+    service, _, _ = make_service(stub_url, monkeypatch, GINGER)
+    cache = SemanticAnswerCache(service.embed_query, kb_path=str(tmp_path), aembed_fn=service.aembed_query)
+    monkeypatch.setattr(main, "rag", service)
+    monkeypatch.setattr(main, "answer_cache", cache)
+    # Startup would load the real models; shutdown still runs and closes the service
+    monkeypatch.setattr(main.app.router, "on_startup", [])
+    before = requests_served()
+    with TestClient(main.app) as client:  # One event loop for every request, as in the server
+        response = client.post("/api/remedy", json={"symptoms": "dry cough", "stream": True})
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = []
+        for block in response.text.strip().split("\n\n"):
+            event, data = block.split("\n")
+            events.append((event.removeprefix("event: "), json.loads(data.removeprefix("data: "))))
+        kinds = [kind for kind, _ in events]
+        assert kinds[0] == "context" and events[0][1]["found"]
+        assert kinds[-1] == "done" and set(kinds[1:-1]) == {"token"} and len(kinds) > 3
+        streamed = "".join(data["text"] for kind, data in events if kind == "token")
+        assert events[-1][1] == {"response": streamed}
+        assert "Stub remedy for: dry cough" in streamed
+
+        stats = client.get("/api/remedy/cache").json()
+        assert (stats["entries"], stats["misses"]) == (1, 1)
+
+        # The same question again comes from the cache, without another LLM call
+        again = client.post("/api/remedy?format=ndjson", json={"symptoms": "Dry cough!", "stream": True})
+        lines = [json.loads(line) for line in again.text.splitlines()]
+        assert [line["event"] for line in lines] == ["context", "token", "done"]
+        assert lines[0]["cached"] and lines[-1]["response"] == streamed
+        assert client.get("/api/remedy/cache").json()["exact_hits"] == 1
+        assert requests_served() == before + 1
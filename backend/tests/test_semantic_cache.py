@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from semantic_cache import SemanticAnswerCache, normalize_query  # noqa: E402
+
+VECTORS = {
+    "cough and cold": [1.0, 0.0, 0.0],
+    "cold and cough remedy": [0.96, 0.28, 0.0],  # cosine 0.96 with "cough and cold"
+    "headache": [0.0, 1.0, 0.0],
+    "stomach ache": [0.0, 0.0, 1.0],
+    "joint pain": [0.6, 0.0, 0.8],
+}
+
+
+class Embedder:
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, query):
+        self.calls += 1
+        return VECTORS[normalize_query(query)]
+
+
+@pytest.fixture
+def kb_path(tmp_path):
+    kb = tmp_path / "kb"
+    kb.mkdir()
+    (kb / "data.bin").write_bytes(b"v1")
+    return str(kb)
+
+
+def make_cache(kb_path, **kwargs):
+    embedder = Embedder()
+    return SemanticAnswerCache(embedder, kb_path, **kwargs), embedder
+
+
+def test_exact_semantic_and_miss(kb_path):
+    cache, embedder = make_cache(kb_path, threshold=0.9)
+    answer, kind, vector = cache.lookup("Cough and cold")
+    assert (answer, kind) == (None, None)
+    cache.store("Cough and cold", "ginger tea", vector)
+    assert embedder.calls == 1  # store reused the lookup's vector
+
+    assert cache.lookup("  cough, AND cold! ")[:2] == ("ginger tea", "exact")
+    assert cache.lookup("cold and cough remedy")[:2] == ("ginger tea", "semantic")
+    assert cache.lookup("headache")[:2] == (None, None)
+    stats = cache.stats()
+    assert (stats["exact_hits"], stats["semantic_hits"], stats["misses"]) == (1, 1, 2)
+
+
+def test_alookup_embeds_with_the_async_embedder(kb_path):
+    calls = []
+
+    async def aembed(query):
+        calls.append(query)
+        return VECTORS[normalize_query(query)]
+
+    cache, embedder = make_cache(kb_path, aembed_fn=aembed)
+    cache.store("cough and cold", "ginger tea")
+    assert asyncio.run(cache.alookup("cough and cold"))[:2] == ("ginger tea", "exact")
+    assert asyncio.run(cache.alookup("cold and cough remedy"))[:2] == ("ginger tea", "semantic")
+    assert calls == ["cold and cough remedy"] and embedder.calls == 1  # Only store used the sync embedder
+
+
+def test_lru_eviction(kb_path):
+    cache, _ = make_cache(kb_path, max_entries=2)
+    cache.store("cough and cold", "ginger tea")
+    cache.store("headache", "rest")
+    assert cache.lookup("cough and cold")[1] == "exact"  # Now the most recent
+    cache.store("stomach ache", "jeera water")
+    assert cache.lookup("headache")[1] is None
+    assert cache.lookup("cough and cold")[1] == "exact"
+    assert cache.stats()["entries"] == 2
+
+
+def test_entries_expire_after_ttl(kb_path):
+    cache, _ = make_cache(kb_path, ttl_seconds=0.05)
+    cache.store("cough and cold", "ginger tea")
+    time.sleep(0.1)
+    assert cache.lookup("cough and cold")[1] is None
+    assert cache.lookup("cold and cough remedy")[1] is None
+
+
+def test_persisted_answers_survive_a_restart(kb_path, tmp_path):
+    db = str(tmp_path / "answers.sqlite3")
+    cache, _ = make_cache(kb_path, persist_path=db)
+    cache.store("joint pain", "turmeric milk")
+    restarted, _ = make_cache(kb_path, persist_path=db)
+    assert restarted.lookup("joint pain")[:2] == ("turmeric milk", "exact")
+
+
+def test_knowledge_base_change_clears_answers(kb_path, tmp_path):
+    db = str(tmp_path / "answers.sqlite3")
+    cache, _ = make_cache(kb_path, persist_path=db)
+    cache.store("joint pain", "turmeric milk")
+    with open(f"{kb_path}/data.bin", "wb") as f:
+        f.write(b"v2, re-ingested")
+    cache._checked_at -= 10  # Skip the fingerprint throttle
+    assert cache.lookup("joint pain")[1] is None
+    assert make_cache(kb_path, persist_path=db)[0].stats()["entries"] == 0
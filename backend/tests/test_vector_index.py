@@ -0,0 +1,78 @@
+import asyncio
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from vector_index import BatchedRetriever, VectorIndex  # noqa: E402
+
+
+def make_index(space, n=200, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    embeddings = rng.normal(size=(n, dim)).astype(np.float32)
+    ids = [f"id{i}" for i in range(n)]
+    return VectorIndex(embeddings, ids, [f"doc {i}" for i in ids], [{"row": i} for i in range(n)], space), rng
+
+
+def brute_force(index, query, space):
+    if space == "l2":
+        distances = ((index.embeddings - query) ** 2).sum(axis=1)
+    elif space == "cosine":
+        unit = index.embeddings / np.linalg.norm(index.embeddings, axis=1, keepdims=True)
+        distances = 1 - unit @ (query / np.linalg.norm(query))
+    else:
+        distances = 1 - index.embeddings @ query
+    return distances
+
+
+@pytest.mark.parametrize("space", ["l2", "cosine", "ip"])
+def test_search_matches_brute_force(space):
+    index, rng = make_index(space)
+    for query in rng.normal(size=(5, 16)).astype(np.float32):
+        hits = index.search(query, 7)
+        expected = brute_force(index, query, space)
+        assert [hit.row for hit in hits] == list(np.argsort(expected, kind="stable")[:7])
+        assert np.allclose([hit.distance for hit in hits], np.sort(expected)[:7], atol=1e-3)
+        assert hits[0].id == f"id{hits[0].row}" and hits[0].page_content == f"doc id{hits[0].row}"
+
+
+def test_batch_search_equals_single_searches():
+    index, rng = make_index("l2")
+    queries = rng.normal(size=(4, 16)).astype(np.float32)
+    batch = index.search_batch(queries, 5)
+    assert [[h.row for h in hits] for hits in batch] == [[h.row for h in index.search(q, 5)] for q in queries]
+
+
+def test_k_larger_than_the_index_returns_everything():
+    index, rng = make_index("l2", n=3)
+    assert len(index.search(rng.normal(size=16), 10)) == 3
+
+
+def test_vectors_returns_stored_embeddings_of_hits():
+    index, rng = make_index("l2")
+    hits = index.search(rng.normal(size=16), 3)
+    assert np.array_equal(index.vectors(hits), index.embeddings[[h.row for h in hits]])
+
+
+def test_batched_retriever_embeds_only_what_it_must():
+    index, rng = make_index("l2")
+    queries = {f"q{i}": v for i, v in enumerate(rng.normal(size=(3, 16)).astype(np.float32))}
+    embedded = []
+
+    def embed_batch(texts):
+        embedded.append(list(texts))
+        return [queries[text] for text in texts]
+
+    async def run():
+        retriever = BatchedRetriever(embed_batch, index, max_wait_ms=50)
+        try:
+            return await asyncio.gather(retriever.search("q0", 3), retriever.embed("q1"),
+                                        retriever.search("q2", 2, vector=queries["q2"]))
+        finally:
+            await retriever.stop()
+
+    searched, vector, precomputed = asyncio.run(run())
+    assert embedded == [["q0", "q1"]]  # One model call, and none for the precomputed vector
+    assert [h.row for h in searched] == [h.row for h in index.search(queries["q0"], 3)]
+    assert np.array_equal(vector, queries["q1"])
+    assert [h.row for h in precomputed] == [h.row for h in index.search(queries["q2"], 2)]
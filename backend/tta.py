@@ -0,0 +1,53 @@
+"""Test-time augmentation for the plant classifier.
+
+Each mode is a list of views of the preprocessed 224x224x3 tensor (flips and centre
+zooms). All views of a photo go through the model in one batch and their class
+probabilities are averaged, trading latency for accuracy without a second model.
+"""
+import numpy as np
+from PIL import Image
+
+# (zoom, horizontal flip, vertical flip) per view; zoom is the fraction of the frame kept
+MODES = {
+    "fast": ((1.0, False, False),),
+    "balanced": ((1.0, False, False), (1.0, True, False), (0.875, False, False)),
+    "accurate": ((1.0, False, False), (1.0, True, False), (1.0, False, True),
+                 (0.875, False, False), (0.875, True, False), (0.75, False, False)),
+}
+
+
+def _zoom(tensor, zoom):
+    """Centre crop keeping `zoom` of each side, resized back to the tensor's size."""
+    height, width = tensor.shape[:2]
+    dx, dy = width * (1 - zoom) / 2, height * (1 - zoom) / 2
+    image = Image.fromarray(np.clip(tensor, 0, 255).astype(np.uint8))
+    resized = image.resize((width, height), Image.BILINEAR, box=(dx, dy, width - dx, height - dy))
+    return np.asarray(resized, dtype=np.float32)
+
+
+def augment(tensor, mode="fast"):
+    """The views for `mode` of one HxWx3 tensor, as a list of arrays."""
+    views = []
+    zoomed = {}
+    for zoom, hflip, vflip in MODES[mode]:
+        if zoom not in zoomed:
+            zoomed[zoom] = tensor if zoom == 1.0 else _zoom(tensor, zoom)
+        view = zoomed[zoom]
+        if hflip:
+            view = view[:, ::-1]
+        if vflip:
+            view = view[::-1]
+        views.append(view)
+    return views
+
+
+def fuse(probabilities):
+    """Average the per-view class probabilities into one row."""
+    return np.mean(np.asarray(probabilities, dtype=np.float32), axis=0)
+
+
+def top_k(probabilities, k=5):
+    """Indices of the `k` highest probabilities, best first (argpartition, then sort only those k)."""
+    k = min(k, len(probabilities))
+    candidates = np.argpartition(probabilities, -k)[-k:]
+    return candidates[np.argsort(probabilities[candidates])[::-1]]
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+Exact in-memory nearest-neighbour search over the Chroma knowledge base.
+
+The collection's embeddings are exported once to a float32 .npy file (memory-mapped on
+load) plus a JSON list of documents, and re-exported whenever the Chroma directory
+changes. Queries are answered with one matrix product, using the same distance as the
+collection (squared L2 by default), so results line up with `similarity_search_with_score`.
+
+Export ahead of time (otherwise the server does it on first start):
+  python vector_index.py --persist-dir ./chroma_db_nccn --cache-dir ./vector_index_cache
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from batching import BatchScheduler
+from metrics import time_stage
+
+Hit = namedtuple("Hit", "page_content metadata id distance row")
+
+EXPORT_PAGE_SIZE = 5000
+
+
+def _chroma_write_counter(persist_dir):
+    """Per-segment last applied write sequence numbers and the row count from chroma.sqlite3, or None.
+
+    Merely opening a Chroma store rewrites chroma.sqlite3 and the HNSW segment files, so their
+    mtimes change on every start; these sequence numbers only move when data is written.
+    """
+    path = os.path.join(persist_dir, "chroma.sqlite3")
+    if not os.path.isfile(path):
+        return None
+    try:
+        db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            seq_ids = db.execute("SELECT segment_id, seq_id FROM max_seq_id ORDER BY segment_id").fetchall()
+            count = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        finally:
+            db.close()
+    except sqlite3.Error:
+        return None
+    return f"{seq_ids}:{count}"
+
+
+def knowledge_base_fingerprint(persist_dir) -> str:
+    """Hash identifying the contents of the Chroma persist directory.
+
+    Uses Chroma's write sequence numbers when the store can be read, otherwise the names,
+    sizes and mtimes of every file in the directory.
+    """
+    digest = hashlib.sha256()
+    counter = _chroma_write_counter(persist_dir)
+    if counter is not None:
+        digest.update(counter.encode())
+        return digest.hexdigest()[:16]
+    for root, dirs, files in os.walk(persist_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if name.endswith((".py", ".pyc")) or name == ".DS_Store":
+                continue
+            path = os.path.join(root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            digest.update(f"{os.path.relpath(path, persist_dir)}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return digest.hexdigest()[:16]
+
+
+def _collection_space(collection):
+    return ((collection.metadata or {}).get("hnsw:space") or "l2").lower()
+
+
+def export_collection(collection, cache_dir, fingerprint):
+    """Write every embedding, document and metadata in a chromadb collection to `cache_dir`."""
+    os.makedirs(cache_dir, exist_ok=True)
+    ids, documents, metadatas, embeddings = [], [], [], []
+    offset = 0
+    while True:
+        page = collection.get(include=["embeddings", "documents", "metadatas"], limit=EXPORT_PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            break
+        ids += page["ids"]
+        documents += page["documents"]
+        metadatas += [m or {} for m in page["metadatas"]]
+        embeddings.append(np.asarray(page["embeddings"], dtype=np.float32))
+        offset += len(page["ids"])
+    if not ids:
+        raise ValueError("collection is empty")
+
+    matrix = np.ascontiguousarray(np.concatenate(embeddings))
+    # Write to temp names first so a crashed export never leaves a half-written cache behind
+    np.save(os.path.join(cache_dir, "embeddings.tmp.npy"), matrix)
+    with open(os.path.join(cache_dir, "documents.tmp.json"), "w") as f:
+        json.dump({"ids": ids, "documents": documents, "metadatas": metadatas}, f)
+    os.replace(os.path.join(cache_dir, "embeddings.tmp.npy"), os.path.join(cache_dir, "embeddings.npy"))
+    os.replace(os.path.join(cache_dir, "documents.tmp.json"), os.path.join(cache_dir, "documents.json"))
+    with open(os.path.join(cache_dir, "manifest.json"), "w") as f:
+        json.dump({"fingerprint": fingerprint, "count": len(ids), "dim": int(matrix.shape[1]),
+                   "space": _collection_space(collection), "collection": collection.name}, f)
+    return len(ids)
+
+
+class VectorIndex:
+    """Exact top-k search over a contiguous (N, D) float32 embedding matrix.
+
+    Distances follow the collection's `hnsw:space`: squared L2 (Chroma's default),
+    `1 - cosine` or `1 - dot`. Chroma's HNSW search is approximate, so on large
+    collections this can occasionally return a closer neighbour than Chroma does.
+    """
+
+    def __init__(self, embeddings, ids, documents, metadatas, space="l2"):
+        if space not in ("l2", "cosine", "ip"):
+            raise ValueError(f"unsupported distance space: {space}")
+        self.embeddings = embeddings
+        self.ids = ids
+        self.documents = documents
+        self.metadatas = metadatas
+        self.space = space
+        if space == "cosine":
+            norms = np.linalg.norm(embeddings, axis=1)
+            self._matrix = embeddings / np.where(norms == 0, 1, norms)[:, None]
+        else:
+            self._matrix = embeddings
+        self._sq_norms = np.einsum("ij,ij->i", embeddings, embeddings) if space == "l2" else None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @classmethod
+    def load(cls, cache_dir, fingerprint=None):
+        """Memory-map an export; returns None when it's missing or was made from a different knowledge base."""
+        try:
+            with open(os.path.join(cache_dir, "manifest.json")) as f:
+                manifest = json.load(f)
+            if fingerprint is not None and manifest["fingerprint"] != fingerprint:
+                return None
+            embeddings = np.load(os.path.join(cache_dir, "embeddings.npy"), mmap_mode="r")
+            with open(os.path.join(cache_dir, "documents.json")) as f:
+                docs = json.load(f)
+        except (OSError, ValueError, KeyError):
+            return None
+        if len(embeddings) != manifest["count"]:
+            return None
+        return cls(embeddings, docs["ids"], docs["documents"], docs["metadatas"], manifest.get("space", "l2"))
+
+    @classmethod
+    def from_collection(cls, collection, persist_dir, cache_dir):
+        """Load the cached export for `persist_dir`, exporting `collection` first if it's stale or missing."""
+        fingerprint = knowledge_base_fingerprint(persist_dir)
+        index = cls.load(cache_dir, fingerprint)
+        if index is None:
+            start = time.perf_counter()
+            count = export_collection(collection, cache_dir, fingerprint)
+            print(f"✅ Exported {count} embeddings to {cache_dir} in {time.perf_counter() - start:.1f}s")
+            index = cls.load(cache_dir, fingerprint)
+        return index
+
+    def distances(self, queries):
+        """(B, N) distances from each query row to every stored embedding."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        if self.space == "cosine":
+            norms = np.linalg.norm(queries, axis=1, keepdims=True)
+            queries = queries / np.where(norms == 0, 1, norms)
+        dots = queries @ self._matrix.T
+        if self.space == "l2":
+            # |x - q|^2 = |x|^2 - 2 x.q + |q|^2
+            sq = np.einsum("ij,ij->i", queries, queries)[:, None]
+            return np.maximum(self._sq_norms[None, :] - 2 * dots + sq, 0)
+        return 1 - dots
+
+    def search_batch(self, queries, k):
+        """Top-k `Hit`s (closest first) for each query vector."""
+        k = min(k, len(self))
+        if k <= 0:
+            return [[] for _ in np.atleast_2d(queries)]
+        dist = self.distances(queries)
+        if k < dist.shape[1]:
+            top = np.argpartition(dist, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(dist.shape[1]), dist.shape)
+        results = []
+        for row, candidates in zip(dist, top):
+            # Sort by distance, ties by position so the order is deterministic
+            order = candidates[np.lexsort((candidates, row[candidates]))]
+            results.append([Hit(self.documents[i], self.metadatas[i], self.ids[i], float(row[i]), int(i)) for i in order])
+        return results
+
+    def search(self, query, k):
+        return self.search_batch([query], k)[0]
+
+    def vectors(self, hits):
+        """Stored embeddings of `hits`, e.g. for near-duplicate checks during context assembly."""
+        return np.asarray(self.embeddings[[hit.row for hit in hits]])
+
+
+class BatchedRetriever:
+    """Embeds concurrent queries in one model call and searches them in one matrix product.
+
+    `embed_batch(texts)` must return one vector per text (e.g. `embed_documents`).
+    Requests may carry a precomputed query vector (skipping the embedding) or ask
+    for the vector only (`embed`), so every query embedding shares the batches.
+    """
+
+    def __init__(self, embed_batch, index, max_batch_size=32, max_wait_ms=2.0):
+        self.embed_batch = embed_batch
+        self.index = index
+        self.scheduler = BatchScheduler(self._run_batch, max_batch_size=max_batch_size,
+                                        max_wait_ms=max_wait_ms, name="rag-retrieval")
+
+    def _run_batch(self, requests):
+        vectors = [vector for _, _, vector in requests]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            with time_stage("embedding"):
+                embedded = self.embed_batch([requests[i][0] for i in missing])
+            for i, vector in zip(missing, embedded):
+                vectors[i] = vector
+        vectors = [np.asarray(vector, dtype=np.float32) for vector in vectors]
+
+        results = list(vectors)  # k == 0: the caller only wanted the embedding
+        wanted = [i for i, (_, k, _) in enumerate(requests) if k > 0]
+        if wanted:
+            with time_stage("similarity_search"):
+                hits = self.index.search_batch(np.stack([vectors[i] for i in wanted]),
+                                               max(requests[i][1] for i in wanted))
+            for i, found in zip(wanted, hits):
+                results[i] = found[:requests[i][1]]
+        return results
+
+    async def _submit(self, request):
+        if not self.scheduler.running:
+            self.scheduler.start()
+        return await self.scheduler.submit(request)
+
+    async def embed(self, query):
+        return await self._submit((query, 0, None))
+
+    async def search(self, query, k, vector=None):
+        return await self._submit((query, k, vector))
+
+    async def stop(self, timeout=None, drain=False):
+        await self.scheduler.stop(timeout, drain)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--persist-dir", default="./chroma_db_nccn")
+    parser.add_argument("--cache-dir", default=os.getenv("VECTOR_INDEX_CACHE", "./vector_index_cache"))
+    parser.add_argument("--collection", default="langchain", help="Collection name (langchain's default)")
+    args = parser.parse_args()
+
+    try:
+        import chromadb
+    except ImportError:
+        print("Error: chromadb is not installed. Install with: pip install chromadb")
+        sys.exit(1)
+    collection = chromadb.PersistentClient(path=args.persist_dir).get_collection(args.collection)
+    index = VectorIndex.from_collection(collection, args.persist_dir, args.cache_dir)
+    print(f"✓ {len(index)} embeddings of dimension {index.embeddings.shape[1]} ({index.space}) in {args.cache_dir}")
+
+
+if __name__ == "__main__":
+    main()
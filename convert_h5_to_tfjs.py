@@ -5,6 +5,8 @@ Usage:
   python convert_h5_to_tfjs.py <input_h5_path> [output_dir]
 Example:
   python convert_h5_to_tfjs.py simple_mobilenet_classifier.h5 public/models/simple_mobilenet_classifier
+
+For quantized, sharded and verified exports use export_tfjs.py instead.
 """
 
 import sys
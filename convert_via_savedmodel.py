@@ -2,9 +2,15 @@
 """
 Convert H5 to SavedModel first, then to TFJS.
 This is more stable for complex models.
+Usage:
+  python convert_via_savedmodel.py [input_h5_path] [output_dir]
+
+export_tfjs.py does the same with quantization, sharding and verification
+(python export_tfjs.py model.h5 --format graph).
 """
 
 import os
+import sys
 import tempfile
 import shutil
 
@@ -57,7 +63,7 @@ def convert_h5_to_tfjs_via_savedmodel(h5_path, output_dir):
         print("ERROR: model.json not created!")
 
 if __name__ == '__main__':
-    h5_path = '/Users/suyogkulkarni/Desktop/Swasth-AI/simple_mobilenet_classifier.h5'
-    output_dir = '/Users/suyogkulkarni/Desktop/Swasth-AI/public/models/simple_mobilenet_classifier'
+    h5_path = sys.argv[1] if len(sys.argv) > 1 else 'simple_mobilenet_classifier.h5'
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else 'public/models/simple_mobilenet_classifier'
     
     convert_h5_to_tfjs_via_savedmodel(h5_path, output_dir)
@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Export a Keras model for the browser: convert to TensorFlow.js, fix the InputLayer,
+quantize and shard the weights, then check the result against the Keras model.
+Usage:
+  python export_tfjs.py <input_model> [-o output_dir] [--quantize none|float16|uint8]
+                        [--shard-size-mb 1] [--format layers|graph] [--images DIR]
+Examples:
+  python export_tfjs.py simple_mobilenet_classifier.h5 --quantize float16
+  python export_tfjs.py simple_mobilenet_classifier.h5 --quantize uint8 --images samples/ --min-agreement 0.97
+
+The export is written to a temporary folder next to output_dir. A reference batch
+(--images, cropped and letterboxed like backend /api/identify uploads, or random
+pixels) is run through the Keras model and through the converted model, and the old
+export is only replaced when their top-1 predictions agree at least --min-agreement
+of the time. The converted model is run by @tensorflow/tfjs under node
+when it is installed (npm install), so the reported parse time is the browser runtime's;
+otherwise by the tensorflowjs Python loader (Layers format only).
+Finally the download size (raw and gzipped) and the parse time are reported.
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from fix_model_json import fix_input_layer
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".webp")
+
+# Loads model.json + shards through tf.io.fromMemory (no tfjs-node needed), runs the
+# reference batch and writes the outputs as raw float32
+NODE_VERIFY_SCRIPT = r"""
+const fs = require('fs');
+const path = require('path');
+const tf = require('@tensorflow/tfjs');
+const [dir, inputPath, outputPath, shape] = process.argv.slice(1);
+(async () => {
+  const start = performance.now();
+  const model = JSON.parse(fs.readFileSync(path.join(dir, 'model.json'), 'utf8'));
+  const weightSpecs = [];
+  const buffers = [];
+  for (const group of model.weightsManifest) {
+    weightSpecs.push(...group.weights);
+    for (const p of group.paths) buffers.push(fs.readFileSync(path.join(dir, p)));
+  }
+  const data = Buffer.concat(buffers);
+  const artifacts = {
+    modelTopology: model.modelTopology, format: model.format, generatedBy: model.generatedBy,
+    convertedBy: model.convertedBy, signature: model.signature, weightSpecs,
+    weightData: data.buffer.slice(data.byteOffset, data.byteOffset + data.byteLength),
+  };
+  const handler = tf.io.fromMemory(artifacts);
+  const net = model.format === 'graph-model' ? await tf.loadGraphModel(handler) : await tf.loadLayersModel(handler);
+  const parseMs = performance.now() - start;
+  const raw = fs.readFileSync(inputPath);
+  const input = tf.tensor(new Float32Array(raw.buffer.slice(raw.byteOffset, raw.byteOffset + raw.byteLength)), JSON.parse(shape));
+  const predictStart = performance.now();
+  const values = await net.predict(input).data();
+  const predictMs = performance.now() - predictStart;
+  fs.writeFileSync(outputPath, Buffer.from(new Float32Array(values).buffer));
+  console.log(JSON.stringify({runtime: 'tfjs-' + tf.getBackend(), parse_ms: parseMs, predict_ms: predictMs}));
+})().catch((e) => { console.error(e.message); process.exit(1); });
+"""
+
+
+def quantization_map(quantize):
+    return None if quantize == "none" else {quantize: True}
+
+
+def convert(model, output_dir, fmt, quantize, shard_bytes):
+    """Write model.json + weight shards for `model` into `output_dir`."""
+    import tensorflowjs as tfjs
+
+    if fmt == "layers":
+        tfjs.converters.save_keras_model(model, output_dir, quantization_dtype_map=quantization_map(quantize),
+                                         weight_shard_size_bytes=shard_bytes)
+        fix_input_layer(os.path.join(output_dir, "model.json"))
+        return
+
+    import tensorflow as tf
+    with tempfile.TemporaryDirectory() as tmpdir:
+        saved_model_path = os.path.join(tmpdir, "saved_model")
+        try:
+            model.export(saved_model_path)  # Keras 3
+        except AttributeError:
+            tf.saved_model.save(model, saved_model_path)
+        tfjs.converters.convert_tf_saved_model(saved_model_path, output_dir,
+                                               quantization_dtype_map=quantization_map(quantize),
+                                               weight_shard_size_bytes=shard_bytes)
+
+
+def _backend_preprocessing():
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+    import preprocessing
+    return preprocessing
+
+
+def prepare_photos(paths, width, height):
+    """Photos as /api/identify feeds them to the model: background removed, cropped to the leaf, letterboxed.
+
+    Without rembg (or for a non-224 input) only the letterbox is applied, which is still
+    closer to the served inputs than a plain resize.
+    """
+    preprocessing = _backend_preprocessing()
+    if (width, height) == preprocessing.TARGET_SIZE:
+        try:
+            import rembg  # noqa: F401
+            return np.stack([preprocessing.preprocess(p) for p in paths])
+        except ImportError:
+            pass
+    print("⚠️ rembg unavailable (or non-224 input): verifying on letterboxed photos without background removal")
+    return np.stack([np.asarray(preprocessing.resize_with_padding(preprocessing.open_image(p).convert("RGB"),
+                                                                  (width, height)), dtype=np.float32)
+                     for p in paths])
+
+
+def reference_batch(input_shape, images=None, samples=32, input_scale=255.0):
+    """Float32 batch in the model's input layout: photos from `images` through the backend's
+    crop/letterbox preprocessing, or random pixels."""
+    height, width, channels = input_shape[1] or 224, input_shape[2] or 224, input_shape[3] or 3
+    paths = []
+    if images:
+        paths = sorted(p for p in glob.glob(os.path.join(images, "*")) if p.lower().endswith(IMAGE_EXTENSIONS))[:samples]
+    if paths:
+        batch = prepare_photos(paths, width, height)
+    else:
+        print("⚠️ No --images given (or none found): verifying on random pixels, which understates agreement")
+        batch = np.random.default_rng(0).uniform(0, 255, (samples, height, width, channels)).astype(np.float32)
+    return batch / input_scale
+
+
+def _node_tfjs_available():
+    if shutil.which("node") is None:
+        return False
+    probe = subprocess.run(["node", "-e", "require.resolve('@tensorflow/tfjs')"], capture_output=True,
+                           cwd=os.path.dirname(os.path.abspath(__file__)))
+    return probe.returncode == 0
+
+
+def run_converted(export_dir, batch):
+    """Outputs of the exported model on `batch`, plus how long loading / predicting took."""
+    if _node_tfjs_available():
+        with tempfile.TemporaryDirectory() as tmpdir:
+            input_path = os.path.join(tmpdir, "input.bin")
+            output_path = os.path.join(tmpdir, "output.bin")
+            batch.astype(np.float32).tofile(input_path)
+            result = subprocess.run(["node", "-e", NODE_VERIFY_SCRIPT, os.path.abspath(export_dir), input_path,
+                                     output_path, json.dumps(list(batch.shape))],
+                                    capture_output=True, text=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            if result.returncode:
+                raise RuntimeError(f"tfjs failed to load or run the export: {result.stderr.strip()}")
+            timings = json.loads(result.stdout.strip().splitlines()[-1])
+            outputs = np.fromfile(output_path, dtype=np.float32).reshape(len(batch), -1)
+        return outputs, timings
+
+    with open(os.path.join(export_dir, "model.json")) as f:
+        if json.load(f).get("format") == "graph-model":
+            raise RuntimeError("verifying a graph model needs node and @tensorflow/tfjs (run npm install)")
+    import tensorflowjs as tfjs
+    start = time.perf_counter()
+    converted = tfjs.converters.load_keras_model(os.path.join(export_dir, "model.json"))
+    parse_ms = (time.perf_counter() - start) * 1000
+    start = time.perf_counter()
+    outputs = np.asarray(converted.predict(batch, verbose=0)).reshape(len(batch), -1)
+    return outputs, {"runtime": "tensorflowjs-python", "parse_ms": parse_ms,
+                     "predict_ms": (time.perf_counter() - start) * 1000}
+
+
+def download_size(export_dir):
+    """(raw bytes, gzipped bytes, shard count) of model.json and every weight shard it references."""
+    with open(os.path.join(export_dir, "model.json")) as f:
+        manifest = json.load(f)["weightsManifest"]
+    files = ["model.json"] + [p for group in manifest for p in group["paths"]]
+    raw = zipped = 0
+    for name in files:
+        with open(os.path.join(export_dir, name), "rb") as f:
+            data = f.read()
+        raw += len(data)
+        zipped += len(gzip.compress(data, 6))
+    return raw, zipped, len(files) - 1
+
+
+def install(export_dir, output_dir):
+    """Replace the previous model.json and shards in `output_dir`, keeping other files (labels.json)."""
+    os.makedirs(output_dir, exist_ok=True)
+    for old in glob.glob(os.path.join(output_dir, "group*-shard*of*.bin")) + [os.path.join(output_dir, "model.json")]:
+        if os.path.exists(old):
+            os.remove(old)
+    for name in os.listdir(export_dir):
+        shutil.move(os.path.join(export_dir, name), os.path.join(output_dir, name))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input_model", help="Keras model (.h5 or .keras)")
+    parser.add_argument("-o", "--output-dir", default="public/models/simple_mobilenet_classifier")
+    parser.add_argument("--format", choices=("layers", "graph"), default="layers",
+                        help="TFJS Layers model (tf.loadLayersModel) or graph model via SavedModel")
+    parser.add_argument("--quantize", choices=("none", "float16", "uint8"), default="float16",
+                        help="Weight quantization: float16 halves the download, uint8 quarters it")
+    parser.add_argument("--shard-size-mb", type=float, default=1.0, help="Maximum size of each weight shard")
+    parser.add_argument("--images", help="Folder of sample photos for the verification batch")
+    parser.add_argument("--samples", type=int, default=32, help="Size of the verification batch")
+    parser.add_argument("--input-scale", type=float, default=255.0,
+                        help="The 0-255 pixels are divided by this before inference; use 1 for models that "
+                             "take raw pixels, as the backend's EfficientNet does")
+    parser.add_argument("--min-agreement", type=float, default=0.98,
+                        help="Minimum top-1 agreement with the Keras model to install the export")
+    parser.add_argument("--no-verify", action="store_true", help="Skip the Keras vs TFJS comparison")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.input_model):
+        print(f"Error: File '{args.input_model}' not found.")
+        sys.exit(1)
+
+    try:
+        import tensorflow as tf
+        import tensorflowjs  # noqa: F401
+    except ImportError:
+        print("Error: TensorFlow and tensorflowjs are required.")
+        print("Install with:")
+        print("  pip install tensorflow tensorflowjs")
+        sys.exit(1)
+
+    model = tf.keras.models.load_model(args.input_model, compile=False)
+    print(f"Model loaded. Input shape: {model.input_shape}")
+
+    parent = os.path.dirname(os.path.abspath(args.output_dir))
+    os.makedirs(parent, exist_ok=True)
+    export_dir = tempfile.mkdtemp(prefix=".tfjs-export-", dir=parent)
+    try:
+        start = time.perf_counter()
+        convert(model, export_dir, args.format, args.quantize, int(args.shard_size_mb * 1024 * 1024))
+        print(f"✓ Converted ({args.format}, {args.quantize} weights) in {time.perf_counter() - start:.1f}s")
+
+        report = {"format": args.format, "quantize": args.quantize, "shard_size_mb": args.shard_size_mb}
+        raw, zipped, shards = download_size(export_dir)
+        report.update({"download_bytes": raw, "download_gzip_bytes": zipped, "shards": shards})
+        try:
+            report["previous_download_bytes"] = download_size(args.output_dir)[0]
+        except (OSError, KeyError, ValueError):
+            pass  # No previous export, or an incomplete one
+
+        if not args.no_verify:
+            batch = reference_batch(model.input_shape, args.images, args.samples, args.input_scale)
+            expected = np.asarray(model.predict(batch, verbose=0)).reshape(len(batch), -1)
+            actual, timings = run_converted(export_dir, batch)
+            agreement = float((expected.argmax(axis=1) == actual.argmax(axis=1)).mean())
+            report.update(timings)
+            report.update({"samples": len(batch), "top1_agreement": agreement,
+                           "max_abs_diff": float(np.abs(expected - actual).max())})
+            if agreement < args.min_agreement:
+                print(json.dumps(report, indent=2))
+                print(f"Error: top-1 agreement {agreement:.3f} is below --min-agreement {args.min_agreement}; "
+                      f"keeping the existing export in {args.output_dir}")
+                sys.exit(1)
+
+        install(export_dir, args.output_dir)
+        print(f"✓ Export written to {args.output_dir}")
+        print(json.dumps(report, indent=2))
+    finally:
+        shutil.rmtree(export_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
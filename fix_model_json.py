@@ -1,43 +1,65 @@
 #!/usr/bin/env python3
 """
 Fix InputLayer configuration in TFJS model.json if batchInputShape is missing.
+Usage:
+  python fix_model_json.py [model_json_path]
+Example:
+  python fix_model_json.py public/models/simple_mobilenet_classifier/model.json
 """
 
 import json
 import sys
 
+DEFAULT_MODEL_JSON = "public/models/simple_mobilenet_classifier/model.json"
+
+
+def _topology_layers(topo):
+    # Layers-format model.json nests them under model_config (newer converters) or config
+    for config in (topo.get('model_config', {}).get('config', {}), topo.get('config', {}), topo):
+        if isinstance(config, dict) and 'layers' in config:
+            return config['layers']
+    return []
+
+
 def fix_input_layer(model_json_path):
+    """Add batchInputShape to InputLayers that lack it. Returns True if the file was changed."""
     with open(model_json_path, 'r') as f:
         model = json.load(f)
-    
+
     topo = model.get('modelTopology', {})
-    layers = topo.get('layers', [])
-    
+    layers = _topology_layers(topo)
+
     fixed = False
     for layer in layers:
         if layer.get('class_name') == 'InputLayer':
             config = layer.get('config', {})
-            # If batchInputShape is missing but inputShape exists, add it
-            if 'batchInputShape' not in config and 'inputShape' in config:
-                input_shape = config['inputShape']
+            if 'batchInputShape' in config or 'batch_input_shape' in config:
+                continue
+            if 'batch_shape' in config:
+                # Keras 3 writes batch_shape, which TFJS doesn't understand
+                config['batch_input_shape'] = config.pop('batch_shape')
+                fixed = True
+                print(f"✓ Fixed InputLayer: renamed batch_shape to batch_input_shape = {config['batch_input_shape']}")
+            elif 'inputShape' in config or 'input_shape' in config:
+                input_shape = config.get('inputShape', config.get('input_shape'))
                 # batchInputShape is [batch_size, ...inputShape]
                 config['batchInputShape'] = [None] + (input_shape if isinstance(input_shape, list) else [input_shape])
                 fixed = True
                 print(f"✓ Fixed InputLayer: added batchInputShape = {config['batchInputShape']}")
-            elif 'batchInputShape' not in config and 'batchInputShape' not in config:
+            else:
                 # If neither exists, add a default based on model info
                 # Assuming 224x224x3 for image input
                 config['batchInputShape'] = [None, 224, 224, 3]
                 fixed = True
                 print(f"✓ Fixed InputLayer: added default batchInputShape")
-    
+
     if fixed:
         with open(model_json_path, 'w') as f:
             json.dump(model, f)
         print(f"✓ Model JSON updated: {model_json_path}")
     else:
         print("✓ InputLayer configuration looks correct, no changes needed")
+    return fixed
 
 if __name__ == '__main__':
-    model_json_path = '/Users/suyogkulkarni/Desktop/Swasth-AI/public/models/simple_mobilenet_classifier/model.json'
-    fix_input_layer(model_json_path)
+    fix_input_layer(sys.argv[1] if len(sys.argv) > 1 else DEFAULT_MODEL_JSON)